@@ -1,6 +1,9 @@
+import os
+
 import numpy as np
 import gym
 
+from roboverse.utils.dataset import load_goal_set
 from eval_scripts.utils.io import load_local_or_remote_file
 from eval_scripts.distribution import DictDistribution
 
@@ -13,7 +16,13 @@ class PresampledPathDistribution(DictDistribution):
             # Set to true if you plan to re-encode presampled images
             initialize_encodings=True,
     ):
-        self._presampled_goals = load_local_or_remote_file(datapath)
+        # A directory written by roboverse.utils.save_goal_set is memory-mapped
+        # and its uint8 images are converted to float only when sampled
+        if os.path.isdir(datapath):
+            self._presampled_goals, self._goal_scales = load_goal_set(datapath)
+        else:
+            self._presampled_goals = load_local_or_remote_file(datapath)
+            self._goal_scales = {}
         self.representation_size = representation_size
         self._num_presampled_goals = self._presampled_goals[list(
             self._presampled_goals)[0]].shape[0]
@@ -29,6 +38,8 @@ class PresampledPathDistribution(DictDistribution):
         sampled_goals = {
             k: v[idx] for k, v in self._presampled_goals.items()
         }
+        for k, scale in self._goal_scales.items():
+            sampled_goals[k] = sampled_goals[k] / scale
         return sampled_goals
 
     def _set_spaces(self):
@@ -52,6 +52,8 @@ def main(args):
         presampled_goal_dir,
         'td_pnp_push_scripted_goals_timeoutk{}_seed{}.pkl'.format(
             args.goal_timeoutk, args.eval_seed))
+    if args.goal_format == 'npy':
+        presampled_goals_path = os.path.splitext(presampled_goals_path)[0]
 
     raw_env = rv.make(
         "SawyerRigAffordances-v6",
@@ -62,6 +64,7 @@ def main(args):
         test_env=True,
         test_env_command=drawer_pnp_push_commands[args.eval_seed],
         downsample=True,
+        settled_scene_cache_dir=args.settled_scene_cache_dir,
     )
     state_env = ClipAction(raw_env)
     renderer = EnvRenderer(
@@ -173,6 +176,8 @@ if __name__ == "__main__":
     parser.add_argument('--goal_timeoutk', type=str, default=-1)
     parser.add_argument('--env_obs_img_dim', type=int, default=196)
     parser.add_argument('--obs_img_dim', type=int, default=48)
+    parser.add_argument('--settled_scene_cache_dir', type=str, default=None)
+    parser.add_argument('--goal_format', type=str, default='pkl', choices=['pkl', 'npy'])
 
     args = parser.parse_args()
     main(args)
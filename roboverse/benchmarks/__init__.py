@@ -0,0 +1,2 @@
+from .suite import DEFAULT_ENVS, run_env_benchmarks
+from .baseline import compare_results, format_results, load_results, make_results, save_results
@@ -0,0 +1,70 @@
+'''
+    python -m roboverse.benchmarks --output results.json
+    python -m roboverse.benchmarks --baseline results.json --tolerance 0.2
+
+    Exits with status 1 if a metric is more than `tolerance` (relative) worse
+    than in the baseline. Baselines are only meaningful on the same machine;
+    the machine info is stored with the results to check this.
+'''
+import argparse
+import sys
+
+from roboverse.benchmarks.suite import DEFAULT_ENVS, run_env_benchmarks
+from roboverse.benchmarks.baseline import (
+    compare_results,
+    format_results,
+    load_results,
+    make_results,
+    save_results,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", type=str, nargs='+', default=DEFAULT_ENVS)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    ## per-metric overrides, e.g. --metric_tolerance step_render_per_s=0.3
+    parser.add_argument("--metric_tolerance", type=str, nargs='*', default=[])
+    parser.add_argument("--min_latency_delta", type=float, default=0.005)
+    parser.add_argument("--num_constructions", type=int, default=3)
+    parser.add_argument("--num_resets", type=int, default=10)
+    parser.add_argument("--num_steps", type=int, default=200)
+    parser.add_argument("--num_paths", type=int, default=100)
+    parser.add_argument("--path_length", type=int, default=75)
+    parser.add_argument("--num_trajectories", type=int, default=20)
+    parser.add_argument("--num_metric_rows", type=int, default=10000)
+    parser.add_argument("--num_layouts", type=int, default=10)
+    parser.add_argument("--num_expert_rollouts", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items()
+              if key not in ['envs', 'output', 'baseline', 'tolerance', 'metric_tolerance', 'min_latency_delta']}
+    env_results = {}
+    for env_name in args.envs:
+        env_results[env_name] = run_env_benchmarks(env_name, **config)
+    results = make_results(env_results, config)
+
+    if args.output:
+        save_results(args.output, results)
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    print(format_results(results, baseline))
+    if baseline is None:
+        return 0
+
+    if baseline.get('config') != config:
+        print('Warning: benchmark config differs from the baseline config {}'.format(baseline.get('config')))
+    tolerances = {metric: float(value) for metric, value in
+                  (item.split('=') for item in args.metric_tolerance)}
+    regressions = compare_results(results, baseline, args.tolerance, tolerances, args.min_latency_delta)
+    for env_name, metric, value, baseline_value, change in regressions:
+        print('REGRESSION {} {}: {:.4f} vs baseline {:.4f} ({:+.1%})'.format(
+            env_name, metric, value, baseline_value, change))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
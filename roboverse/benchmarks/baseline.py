@@ -0,0 +1,104 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+import numpy as np
+import pybullet as p
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_machine_info():
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pybullet_api': p.getAPIVersion(),
+        'git_revision': get_git_revision(),
+    }
+
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def higher_is_better(metric):
+    '''
+        throughputs end in _per_s and success rates in _success, everything
+        else is a latency in seconds
+    '''
+    return metric.endswith(('_per_s', '_success'))
+
+
+def compare_results(results, baseline, tolerance=0.2, tolerances=None, min_latency_delta=0.005):
+    '''
+        returns a list of (env, metric, value, baseline value, relative change)
+        for every metric that is more than `tolerance` (or its entry in
+        `tolerances`) worse than in the baseline. Latencies must also be
+        `min_latency_delta` seconds worse, so sub-millisecond noise is ignored.
+        Metrics missing from either side or zero in the baseline are not
+        compared.
+    '''
+    tolerances = tolerances or {}
+    regressions = []
+    for env_name, metrics in results['envs'].items():
+        baseline_metrics = baseline['envs'].get(env_name, {}).get('metrics', {})
+        for metric, value in metrics['metrics'].items():
+            if not baseline_metrics.get(metric):
+                continue
+            baseline_value = baseline_metrics[metric]
+            change = (value - baseline_value) / baseline_value
+            if higher_is_better(metric):
+                regressed = -change > tolerances.get(metric, tolerance)
+            else:
+                regressed = (change > tolerances.get(metric, tolerance)
+                             and value - baseline_value > min_latency_delta)
+            if regressed:
+                regressions.append((env_name, metric, value, baseline_value, change))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for env_name, metrics in results['envs'].items():
+        lines.append(env_name)
+        baseline_metrics = (baseline or {}).get('envs', {}).get(env_name, {}).get('metrics', {})
+        for metric, value in sorted(metrics['metrics'].items()):
+            line = '  {:<42} {:>12.4f}'.format(metric, value)
+            if baseline_metrics.get(metric):
+                line += '  (baseline {:.4f}, {:+.1%})'.format(
+                    baseline_metrics[metric], (value - baseline_metrics[metric]) / baseline_metrics[metric])
+            lines.append(line)
+        for name, reason in metrics['skipped'].items():
+            lines.append('  {:<42} skipped: {}'.format(name, reason))
+    return '\n'.join(lines)
+
+
+def make_results(env_results, config):
+    return {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'machine': get_machine_info(),
+        'config': config,
+        'envs': {
+            env_name: {'metrics': metrics, 'skipped': skipped}
+            for env_name, (metrics, skipped) in env_results.items()
+        },
+    }
@@ -0,0 +1,162 @@
+'''
+    python -m roboverse.benchmarks.fidelity --output fidelity.json
+    python -m roboverse.benchmarks.fidelity --profiles accurate fast --seeds 1 2 3
+
+    Runs the scripted expert through the command sequence of every
+    drawer_pnp_push_commands test env under each physics profile, with the
+    same seeds, and reports per profile the wall clock per env.step, the
+    success rate, how often the outcome of a seed matches the reference
+    (first) profile and how far the states drift from it.
+
+    Contacts make rollouts chaotic, so even the reference profile does not
+    reproduce its own outcomes once the random draws change. The
+    '<reference>_reseeded' row measures this noise floor, and by default the
+    recommended profile is the cheapest one whose outcomes match at least
+    as often as it does.
+'''
+import argparse
+import json
+import time
+
+import numpy as np
+
+from roboverse.benchmarks.baseline import get_machine_info
+from roboverse.benchmarks.suite import make_env, seed_everything
+from roboverse.envs.sawyer_base import PHYSICS_PROFILES
+from roboverse.utils import drawer_pnp_push_layout as obs_layout
+
+## state fields compared across profiles
+DIVERGENCE_FIELDS = ['hand_pos', 'td_handle_pos', 'obj1_pos', 'large_obj_pos']
+## offset of the rollout seeds of the reseeded reference
+RESEED_OFFSET = 100000
+
+
+def load_commands():
+    from eval_scripts.drawer_pnp_push_commands import drawer_pnp_push_commands
+    return drawer_pnp_push_commands
+
+
+def rollout_command(env, steps_per_stage):
+    '''
+        returns (states, stage successes, env.step times) of one pass
+        through the command sequence; every stage takes `steps_per_stage`
+        steps so that rollouts of different profiles line up
+    '''
+    states, successes, times = [], [], []
+    for _ in range(len(env.test_env_command['command_sequence'])):
+        env.demo_reset()
+        for t in range(steps_per_stage):
+            action, done = env.get_demo_action(first_timestep=(t == 0), return_done=True)
+            start = time.perf_counter()
+            obs, _, _, _ = env.step(action)
+            times.append(time.perf_counter() - start)
+            states.append(obs['state_observation'].copy())
+        successes.append(bool(done))
+    return np.array(states), successes, times
+
+
+def run_seed(env_name, command, profile, seed, steps_per_stage, rollout_seed=None):
+    seed_everything(seed)
+    env = make_env(env_name, test_env=True, expl=True, test_env_command=command,
+                   physics_profile=profile)
+    seed_everything(seed if rollout_seed is None else rollout_seed)
+    try:
+        return rollout_command(env, steps_per_stage)
+    finally:
+        env.close()
+
+
+def divergence(states, reference):
+    '''
+        max over DIVERGENCE_FIELDS of the position error per step
+    '''
+    errors = [np.linalg.norm(obs_layout.get(states, name) - obs_layout.get(reference, name), axis=-1)
+              for name in DIVERGENCE_FIELDS]
+    return np.max(errors, axis=0)
+
+
+def run_fidelity(env_name='SawyerRigAffordances-v6', profiles=None, seeds=None, steps_per_stage=120,
+                 min_agreement=None):
+    '''
+        returns {'profiles': {profile: metrics}, 'skipped': {seed: reason},
+        'recommended': profile}; the first profile is the reference, and
+        `min_agreement` defaults to the agreement of its reseeded run
+    '''
+    commands = load_commands()
+    profiles = list(profiles or PHYSICS_PROFILES)
+    seeds = range(len(commands)) if seeds is None else seeds
+    reseeded = profiles[0] + '_reseeded'
+
+    rollouts = {profile: {} for profile in profiles + [reseeded]}
+    skipped = {}
+    for seed in seeds:
+        try:
+            for profile in profiles:
+                rollouts[profile][seed] = run_seed(env_name, commands[seed], profile, seed, steps_per_stage)
+            rollouts[reseeded][seed] = run_seed(env_name, commands[seed], profiles[0], seed, steps_per_stage,
+                                                rollout_seed=seed + RESEED_OFFSET)
+        except (KeyError, AssertionError) as e:
+            ## commands the env does not support, e.g. 'top_obj' targets
+            skipped[seed] = '{}: {}'.format(type(e).__name__, e)
+            for profile_rollouts in rollouts.values():
+                profile_rollouts.pop(seed, None)
+
+    reference = rollouts[profiles[0]]
+    results = {}
+    for profile in [reseeded] + profiles:
+        times, successes, agreements, mean_errors, final_errors = [], [], [], [], []
+        for seed, (states, stage_successes, step_times) in rollouts[profile].items():
+            reference_states, reference_successes, _ = reference[seed]
+            errors = divergence(states, reference_states)
+            times += step_times
+            successes.append(all(stage_successes))
+            agreements.append(stage_successes == reference_successes)
+            mean_errors.append(errors.mean())
+            final_errors.append(errors[steps_per_stage - 1::steps_per_stage].max())
+        results[profile] = {
+            'step_s': float(np.mean(times)),
+            'success': float(np.mean(successes)),
+            'outcome_agreement': float(np.mean(agreements)),
+            'mean_divergence': float(np.mean(mean_errors)),
+            'max_stage_end_divergence': float(np.max(final_errors)),
+        }
+    if min_agreement is None:
+        min_agreement = results[reseeded]['outcome_agreement']
+    matching = [profile for profile in profiles if results[profile]['outcome_agreement'] >= min_agreement]
+    recommended = min(matching, key=lambda profile: results[profile]['step_s'])
+    return {'profiles': results, 'skipped': skipped, 'recommended': recommended}
+
+
+def format_fidelity(fidelity):
+    lines = ['{:<20} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+        'profile', 'step_ms', 'success', 'agreement', 'mean_div', 'end_div')]
+    for profile, metrics in fidelity['profiles'].items():
+        lines.append('{:<20} {:>10.3f} {:>8.3f} {:>10.3f} {:>10.4f} {:>10.4f}'.format(
+            profile, metrics['step_s'] * 1e3, metrics['success'], metrics['outcome_agreement'],
+            metrics['mean_divergence'], metrics['max_stage_end_divergence']))
+    for seed, reason in fidelity['skipped'].items():
+        lines.append('seed {} skipped: {}'.format(seed, reason))
+    lines.append('recommended: {}'.format(fidelity['recommended']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default='SawyerRigAffordances-v6')
+    parser.add_argument("--profiles", type=str, nargs='+', default=list(PHYSICS_PROFILES))
+    parser.add_argument("--seeds", type=int, nargs='+', default=None)
+    parser.add_argument("--steps_per_stage", type=int, default=120)
+    parser.add_argument("--min_agreement", type=float, default=None)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    fidelity = run_fidelity(args.env, args.profiles, args.seeds, args.steps_per_stage, args.min_agreement)
+    print(format_fidelity(fidelity))
+    if args.output:
+        fidelity.update(machine=get_machine_info(), config=vars(args))
+        with open(args.output, 'w') as f:
+            json.dump(fidelity, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
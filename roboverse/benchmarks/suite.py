@@ -0,0 +1,333 @@
+import os
+import pickle as pkl
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import roboverse
+from roboverse.envs.sawyer_rig_affordances_v6 import (
+    distance_metric_keys,
+    gripper_deg_keys,
+    success_metric_keys,
+)
+from roboverse.utils import TrajectoryWriter
+
+DEFAULT_ENVS = ['SawyerRigAffordances-v6', 'SawyerDiverseDrawerPnpPush-v0']
+## envs that can load layouts on top of a persistent static scene (snapshot_reset)
+LAYOUT_ENVS = ['SawyerRigAffordances-v6']
+
+## (name, env kwargs) of the reset latency configurations
+RESET_CONFIGS = [
+    ('reset_expl_interval1', dict(expl=True, reset_interval=1)),
+    ('reset_expl_interval4', dict(expl=True, reset_interval=4)),
+    ('reset_interval1', dict(expl=False, reset_interval=1)),
+    ('reset_interval4', dict(expl=False, reset_interval=4)),
+]
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def make_env(env_name, **kwargs):
+    return roboverse.make(env_name, **kwargs).unwrapped
+
+
+def latency_stats(name, times):
+    '''
+        metric names ending in _s are latencies (lower is better)
+    '''
+    return {
+        name + '_mean_s': float(np.mean(times)),
+        name + '_p50_s': float(np.percentile(times, 50)),
+        name + '_p95_s': float(np.percentile(times, 95)),
+    }
+
+
+def random_action(env):
+    low, high = env.action_space.low, env.action_space.high
+    return np.random.uniform(low, high)
+
+
+def benchmark_construction(env_name, num_constructions=3):
+    '''
+        the first reset loads the scene, so it is timed separately
+    '''
+    times, first_reset_times = [], []
+    for _ in range(num_constructions):
+        start = time.perf_counter()
+        env = make_env(env_name)
+        times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        env.reset()
+        first_reset_times.append(time.perf_counter() - start)
+        env.close()
+    results = latency_stats('construction', times)
+    results.update(latency_stats('first_reset', first_reset_times))
+    return results
+
+
+def benchmark_reset(env_name, num_resets=10):
+    results = {}
+    for name, env_kwargs in RESET_CONFIGS:
+        env = make_env(env_name, **env_kwargs)
+        env.reset()
+        times = []
+        for _ in range(num_resets):
+            start = time.perf_counter()
+            env.reset()
+            times.append(time.perf_counter() - start)
+        env.close()
+        results.update(latency_stats(name, times))
+    return results
+
+
+def benchmark_step(env_name, num_steps=200):
+    '''
+        also returns the rendered observations, reused as realistic image
+        columns by benchmark_dataset_write
+    '''
+    env = make_env(env_name, expl=True, reset_interval=1)
+    env.reset()
+
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        env.step(random_action(env))
+    step_time = time.perf_counter() - start
+
+    env.reset()
+    images = []
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        env.step(random_action(env))
+        images.append(env.render_obs())
+    step_render_time = time.perf_counter() - start
+
+    observation = env.get_observation()
+    env.close()
+    results = {
+        'step_per_s': num_steps / step_time,
+        'step_render_per_s': num_steps / step_render_time,
+    }
+    return results, images, observation
+
+
+def synthetic_paths(observation, num_paths, path_length):
+    '''
+        paths and contexts in the layout get_contextual_diagnostics expects,
+        built by perturbing a real observation and goal
+    '''
+    state, goal = observation['state_observation'], observation['state_desired_goal']
+    paths, contexts = [], []
+    for _ in range(num_paths):
+        states = state + np.random.normal(0, .05, (path_length, len(state)))
+        paths.append({'observations': [{'state_observation': s} for s in states]})
+        contexts.append({'state_desired_goal': goal + np.random.normal(0, .05, len(goal))})
+    return paths, contexts
+
+
+def benchmark_diagnostics(env_name, observation, num_paths=100, path_length=75):
+    env = make_env(env_name)
+    paths, contexts = synthetic_paths(observation, num_paths, path_length)
+    start = time.perf_counter()
+    env.get_contextual_diagnostics(paths, contexts)
+    elapsed = time.perf_counter() - start
+    env.close()
+    return {'diagnostics_paths_per_s': num_paths / elapsed}
+
+
+def check_metrics_parity(env, curr_states, goal_states):
+    '''
+        compute_all_metrics must give exactly the numbers of the per-key
+        get_success_metric / get_distance_metric / get_gripper_deg
+    '''
+    metrics = env.compute_all_metrics(curr_states, goal_states)
+    expected = {}
+    for key in success_metric_keys:
+        expected[key + '_success'] = env.get_success_metric(curr_states, goal_states, key=key)[:, 0]
+    for key in distance_metric_keys:
+        expected[key + '_distance'] = env.get_distance_metric(curr_states, goal_states, key=key)[:, 0]
+    degs = env.get_gripper_deg(curr_states)
+    for i, key in enumerate(gripper_deg_keys):
+        expected[key + '_deg'] = degs[:, i]
+    for name in metrics.dtype.names:
+        if not np.array_equal(metrics[name], expected[name]):
+            raise RuntimeError('compute_all_metrics differs from the per-key metric in {}'.format(name))
+
+
+def benchmark_metrics(env_name, observation, num_rows=10000):
+    '''
+        the success / distance metrics behind get_contextual_diagnostics,
+        per key and fused, on perturbed copies of a real observation and goal
+    '''
+    env = make_env(env_name)
+    state, goal = observation['state_observation'], observation['state_desired_goal']
+    curr_states = state + np.random.normal(0, .05, (num_rows, len(state)))
+    goal_states = goal + np.random.normal(0, .05, (num_rows, len(goal)))
+    check_metrics_parity(env, curr_states, goal_states)
+
+    start = time.perf_counter()
+    for key in success_metric_keys:
+        env.get_success_metric(curr_states, goal_states, key=key)
+    for key in distance_metric_keys:
+        env.get_distance_metric(curr_states, goal_states, key=key)
+    env.get_gripper_deg(curr_states)
+    per_key_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    env.compute_all_metrics(curr_states, goal_states)
+    fused_time = time.perf_counter() - start
+    env.close()
+    return {
+        'metrics_per_key_rows_per_s': num_rows / per_key_time,
+        'metrics_fused_rows_per_s': num_rows / fused_time,
+    }
+
+
+def layout_poses(env):
+    '''
+        small object, large object and drawer handle positions
+    '''
+    return np.concatenate([env.get_object_pos(env._small_obj), env.get_object_pos(env._large_obj),
+                           env._top_drawer_handle.get_handle_pos()])
+
+
+def benchmark_settle(env_name, num_layouts=10, seed=0, tolerance=1e-3):
+    '''
+        loads the same seeded layouts with fixed-step settling
+        (settle_tolerances=None) and with rest detection. The settled poses
+        are compared before the gripper reset, which moves the arm through
+        the scene, so that only the settling itself is compared.
+    '''
+    poses, results = {}, {}
+    for name, settle_tolerances in [('layout_fixed_settle', None), ('layout_rest_settle', (1e-3, 1e-2))]:
+        ## seeded from construction on, so both envs share the simulation history
+        seed_everything(seed)
+        env = make_env(env_name, settle_tolerances=settle_tolerances, snapshot_reset=True)
+        env.reset()
+        times, poses[name] = [], []
+        for i in range(num_layouts):
+            seed_everything(seed + 1 + i)
+            start = time.perf_counter()
+            ## clears the layout, loads a new one and saves its state
+            env._save_snapshot()
+            times.append(time.perf_counter() - start)
+            poses[name].append(layout_poses(env))
+        env.close()
+        results.update(latency_stats(name, times))
+    error = np.abs(np.array(poses['layout_fixed_settle']) - np.array(poses['layout_rest_settle'])).max()
+    if error > tolerance:
+        raise RuntimeError('rest detection moves the settled layout by {:.4f}'.format(error))
+    return results
+
+
+def benchmark_collision_models(env_name, num_rollouts=10, path_length=75, seed=0):
+    '''
+        runs the same seeded scripted expert rollouts with drawer_sawyer and
+        drawer_sawyer_lite, reporting the mean stepSimulation latency (from
+        the 'simulation' profile phase) and the expert success rate of each.
+        Removing shapes reorders contacts in the solver, so single rollouts
+        diverge; only rates over enough rollouts are comparable.
+    '''
+    results = {}
+    for name, lite_collision in [('full_collision', False), ('lite_collision', True)]:
+        seed_everything(seed)
+        env = make_env(env_name, expl=True, reset_interval=1, lite_collision=lite_collision, profile=True)
+        env.reset()
+        env.reset_profile()
+        successes = []
+        for i in range(num_rollouts):
+            seed_everything(seed + 1 + i)
+            env.demo_reset()
+            for t in range(path_length):
+                action, done = env.get_demo_action(first_timestep=(t == 0), return_done=True)
+                env.step(action)
+            successes.append(done)
+        results[name + '_simulation_s'] = env.get_profile()['simulation']['mean']
+        results[name + '_expert_success'] = float(np.mean(successes))
+        env.close()
+    return results
+
+
+def synthetic_trajectory(images, observation, path_length):
+    '''
+        one trajectory in the layout written by env6_demo_collector_target
+    '''
+    images = [images[t % len(images)] for t in range(path_length)]
+    state_observations = [{key: np.asarray(value) for key, value in observation.items()}
+                          for _ in range(path_length)]
+    return {
+        'env': images[0].flatten(),
+        'images': np.stack([img.flatten() for img in images]),
+        'observations': state_observations,
+        'next_observations': state_observations,
+        'actions': np.random.uniform(-1, 1, (path_length, 5)),
+        'rewards': np.zeros(path_length),
+        'terminals': np.zeros(path_length, dtype=np.uint8),
+        'skill_id': 0,
+    }
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, filename)) for filename in os.listdir(path))
+
+
+def benchmark_dataset_write(images, observation, num_trajectories=20, path_length=75, chunk_size=10):
+    trajectory = synthetic_trajectory(images, observation, path_length)
+    output_dir = tempfile.mkdtemp(prefix='roboverse_benchmark_')
+    try:
+        path = os.path.join(output_dir, 'chunked')
+        start = time.perf_counter()
+        with TrajectoryWriter(path, chunk_size=chunk_size) as writer:
+            for _ in range(num_trajectories):
+                writer.append(trajectory)
+        chunked_time = time.perf_counter() - start
+        chunked_size = directory_size(path)
+
+        path = os.path.join(output_dir, 'trajectories.pkl')
+        start = time.perf_counter()
+        with open(path, 'wb') as f:
+            ## one dump per trajectory, so the pickler cannot memoize repeats
+            for _ in range(num_trajectories):
+                pkl.dump(trajectory, f)
+        pkl_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir)
+
+    return {
+        'dataset_write_chunked_traj_per_s': num_trajectories / chunked_time,
+        'dataset_write_chunked_mb_per_s': chunked_size / 1e6 / chunked_time,
+        'dataset_write_pkl_traj_per_s': num_trajectories / pkl_time,
+    }
+
+
+def run_env_benchmarks(env_name, num_constructions=3, num_resets=10, num_steps=200,
+                       num_paths=100, path_length=75, num_trajectories=20, num_metric_rows=10000,
+                       num_layouts=10, num_expert_rollouts=10, seed=0):
+    '''
+        returns (metrics, skipped) for one env, where skipped maps the
+        benchmarks that could not run here to the reason
+    '''
+    seed_everything(seed)
+    metrics, skipped = {}, {}
+    metrics.update(benchmark_construction(env_name, num_constructions))
+    metrics.update(benchmark_reset(env_name, num_resets))
+    step_metrics, images, observation = benchmark_step(env_name, num_steps)
+    metrics.update(step_metrics)
+    try:
+        metrics.update(benchmark_diagnostics(env_name, observation, num_paths, path_length))
+    except ImportError as e:
+        ## get_contextual_diagnostics imports multiworld
+        skipped['diagnostics'] = str(e)
+    metrics.update(benchmark_metrics(env_name, observation, num_metric_rows))
+    if env_name in LAYOUT_ENVS:
+        metrics.update(benchmark_settle(env_name, num_layouts, seed))
+    else:
+        skipped['settle'] = 'no snapshot_reset to reload layouts on a static scene'
+    metrics.update(benchmark_collision_models(env_name, num_expert_rollouts, path_length, seed))
+    metrics.update(benchmark_dataset_write(images, observation, num_trajectories, path_length))
+    return metrics, skipped
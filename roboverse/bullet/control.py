@@ -1,6 +1,8 @@
 import pybullet as p
 import numpy as np
 
+from roboverse.bullet.misc import count_steps
+
 
 def get_joint_states(body_id, joint_indices, physicsClientId=0):
     all_joint_states = p.getJointStates(body_id, joint_indices, physicsClientId=physicsClientId)
@@ -84,6 +86,7 @@ def apply_action_ik(target_ee_pos, target_ee_quat, target_gripper_state,
 
     for _ in range(num_sim_steps):
         p.stepSimulation(physicsClientId=physicsClientId)
+    count_steps(num_sim_steps, physicsClientId=physicsClientId)
 
 
 def reset_robot(robot_id, reset_joint_indices, reset_joint_values, physicsClientId=0):
@@ -108,6 +111,66 @@ def get_object_position(body_id, physicsClientId=0):
 def step_simulation(num_sim_steps, physicsClientId=0):
     for _ in range(num_sim_steps):
         p.stepSimulation(physicsClientId=physicsClientId)
+    count_steps(num_sim_steps, physicsClientId=physicsClientId)
+
+
+def _get_velocity_tolerances(body, lin_tol, ang_tol, physicsClientId=0):
+    '''
+        (movable joint indices, their velocity tolerances) of `body`
+    '''
+    joints, tols = [], []
+    for joint in range(p.getNumJoints(body, physicsClientId=physicsClientId)):
+        joint_type = p.getJointInfo(body, joint, physicsClientId=physicsClientId)[2]
+        if joint_type == p.JOINT_PRISMATIC:
+            joints.append(joint)
+            tols.append(lin_tol)
+        elif joint_type == p.JOINT_REVOLUTE:
+            joints.append(joint)
+            tols.append(ang_tol)
+    return joints, np.array(tols)
+
+
+def at_rest(bodies, lin_tol, ang_tol, body_joints=None, physicsClientId=0):
+    '''
+        whether the base (m/s, rad/s) and joint velocities of all `bodies`
+        are within the tolerances. `body_joints` caches
+        _get_velocity_tolerances per body across calls.
+    '''
+    if body_joints is None:
+        body_joints = [_get_velocity_tolerances(body, lin_tol, ang_tol, physicsClientId=physicsClientId)
+                       for body in bodies]
+    for body, (joints, tols) in zip(bodies, body_joints):
+        lin_vel, ang_vel = p.getBaseVelocity(body, physicsClientId=physicsClientId)
+        if max(map(abs, lin_vel)) > lin_tol or max(map(abs, ang_vel)) > ang_tol:
+            return False
+        if joints:
+            joint_vel = np.array([state[1] for state in
+                                  p.getJointStates(body, joints, physicsClientId=physicsClientId)])
+            if np.any(np.abs(joint_vel) > tols):
+                return False
+    return True
+
+
+def settle(bodies, max_steps, lin_tol=1e-3, ang_tol=1e-2, check_every=10, physicsClientId=0):
+    '''
+        steps the simulation `check_every` steps at a time until `bodies`
+        are at rest (see at_rest) or `max_steps` steps were taken, and
+        returns the number of steps taken. With lin_tol=None all
+        `max_steps` are taken, as step_simulation does.
+    '''
+    if lin_tol is None:
+        step_simulation(max_steps, physicsClientId=physicsClientId)
+        return max_steps
+    body_joints = [_get_velocity_tolerances(body, lin_tol, ang_tol, physicsClientId=physicsClientId)
+                   for body in bodies]
+    steps = 0
+    while steps < max_steps:
+        num_steps = min(check_every, max_steps - steps)
+        step_simulation(num_steps, physicsClientId=physicsClientId)
+        steps += num_steps
+        if at_rest(bodies, lin_tol, ang_tol, body_joints, physicsClientId=physicsClientId):
+            break
+    return steps
 
 
 def quat_to_deg(quat, physicsClientId=0):
@@ -4,26 +4,94 @@ import roboverse.bullet.control as control
 import numpy as np
 
 
-def open_drawer(drawer, num_ts=None, render_obs=None, physicsClientId=0):
-    return slide_drawer(drawer, -1, num_ts=num_ts, render_obs=render_obs, physicsClientId=physicsClientId)
+## base_frame_joint positions of the scale .11 drawers: open is the joint
+## limit (handle td_open_coeff from the frame), closed is against the tray
+## stopper (handle td_close_coeff from the frame)
+drawer_open_joint_pos = -.1375
+drawer_closed_joint_pos = -.01934
+
+
+def set_drawer_open_fraction(drawer, fraction, physicsClientId=0):
+    '''
+        puts the drawer `fraction` of the way from closed (0) to open (1),
+        at rest, without simulating. The motor is left holding the drawer
+        as slide_drawer leaves it.
+    '''
+    joint = get_drawer_base_joint(drawer, physicsClientId=physicsClientId)
+    joint_pos = drawer_closed_joint_pos + fraction * (drawer_open_joint_pos - drawer_closed_joint_pos)
+    p.resetJointState(drawer, joint, joint_pos, targetVelocity=0, physicsClientId=physicsClientId)
+    p.setJointMotorControl2(
+        drawer,
+        joint,
+        controlMode=p.VELOCITY_CONTROL,
+        targetVelocity=0,
+        force=1,
+        physicsClientId=physicsClientId
+    )
+
+
+def get_drawer_open_fraction(drawer, physicsClientId=0):
+    '''
+        0 when closed, 1 when open, as set by set_drawer_open_fraction
+    '''
+    joint = get_drawer_base_joint(drawer, physicsClientId=physicsClientId)
+    joint_pos = p.getJointState(drawer, joint, physicsClientId=physicsClientId)[0]
+    return (joint_pos - drawer_closed_joint_pos) / (drawer_open_joint_pos - drawer_closed_joint_pos)
+
+
+def open_drawer(drawer, num_ts=None, render_obs=None, settle_tolerances=None, physicsClientId=0):
+    return slide_drawer(drawer, -1, num_ts=num_ts, render_obs=render_obs,
+                        settle_tolerances=settle_tolerances, physicsClientId=physicsClientId)
 
 
-def close_drawer(drawer, num_ts=None, render_obs=None, physicsClientId=0):
-    return slide_drawer(drawer, 1, num_ts=num_ts, render_obs=render_obs, physicsClientId=physicsClientId)
+def close_drawer(drawer, num_ts=None, render_obs=None, settle_tolerances=None, physicsClientId=0):
+    return slide_drawer(drawer, 1, num_ts=num_ts, render_obs=render_obs,
+                        settle_tolerances=settle_tolerances, physicsClientId=physicsClientId)
+
+
+class DrawerHandle:
+    '''
+        resolves the frame, base and handle link indices of a drawer once
+        so that its positions can be read with a single getLinkStates query
+    '''
+
+    def __init__(self, drawer, physicsClientId=0):
+        self.drawer = drawer
+        self.physicsClientId = physicsClientId
+        self.frame_link = get_drawer_frame_link(drawer, physicsClientId=physicsClientId)
+        self.base_joint = get_drawer_base_joint(drawer, physicsClientId=physicsClientId)
+        self.handle_link = get_drawer_handle_link(drawer, physicsClientId=physicsClientId)
+        self._links = [self.frame_link, self.base_joint, self.handle_link]
+
+    def get_positions(self):
+        '''
+            returns (frame_pos, bottom_pos, handle_pos)
+        '''
+        states = p.getLinkStates(self.drawer, self._links, physicsClientId=self.physicsClientId)
+        return tuple(np.array(state[0]) for state in states)
+
+    def get_frame_pos(self):
+        return self._get_pos(self.frame_link)
+
+    def get_bottom_pos(self):
+        return self._get_pos(self.base_joint)
+
+    def get_handle_pos(self):
+        return self._get_pos(self.handle_link)
+
+    def _get_pos(self, link):
+        return np.array(p.getLinkState(self.drawer, link, physicsClientId=self.physicsClientId)[0])
 
 
 def get_drawer_base_joint(drawer, physicsClientId=0):
-    joint_names = [control.get_joint_info(drawer, j, 'jointName', physicsClientId=physicsClientId)
-                   for j in range(p.getNumJoints(drawer, physicsClientId=physicsClientId))]
-    drawer_frame_joint_idx = joint_names.index('base_frame_joint')
-    return drawer_frame_joint_idx
+    return bullet.get_index_by_attribute(drawer, 'joint_name', 'base_frame_joint', physicsClientId=physicsClientId)
 
 #['frame', 'base', 'handle_plate_far', 'handle_plate_near', 'handle_r']
 def get_drawer_handle_link(drawer, physicsClientId=0):
-    link_names = [bullet.get_joint_info(drawer, j, 'link_name', physicsClientId=physicsClientId)
-                  for j in range(bullet.p.getNumJoints(drawer, physicsClientId=physicsClientId))]
-    handle_link_idx = link_names.index('handle_r')
-    return handle_link_idx
+    return bullet.get_index_by_attribute(drawer, 'link_name', 'handle_r', physicsClientId=physicsClientId)
+
+def get_drawer_frame_link(drawer, physicsClientId=0):
+    return bullet.get_index_by_attribute(drawer, 'link_name', 'frame', physicsClientId=physicsClientId)
 
 def get_drawer_bottom_pos(drawer, physicsClientId=0):
     drawer_bottom_pos = bullet.get_link_state(
@@ -36,11 +104,8 @@ def get_drawer_handle_pos(drawer, physicsClientId=0):
     return handle_pos['pos']
 
 def get_drawer_frame_pos(drawer, physicsClientId=0):
-    link_names = [bullet.get_joint_info(drawer, j, 'link_name', physicsClientId=physicsClientId)
-                  for j in range(bullet.p.getNumJoints(drawer, physicsClientId=physicsClientId))]
-    frame_link_idx = link_names.index('frame')
     frame_pos = bullet.get_link_state(
-        drawer, frame_link_idx, physicsClientId=physicsClientId)
+        drawer, get_drawer_frame_link(drawer, physicsClientId=physicsClientId), physicsClientId=physicsClientId)
     return frame_pos['pos']
 
 def get_drawer_opened_percentage(
@@ -50,10 +115,16 @@ def get_drawer_opened_percentage(
     else:
         return (max_x_pos - drawer_x_pos) / (max_x_pos - min_x_pos)
 
-def slide_drawer(drawer, direction, num_ts=None, render_obs=None, physicsClientId=0):
+def slide_drawer(drawer, direction, num_ts=None, render_obs=None, settle_tolerances=None, physicsClientId=0):
+    '''
+        with `settle_tolerances` (lin_tol, ang_tol), each phase ends early
+        once the drawer is at rest instead of always taking 30 + 2 * num_ts
+        steps; returns the drawer bottom position before sliding
+    '''
     assert direction in [-1, 1]
     # -1 = open; 1 = close
     drawer_frame_joint_idx = get_drawer_base_joint(drawer, physicsClientId=physicsClientId)
+    lin_tol, ang_tol = settle_tolerances or (None, None)
 
     if not num_ts:
         num_ts = 200 if direction == -1 else 300
@@ -66,7 +137,7 @@ def slide_drawer(drawer, direction, num_ts=None, render_obs=None, physicsClientI
 
     # Wait a little before closing
     wait_ts = 30  # 0 if direction == -1 else 30
-    control.step_simulation(wait_ts, physicsClientId=physicsClientId)
+    control.settle([drawer], wait_ts, lin_tol, ang_tol, physicsClientId=physicsClientId)
 
     p.setJointMotorControl2(
         drawer,
@@ -79,7 +150,7 @@ def slide_drawer(drawer, direction, num_ts=None, render_obs=None, physicsClientI
 
     drawer_pos = get_drawer_bottom_pos(drawer, physicsClientId=physicsClientId)
     
-    control.step_simulation(num_ts, physicsClientId=physicsClientId)
+    control.settle([drawer], num_ts, lin_tol, ang_tol, physicsClientId=physicsClientId)
 
     p.setJointMotorControl2(
         drawer,
@@ -90,6 +161,6 @@ def slide_drawer(drawer, direction, num_ts=None, render_obs=None, physicsClientI
         physicsClientId=physicsClientId
     )
     
-    control.step_simulation(num_ts, physicsClientId=physicsClientId)
+    control.settle([drawer], num_ts, lin_tol, ang_tol, physicsClientId=physicsClientId)
 
-    return drawer_pos
\ No newline at end of file
+    return drawer_pos
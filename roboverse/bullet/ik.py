@@ -6,12 +6,15 @@ from roboverse.bullet.queries import (
     get_joint_info,
     get_joint_state,
     get_link_state,
+    get_body_metadata,
+    JOINT_INFO_LABELS,
 )
 
 from roboverse.bullet.misc import (
     quat_to_deg,
     l2_dist,
     rot_diff_deg,
+    step,
 )
 
 
@@ -48,10 +51,9 @@ def get_num_actuators(body, physicsClientId=0):
     return len(joint_indices)
 
 def get_joint_positions(body, physicsClientId=0):
-    num_joints = p.getNumJoints(body, physicsClientId=physicsClientId)
-    q_indices = [get_joint_info(body, j, 'q_index', physicsClientId=physicsClientId) for j in range(num_joints)]
-    joint_indices = [j for j in range(num_joints) if q_indices[j] > -1]
-    joint_positions = [get_joint_state(body, j, 'pos', physicsClientId=physicsClientId) for j in joint_indices]
+    joint_indices = get_body_metadata(body, physicsClientId=physicsClientId)['movable_joints']
+    joint_states = p.getJointStates(body, joint_indices, physicsClientId=physicsClientId)
+    joint_positions = [state[0] for state in joint_states]
     return np.array(joint_indices), np.array(joint_positions)
 
 def ik_to_joint_vel(body, ik_solution, physicsClientId=0):
@@ -143,7 +145,7 @@ def step_ik(gripper_range=range(20, 25), body=0, physicsClientId=0):
     '''
         enforces joint limits for gripper fingers
     '''
-    p.stepSimulation(physicsClientId=physicsClientId)
+    step(physicsClientId=physicsClientId)
     for joint in gripper_range:
         low, high = get_joint_info(body, joint, ['low', 'high'],
                                    return_list=True, physicsClientId=physicsClientId)
@@ -151,6 +153,93 @@ def step_ik(gripper_range=range(20, 25), body=0, physicsClientId=0):
         pos = np.clip(pos, low, high)
         p.resetJointState(body, joint, pos, physicsClientId=physicsClientId)
 
+#######################
+#### ik controller ####
+#######################
+
+class IKController:
+    '''
+        sawyer_position_ik with everything it looks up on each call cached
+        once per robot: movable joints, gripper limits, and the damping and
+        force lists. Built from the body's cached metadata, so `is_current`
+        turns False once the body is reloaded or the client reset.
+    '''
+
+    def __init__(self, body, link, damping=1e-3, gripper_name=None,
+                 max_force=1000., limit_joints=range(20, 25), physicsClientId=0):
+        self.body = body
+        self.link = link
+        self.physicsClientId = physicsClientId
+        self._metadata = get_body_metadata(body, physicsClientId=physicsClientId)
+        self.joints = list(self._metadata['movable_joints'])
+        ## same damping length as `ik` for a scalar damping
+        self.damping = [damping for _ in range(self._metadata['num_joints'])]
+        self.forces = [max_force for _ in range(len(self.joints))]
+        if gripper_name:
+            self.l_limits, self.r_limits = _get_gripper_limits(
+                body, *gripper_name, physicsClientId=physicsClientId)
+        else:
+            self.l_limits, self.r_limits = _get_gripper_limits(
+                body, physicsClientId=physicsClientId)
+        ## the joints of `limit_joints` that step_ik actually clamps : fixed
+        ## joints have no range (low > high) and resetting them is a no-op
+        low_index, high_index = JOINT_INFO_LABELS.index('low'), JOINT_INFO_LABELS.index('high')
+        joint_infos = self._metadata['joint_infos']
+        self.limit_joints = [j for j in limit_joints if j in self.joints
+                             and joint_infos[j][low_index] <= joint_infos[j][high_index]]
+        self.limit_low = np.array([joint_infos[j][low_index] for j in self.limit_joints])
+        self.limit_high = np.array([joint_infos[j][high_index] for j in self.limit_joints])
+
+    def is_current(self, body, link, max_force):
+        return (body == self.body and link == self.link and self.forces[0] == max_force
+                and get_body_metadata(body, physicsClientId=self.physicsClientId) is self._metadata)
+
+    def get_joint_positions(self):
+        joint_states = p.getJointStates(self.body, self.joints, physicsClientId=self.physicsClientId)
+        return np.array([state[0] for state in joint_states])
+
+    def get_gripper_state(self, gripper, gripper_bounds=(-1, 1), discrete_gripper=True):
+        if discrete_gripper:
+            return _get_discrete_gripper_state(gripper, gripper_bounds, self.l_limits, self.r_limits)
+        else:
+            return _get_continuous_gripper_state(gripper, gripper_bounds, self.l_limits, self.r_limits)
+
+    def ik(self, pos, theta):
+        return list(p.calculateInverseKinematics(self.body, self.link, pos,
+                                                 targetOrientation=theta,
+                                                 jointDamping=self.damping,
+                                                 physicsClientId=self.physicsClientId))
+
+    def enforce_joint_limits(self):
+        '''
+            clamps the limit joints with a single state query, resetting
+            only the joints that are out of range (which also zeroes their
+            velocity, like step_ik does for every joint)
+        '''
+        joint_states = p.getJointStates(self.body, self.limit_joints, physicsClientId=self.physicsClientId)
+        pos = np.array([state[0] for state in joint_states])
+        for i in np.flatnonzero((pos < self.limit_low) | (pos > self.limit_high)):
+            p.resetJointState(self.body, self.limit_joints[i],
+                              min(max(pos[i], self.limit_low[i]), self.limit_high[i]),
+                              physicsClientId=self.physicsClientId)
+
+    def set_native_joint_limits(self):
+        '''
+            hands the limit joints' URDF ranges to the solver as joint limit
+            constraints, after which no per-step clamping is needed
+        '''
+        for joint, low, high in zip(self.limit_joints, self.limit_low, self.limit_high):
+            p.changeDynamics(self.body, joint, jointLowerLimit=low, jointUpperLimit=high,
+                             physicsClientId=self.physicsClientId)
+
+    def position_ik(self, pos, theta, gripper, gripper_bounds=(-1, 1), discrete_gripper=True):
+        ik_solution = self.ik(pos, theta)
+        ik_solution[-2:] = self.get_gripper_state(gripper, gripper_bounds, discrete_gripper)
+        p.setJointMotorControlArray(self.body, self.joints, p.POSITION_CONTROL,
+                                    targetPositions=ik_solution, forces=self.forces,
+                                    physicsClientId=self.physicsClientId)
+        return ik_solution
+
 #################
 #### gripper ####
 #################
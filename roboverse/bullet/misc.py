@@ -3,9 +3,11 @@ import pybullet_data as pdata
 import pybullet as p
 import pdb
 import cv2
+import functools
 import os
 import random
 import numpy as np
+from xml.etree import ElementTree
 ros_path = '/opt/ros/kinetic/lib/python2.7/dist-packages'
 if ros_path in os.sys.path:
     os.sys.path.remove(ros_path)
@@ -58,20 +60,53 @@ def setup(real_time=True, gravity=-10, physicsClientId=0):
     p.stepSimulation(physicsClientId=physicsClientId)
 
 
-def setup_headless(timestep=1./240, solver_iterations=150, gravity=-10, physicsClientId=0):
+def setup_headless(timestep=1./240, solver_iterations=150, gravity=-10, contact_erp=None, physicsClientId=0):
     '''
         sets parameters for running pybullet
         in a headless environment
     '''
     p.setPhysicsEngineParameter(
         numSolverIterations=solver_iterations, physicsClientId=physicsClientId)
+    if contact_erp is not None:
+        p.setPhysicsEngineParameter(contactERP=contact_erp, physicsClientId=physicsClientId)
     p.setTimeStep(timestep, physicsClientId=physicsClientId)
     p.setGravity(0, 0, gravity, physicsClientId=physicsClientId)
-    p.stepSimulation(physicsClientId=physicsClientId)
+    step(physicsClientId=physicsClientId)
+
+
+def enable_sleeping(exclude=(), physicsClientId=0):
+    '''
+        lets every body but `exclude` be deactivated once at rest; a
+        sleeping body wakes up when something touches it
+    '''
+    for i in range(p.getNumBodies(physicsClientId=physicsClientId)):
+        body = p.getBodyUniqueId(i, physicsClientId=physicsClientId)
+        if body in exclude:
+            continue
+        p.changeDynamics(body, -1, activationState=p.ACTIVATION_STATE_ENABLE_SLEEPING,
+                         physicsClientId=physicsClientId)
 
 
 def reset(physicsClientId=0):
+    from roboverse.bullet.queries import clear_body_metadata
     p.resetSimulation(physicsClientId=physicsClientId)
+    clear_body_metadata(physicsClientId=physicsClientId)
+
+
+def remove_body(body, physicsClientId=0):
+    from roboverse.bullet.queries import clear_body_metadata
+    p.removeBody(body, physicsClientId=physicsClientId)
+    clear_body_metadata(body, physicsClientId=physicsClientId)
+
+
+def _loaded(body, physicsClientId=0):
+    '''
+        body ids are reused after removal, so drop any metadata
+        cached for a previous body with the same id
+    '''
+    from roboverse.bullet.queries import clear_body_metadata
+    clear_body_metadata(body, physicsClientId=physicsClientId)
+    return body
 
 
 def replace_lines(filename, line_nums, texts):
@@ -82,28 +117,76 @@ def replace_lines(filename, line_nums, texts):
     out.writelines(lines)
     out.close()
 
-def load_urdf_randomize_color_custom(filepath, pos=[0, 0, 0], quat=[0, 0, 0, 1], scale=1, rgba=None, physicsClientId=0):
-    from shutil import copyfile
+@functools.lru_cache(maxsize=None)
+def get_urdf_materials(filepath):
+    '''
+        parsed once per URDF: the top-level material names in definition
+        order, and (link name, material name of each visual) per link.
+        visuals without a named material, or with their own color, get None
+    '''
+    root = ElementTree.parse(filepath).getroot()
+    materials = [material.get('name') for material in root.findall('material')]
+    link_materials = []
+    for link in root.findall('link'):
+        visual_materials = []
+        for visual in link.findall('visual'):
+            material = visual.find('material')
+            if material is None or material.find('color') is not None:
+                visual_materials.append(None)
+            else:
+                visual_materials.append(material.get('name'))
+        link_materials.append((link.get('name'), visual_materials))
+    return materials, link_materials
+
+
+def get_link_index(body, link_name, physicsClientId=0):
+    from roboverse.bullet.queries import get_index_by_attribute
+    if link_name == p.getBodyInfo(body, physicsClientId=physicsClientId)[0].decode():
+        return -1
+    return get_index_by_attribute(body, 'link_name', link_name, physicsClientId=physicsClientId)
+
+
+def set_material_colors(body, filepath, rgbas, physicsClientId=0):
+    '''
+        colors the visuals of `body` (loaded from `filepath`) as if the i-th
+        top-level material of the URDF had color rgbas[i]
+    '''
+    materials, link_materials = get_urdf_materials(filepath)
+    material_rgbas = {}
+    for material, rgba in zip(materials, rgbas):
+        material_rgbas.setdefault(material, rgba)
+    for link_name, visual_materials in link_materials:
+        if not any(material in material_rgbas for material in visual_materials):
+            continue
+        link = get_link_index(body, link_name, physicsClientId=physicsClientId)
+        for shape_index, material in enumerate(visual_materials):
+            if material in material_rgbas:
+                p.changeVisualShape(body, link, shapeIndex=shape_index, rgbaColor=material_rgbas[material],
+                                    physicsClientId=physicsClientId)
+
+
+def set_link_colors(body, link_rgbas, physicsClientId=0):
+    '''
+        link name -> rgba for every visual of the link
+    '''
+    for link_name, rgba in link_rgbas.items():
+        link = get_link_index(body, link_name, physicsClientId=physicsClientId)
+        p.changeVisualShape(body, link, rgbaColor=rgba, physicsClientId=physicsClientId)
+
 
+def load_urdf_randomize_color_custom(filepath, pos=[0, 0, 0], quat=[0, 0, 0, 1], scale=1, rgba=None, physicsClientId=0):
+    '''
+        rgba is a list with one color per top-level material of the URDF,
+        applied in memory to the loaded body
+    '''
     rgbas = rgba
+    body = _loaded(p.loadURDF(filepath, globalScaling=scale,
+                              physicsClientId=physicsClientId),
+                   physicsClientId=physicsClientId)
     if rgbas is not None:
-        rand_filepath = filepath[:-5] + \
-            '_rand_color_{0}.urdf'.format(np.random.uniform())
-        copyfile(filepath, rand_filepath)
-        line_nums = [3, 6, 9, 12]
-        color_lines = ['    <color rgba="{0} {1} {2} {3}"/>'.format(
-            rgba[0], rgba[1], rgba[2], rgba[3]) for rgba in rgbas]
-        replace_lines(rand_filepath, line_nums, color_lines)
-        try:
-            body = p.loadURDF(rand_filepath, globalScaling=scale, physicsClientId=physicsClientId)
-            p.changeVisualShape(body, -1, rgbaColor=rgbas[0],
-                                physicsClientId=physicsClientId)
-        finally:
-            pass
-            # os.remove(rand_filepath)
-    else:
-        body = p.loadURDF(filepath, globalScaling=scale,
-                          physicsClientId=physicsClientId)
+        set_material_colors(body, filepath, rgbas, physicsClientId=physicsClientId)
+        p.changeVisualShape(body, -1, rgbaColor=rgbas[0],
+                            physicsClientId=physicsClientId)
 
     p.resetBasePositionAndOrientation(
         body, pos, quat, physicsClientId=physicsClientId)
@@ -117,34 +200,18 @@ def replace_line(filename, line_num, text):
     out.close()
 
 def load_urdf_randomize_color(filepath, pos=[0, 0, 0], quat=[0, 0, 0, 1], scale=1, rgba=None, physicsClientId=0):
-    from shutil import copyfile
-
-    if rgba is not None:
-        rand_filepath = filepath[:-5] + \
-            '_rand_color_{0}.urdf'.format(np.random.uniform())
-        copyfile(filepath, rand_filepath)
-        color_line = '    <color rgba="{0} {1} {2} {3}"/>'.format(
-            rgba[0], rgba[1], rgba[2], rgba[3])
-        replace_line(rand_filepath, 3, color_line)
-        try:
-            body = p.loadURDF(rand_filepath, globalScaling=scale, physicsClientId=physicsClientId)
-            p.changeVisualShape(body, -1, rgbaColor=rgba,
-                                physicsClientId=physicsClientId)
-        finally:
-            pass
-            # os.remove(rand_filepath)
-    else:
-        body = p.loadURDF(filepath, globalScaling=scale,
-                          physicsClientId=physicsClientId)
-
-    p.resetBasePositionAndOrientation(
-        body, pos, quat, physicsClientId=physicsClientId)
-    return body
+    '''
+        rgba replaces the color of the first top-level material of the URDF
+    '''
+    return load_urdf_randomize_color_custom(
+        filepath, pos=pos, quat=quat, scale=scale, rgba=None if rgba is None else [rgba],
+        physicsClientId=physicsClientId)
 
 
 def load_urdf(filepath, pos=[0, 0, 0], quat=[0, 0, 0, 1], scale=1, rgba=None, physicsClientId=0):
-    body = p.loadURDF(filepath, globalScaling=scale,
-                      physicsClientId=physicsClientId)
+    body = _loaded(p.loadURDF(filepath, globalScaling=scale,
+                              physicsClientId=physicsClientId),
+                   physicsClientId=physicsClientId)
     p.resetBasePositionAndOrientation(
         body, pos, quat, physicsClientId=physicsClientId)
     if rgba is not None:
@@ -159,8 +226,9 @@ def load_obj(filepathcollision, filepathvisual, pos=[0, 0, 0], quat=[0, 0, 0, 1]
                                          meshScale=scale * np.array([1, 1, 1]), physicsClientId=physicsClientId)
     visualid = p.createVisualShape(p.GEOM_MESH, fileName=filepathvisual,
                                    meshScale=scale * np.array([1, 1, 1]), physicsClientId=physicsClientId)
-    body = p.createMultiBody(0.05, collisionid, visualid,
-                             physicsClientId=physicsClientId)
+    body = _loaded(p.createMultiBody(0.05, collisionid, visualid,
+                                     physicsClientId=physicsClientId),
+                   physicsClientId=physicsClientId)
     if rgba is not None:
         p.changeVisualShape(body, -1, rgbaColor=rgba,
                             physicsClientId=physicsClientId)
@@ -223,6 +291,54 @@ def render(height, width, view_matrix, projection_matrix,
         img = cv2.GaussianBlur(img, (gaussian_width, gaussian_width), 0)
     return img, depth, segmentation
 
+
+def render_rgb(height, width, view_matrix, projection_matrix, out=None, channels_first=False,
+               shadow=1, light_direction=[1, 1, 1], renderer=p.ER_BULLET_HARDWARE_OPENGL, physicsClientId=0):
+    '''
+        renders only the RGB image and writes it into `out`, a preallocated
+        uint8 buffer of shape (height, width, 3), or (3, height, width) if
+        channels_first. Skips the segmentation mask and the depth conversion,
+        and with numpy-enabled pybullet the only copy is the one into `out`
+    '''
+    _, _, img, _, _ = p.getCameraImage(width,
+                                       height,
+                                       view_matrix,
+                                       projection_matrix,
+                                       shadow=shadow,
+                                       lightDirection=light_direction,
+                                       renderer=renderer,
+                                       flags=p.ER_NO_SEGMENTATION_MASK,
+                                       physicsClientId=physicsClientId)
+    img = np.asarray(img, dtype=np.uint8).reshape(height, width, 4)[:, :, :3]
+    if channels_first:
+        img = img.transpose(2, 0, 1)
+    if out is None:
+        return np.ascontiguousarray(img)
+    np.copyto(out, img)
+    return out
+
+
+def box_downsample(img, factor, out=None, channels_first=False):
+    '''
+        averages `factor` x `factor` pixel blocks of an (H, W[, C]) image
+        with a reshape-sum; integer images are rounded to nearest
+    '''
+    img = np.asarray(img)
+    height, width = img.shape[0] // factor, img.shape[1] // factor
+    blocks = img.reshape((height, factor, width, factor) + img.shape[2:])
+    if np.issubdtype(img.dtype, np.integer):
+        img_sum = blocks.sum(axis=(1, 3), dtype=np.uint32)
+        img_sum += factor * factor // 2
+        img_sum //= factor * factor
+    else:
+        img_sum = blocks.mean(axis=(1, 3))
+    if channels_first and img_sum.ndim == 3:
+        img_sum = img_sum.transpose(2, 0, 1)
+    if out is None:
+        return img_sum.astype(img.dtype)
+    np.copyto(out, img_sum, casting='unsafe')
+    return out
+
 ############################
 #### rotation functions ####
 ############################
@@ -262,8 +378,21 @@ def deg_to_quat(deg, physicsClientId=0):
 #### miscellaneous ####
 #######################
 
+## stepSimulation calls made through the bullet helpers (`step`, `step_ik`,
+## `control.step_simulation`), per client; profilers diff these to attribute simulation steps to phases
+_step_counts = {}
+
 def step(physicsClientId=0):
     p.stepSimulation(physicsClientId=physicsClientId)
+    _step_counts[physicsClientId] = _step_counts.get(physicsClientId, 0) + 1
+
+
+def count_steps(num_steps, physicsClientId=0):
+    _step_counts[physicsClientId] = _step_counts.get(physicsClientId, 0) + num_steps
+
+
+def get_step_count(physicsClientId=0):
+    return _step_counts.get(physicsClientId, 0)
 
 
 def l2_dist(a, b):
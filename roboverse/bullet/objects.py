@@ -69,6 +69,7 @@ sawyer_invisible = loader(ASSET_PATH, 'sawyer_robot/sawyer_description/urdf/sawy
 sawyer_finger_visual_only = loader(ASSET_PATH, 'sawyer_robot/sawyer_description/urdf/sawyer_xacro_finger_visual_only.urdf')
 sawyer_hand_visual_only = loader(ASSET_PATH, 'sawyer_robot/sawyer_description/urdf/simple_sawyer_xacro_finger_visual_only.urdf')
 drawer_sawyer = loader(ASSET_PATH, 'sawyer_robot/sawyer_description/urdf/drawer_sawyer.urdf')
+drawer_sawyer_lite = loader(ASSET_PATH, 'sawyer_robot/sawyer_description/urdf/drawer_sawyer_lite.urdf')
 
 widowx_200 = loader(
   ASSET_PATH,
@@ -15,11 +15,13 @@ def get_joint_state(body, joint, keys=None, return_list=False, quat_to_deg=True,
     return _lookup_by_joint(body, joint, lookup_fn, labels, keys, return_list, quat_to_deg, physicsClientId=physicsClientId)
 
 
+JOINT_INFO_LABELS = ['joint_index', 'joint_name', 'joint_type', 'q_index', 'u_index', 'flags',
+                     'damping', 'friction', 'low', 'high', 'max_force', 'max_velocity',
+                     'link_name', 'axis', 'parent_frame_pos', 'parent_frame_theta', 'parent_index']
+
 def get_joint_info(body, joint, keys=None, return_list=False, quat_to_deg=True, physicsClientId=0):
-    lookup_fn = lambda body, joint : p.getJointInfo(body, joint, physicsClientId=physicsClientId)
-    labels = ['joint_index', 'joint_name', 'joint_type', 'q_index', 'u_index', 'flags',
-              'damping', 'friction', 'low', 'high', 'max_force', 'max_velocity',
-              'link_name', 'axis', 'parent_frame_pos', 'parent_frame_theta', 'parent_index']
+    lookup_fn = lambda body, joint : get_body_metadata(body, physicsClientId=physicsClientId)['joint_infos'][joint]
+    labels = JOINT_INFO_LABELS
     return _lookup_by_joint(body, joint, lookup_fn, labels, keys, return_list, quat_to_deg, physicsClientId=physicsClientId)
 
 
@@ -70,11 +72,56 @@ def format_query(filtered_d, keys, return_list):
         return filtered_d
 
 def get_index_by_attribute(body, attr, val, physicsClientId=0):
-    num_joints = p.getNumJoints(body, physicsClientId=physicsClientId)
-    link_names = {get_joint_info(body, j, attr, physicsClientId=physicsClientId): j for j in range(num_joints)}
-    link_index = link_names[val]
+    metadata = get_body_metadata(body, physicsClientId=physicsClientId)
+    if attr not in metadata['indices']:
+        attr_index = JOINT_INFO_LABELS.index(attr)
+        metadata['indices'][attr] = {
+            info[attr_index]: j for j, info in enumerate(metadata['joint_infos'])}
+    link_index = metadata['indices'][attr][val]
     return link_index
 
+##########################
+#### metadata caching ####
+##########################
+
+## static per-body joint metadata, keyed by (physicsClientId, body)
+_body_metadata = {}
+
+def get_body_metadata(body, physicsClientId=0):
+    '''
+        returns the cached joint infos of `body` (with names decoded to str),
+        its movable joint indices, and lazily built attribute -> index tables.
+        populated on first query and dropped by `clear_body_metadata`
+    '''
+    key = (physicsClientId, body)
+    metadata = _body_metadata.get(key)
+    if metadata is None:
+        num_joints = p.getNumJoints(body, physicsClientId=physicsClientId)
+        joint_infos = []
+        for j in range(num_joints):
+            info = p.getJointInfo(body, j, physicsClientId=physicsClientId)
+            joint_infos.append(tuple(v.decode() if type(v) == bytes else v for v in info))
+        q_index = JOINT_INFO_LABELS.index('q_index')
+        metadata = {
+            'num_joints': num_joints,
+            'joint_infos': joint_infos,
+            'movable_joints': [j for j in range(num_joints) if joint_infos[j][q_index] > -1],
+            'indices': {},
+        }
+        _body_metadata[key] = metadata
+    return metadata
+
+def clear_body_metadata(body=None, physicsClientId=0):
+    '''
+        invalidates the cached metadata of `body`, or of every body
+        in the client if `body` is None
+    '''
+    if body is None:
+        for key in [key for key in _body_metadata if key[0] == physicsClientId]:
+            del _body_metadata[key]
+    else:
+        _body_metadata.pop((physicsClientId, body), None)
+
 #########################
 #### gym env queries ####
 #########################
@@ -87,7 +134,7 @@ def format_sim_query(bodies, links, joints, physicsClientId=0):
     joint_queries = []
     for body, joint in  joints:
         if joint is None:
-            num_joints = p.getNumJoints(body, physicsClientId=physicsClientId)
+            num_joints = get_body_metadata(body, physicsClientId=physicsClientId)['num_joints']
             joint_queries.extend([(body, joint) for joint in range(num_joints)])
         else:
             joint = coerce_to_joint_name(body, joint, physicsClientId=physicsClientId)
@@ -123,7 +170,7 @@ def get_sim_state(body_queries=None, link_queries=None, joint_queries=None, phys
     return sim_state
 
 def has_fixed_root(body, physicsClientId=0):
-    if p.getNumJoints(body, physicsClientId=physicsClientId) == 0:
+    if get_body_metadata(body, physicsClientId=physicsClientId)['num_joints'] == 0:
         return False
     else:
         joint_name, joint_type = get_joint_info(body, 0, ['joint_name', 'joint_type'], return_list=True, physicsClientId=physicsClientId)
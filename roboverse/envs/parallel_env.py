@@ -0,0 +1,328 @@
+import inspect
+import multiprocessing as mp
+import random
+import traceback
+from multiprocessing import shared_memory
+
+import gym
+import numpy as np
+
+import roboverse
+from roboverse.policies import DrawerPnpPushExpert
+
+IMAGE_KEY = 'image_observation'
+
+## per-env scalars written by the workers next to the observations
+_SCALAR_LAYOUT = {
+    'rewards': ((), np.dtype(np.float64).str),
+    'dones': ((), np.dtype(np.bool_).str),
+}
+
+
+def _make_env(env_id, env_kwargs):
+    return roboverse.make(env_id, **env_kwargs).unwrapped
+
+
+def _seed_env(env, seed):
+    '''
+        the roboverse envs draw from both `random` and `np.random`
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    if hasattr(env, 'seed'):
+        try:
+            env.seed(seed)
+        except NotImplementedError:
+            pass
+
+
+def _render_chw(env, out=None):
+    '''
+        with `out`, a (C, H, W) view of the shared image buffer, the env
+        renders straight into shared memory
+    '''
+    channels_first = getattr(env, '_transpose_image', False)
+    if out is None:
+        img = env.render_obs()
+        return img if channels_first else np.transpose(img, (2, 0, 1))
+    env.render_obs(out=out if channels_first else out.transpose(1, 2, 0))
+    return out
+
+
+def _supports_render_out(env):
+    return 'out' in inspect.signature(env.render_obs).parameters
+
+
+def _obs_to_arrays(obs):
+    if isinstance(obs, dict):
+        return {k: np.asarray(v) for k, v in obs.items()
+                if k in ('state_observation', 'state_desired_goal')}
+    return {'observation': np.asarray(obs)}
+
+
+def _worker(index, remote, parent_remote, env_id, env_kwargs, seed,
+            max_path_length, render_images, reset_method):
+    parent_remote.close()
+    buffers, handles = {}, []
+    env = None
+    try:
+        env = _make_env(env_id, env_kwargs)
+        _seed_env(env, seed)
+        reset_fn = getattr(env, reset_method)
+        obs = reset_fn()
+        arrays = _obs_to_arrays(obs)
+        if render_images:
+            arrays[IMAGE_KEY] = _render_chw(env)
+        layout = {k: (v.shape, v.dtype.str) for k, v in arrays.items()}
+        remote.send(('ok', (layout, env.observation_space, env.action_space)))
+
+        ## attach to the shared buffers allocated by the parent
+        cmd, specs = remote.recv()
+        assert cmd == 'attach'
+        for key, (name, shape, dtype) in specs.items():
+            shm = shared_memory.SharedMemory(name=name)
+            handles.append(shm)
+            buffers[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+        def write(arrays):
+            for key, val in arrays.items():
+                buffers[key][index] = val
+
+        render_into_buffer = render_images and _supports_render_out(env)
+
+        def observe(obs, into_buffer=True):
+            arrays = _obs_to_arrays(obs)
+            if render_images:
+                if into_buffer and render_into_buffer:
+                    _render_chw(env, out=buffers[IMAGE_KEY][index])
+                else:
+                    arrays[IMAGE_KEY] = _render_chw(env)
+            return arrays
+
+        write(arrays)
+        num_steps = 0
+        remote.send(('ok', None))
+
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'close':
+                remote.send(('ok', None))
+                break
+            try:
+                if cmd == 'step':
+                    obs, reward, done, info = env.step(buffers['actions'][index].copy())
+                    num_steps += 1
+                    timeout = max_path_length is not None and num_steps >= max_path_length
+                    arrays = observe(obs, into_buffer=not (done or timeout))
+                    if done or timeout:
+                        info = dict(info)
+                        info['terminal_observation'] = arrays
+                        info['TimeLimit.truncated'] = timeout and not done
+                        arrays = observe(reset_fn())
+                        num_steps = 0
+                        done = True
+                    write(arrays)
+                    buffers['rewards'][index] = reward
+                    buffers['dones'][index] = done
+                    remote.send(('ok', info))
+                elif cmd == 'reset':
+                    write(observe(reset_fn()))
+                    num_steps = 0
+                    remote.send(('ok', None))
+                elif cmd == 'seed':
+                    _seed_env(env, data)
+                    remote.send(('ok', data))
+                elif cmd == 'call':
+                    name, args, kwargs = data
+                    attr = getattr(env, name)
+                    result = attr(*args, **kwargs) if callable(attr) else attr
+                    remote.send(('ok', result))
+                else:
+                    raise RuntimeError('Unrecognized command: {}'.format(cmd))
+            except Exception:
+                ## report the failure but keep the worker alive
+                remote.send(('error', traceback.format_exc()))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        remote.send(('error', traceback.format_exc()))
+    finally:
+        buffers.clear()
+        for shm in handles:
+            shm.close()
+        if env is not None:
+            env.close()
+        remote.close()
+
+
+class ParallelEnv(gym.Env):
+    '''
+        Runs `num_envs` copies of a registered roboverse env, each with its own
+        DIRECT physics client in a worker process. Actions are passed as an
+        (N, act_dim) batch and observations come back stacked, written by the
+        workers straight into shared memory:
+
+            state_observation   : (N, obs_dim) float64
+            state_desired_goal  : (N, obs_dim) float64
+            image_observation   : (N, C, H, W) uint8   (if render_images)
+
+        Envs are reset automatically when they return done or after
+        `max_path_length` steps; the final observation of the finished
+        episode is stored under info['terminal_observation'].
+    '''
+
+    def __init__(self,
+                 env,
+                 num_envs=4,
+                 seed=0,
+                 max_path_length=None,
+                 render_images=True,
+                 reset_method='reset',
+                 start_method=None,
+                 **env_kwargs
+                 ):
+        self._env_id = env
+        self.num_envs = num_envs
+        self._max_path_length = max_path_length
+        self._render_images = render_images
+        self._closed = False
+
+        ctx = mp.get_context(start_method)
+        self._remotes, self._processes = [], []
+        self._seeds = [seed + i for i in range(num_envs)]
+        for index in range(num_envs):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(index, work_remote, remote, env, env_kwargs, self._seeds[index],
+                      max_path_length, render_images, reset_method),
+                daemon=True)
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        specs = self._gather()
+        layout, observation_space, action_space = specs[0]
+        self.single_observation_space = observation_space
+        self.single_action_space = action_space
+        act_shape = (num_envs,) + tuple(action_space.shape)
+        self.action_space = gym.spaces.Box(
+            np.broadcast_to(action_space.low, act_shape),
+            np.broadcast_to(action_space.high, act_shape))
+        self.observation_space = observation_space
+
+        layout = dict(layout)
+        layout['actions'] = (tuple(action_space.shape), np.dtype(np.float64).str)
+        layout.update(_SCALAR_LAYOUT)
+        self._shms, self._buffers = {}, {}
+        for key, (shape, dtype) in layout.items():
+            dtype = np.dtype(dtype)
+            nbytes = max(int(np.prod((num_envs,) + tuple(shape))) * dtype.itemsize, 1)
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._shms[key] = shm
+            self._buffers[key] = np.ndarray((num_envs,) + tuple(shape), dtype=dtype, buffer=shm.buf)
+        specs = {k: (self._shms[k].name, buf.shape, buf.dtype.str)
+                 for k, buf in self._buffers.items()}
+        for remote in self._remotes:
+            remote.send(('attach', specs))
+        self._gather()
+
+        self._obs_keys = [k for k in layout if k not in ('actions', 'rewards', 'dones')]
+
+    @property
+    def parallel(self):
+        return True
+
+    def _gather(self, remotes=None):
+        remotes = self._remotes if remotes is None else remotes
+        results = [remote.recv() for remote in remotes]
+        errors = [msg for status, msg in results if status == 'error']
+        if errors:
+            raise RuntimeError('ParallelEnv worker failed:\n{}'.format(errors[0]))
+        return [msg for _, msg in results]
+
+    def _get_observation(self):
+        ## copies so that callers can keep observations across steps
+        return {k: self._buffers[k].copy() for k in self._obs_keys}
+
+    def reset(self, indices=None):
+        remotes = self._select(indices)
+        for remote in remotes:
+            remote.send(('reset', None))
+        self._gather(remotes)
+        return self._get_observation()
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.float64)
+        if actions.shape != self._buffers['actions'].shape:
+            raise RuntimeError('Expected actions of shape {}, got {}'.format(
+                self._buffers['actions'].shape, actions.shape))
+        self._buffers['actions'][:] = actions
+        for remote in self._remotes:
+            remote.send(('step', None))
+        infos = self._gather()
+        return (self._get_observation(), self._buffers['rewards'].copy(),
+                self._buffers['dones'].copy(), infos)
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = np.random.randint(2 ** 31 - 1 - self.num_envs)
+        if np.isscalar(seed):
+            seed = [seed + i for i in range(self.num_envs)]
+        for remote, s in zip(self._remotes, seed):
+            remote.send(('seed', int(s)))
+        self._seeds = self._gather()
+        return self._seeds
+
+    def call(self, name, *args, indices=None, **kwargs):
+        '''
+            calls `name` on every (or the selected) env and returns the list of
+            results, e.g. `env.call('get_demo_action', first_timestep=True)`
+        '''
+        remotes = self._select(indices)
+        for remote in remotes:
+            remote.send(('call', (name, args, kwargs)))
+        return self._gather(remotes)
+
+    def _select(self, indices):
+        if indices is None:
+            return self._remotes
+        return [self._remotes[i] for i in np.atleast_1d(indices)]
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for remote in self._remotes:
+            try:
+                remote.send(('close', None))
+                remote.recv()
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join()
+        self._buffers.clear()
+        for shm in self._shms.values():
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __del__(self):
+        if hasattr(self, '_shms'):
+            self.close()
+
+
+class VectorSawyerRigAffordancesV6(ParallelEnv):
+
+    def __init__(self, num_envs=4, **kwargs):
+        super().__init__('SawyerRigAffordances-v6', num_envs=num_envs, **kwargs)
+
+    def get_expert_tasks(self, indices=None):
+        '''
+            the task parameters of every (or the selected) env, stacked for
+            DrawerPnpPushExpert.get_actions on the batched state observations
+        '''
+        return DrawerPnpPushExpert.stack_tasks(self.call('get_expert_task', indices=indices))
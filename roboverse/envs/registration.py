@@ -260,9 +260,17 @@ PARALLEL_ENVIRONMENT_SPECS = tuple(
     } for env in SEQUENTIAL_ENVIRONMENT_SPECS + PROJECTION_ENVIRONMENT_SPECS
 )
 
+VECTOR_ENVIRONMENT_SPECS = (
+    {
+        'id': 'VectorSawyerRigAffordances-v6',
+        'entry_point': ('roboverse.envs.parallel_env:VectorSawyerRigAffordancesV6'),
+    },
+)
+
 BULLET_ENVIRONMENT_SPECS = SEQUENTIAL_ENVIRONMENT_SPECS + \
                            PROJECTION_ENVIRONMENT_SPECS + \
                            PARALLEL_ENVIRONMENT_SPECS + \
+                           VECTOR_ENVIRONMENT_SPECS + \
                            GRASP_V3_ENV_SPECS 
 
 def register_bullet_environments():
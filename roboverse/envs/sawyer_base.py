@@ -4,6 +4,21 @@ import pdb
 
 import roboverse.bullet as bullet
 from roboverse.envs.serializable import Serializable
+from roboverse.utils.profiling import Profiler
+
+## named physics settings for `physics_profile`. Every profile simulates
+## timestep * action_repeat = 1/24 s per action, so actions keep their
+## meaning; `sleeping` lets bodies at rest drop out of the simulation until
+## touched, and `contact_erp` (None: pybullet's default) is the fraction of
+## contact penetration corrected per step
+PHYSICS_PROFILES = {
+    'accurate': dict(timestep=1./240, solver_iterations=150, action_repeat=10,
+                     sleeping=False, contact_erp=None),
+    'fast': dict(timestep=1./120, solver_iterations=50, action_repeat=5,
+                 sleeping=True, contact_erp=.4),
+    'fastest': dict(timestep=1./72, solver_iterations=20, action_repeat=3,
+                    sleeping=True, contact_erp=.6),
+}
 
 
 class SawyerBaseEnv(gym.Env, Serializable):
@@ -22,8 +37,26 @@ class SawyerBaseEnv(gym.Env, Serializable):
                  pos_high=[0.8, 0.2, -0.2],  # [1,.4,.25]
                  max_force=1000.,
                  visualize=True,
+                 control_mode='substep_ik',
+                 ik_refine_thresh=None,
+                 joint_limit_mode='reset',
+                 physics_profile=None,
+                 profile=False,
+                 profile_trace=False,
                  ):
 
+        ## a PHYSICS_PROFILES name overrides timestep, solver_iterations and
+        ## action_repeat; None keeps them, without sleeping or contact_erp
+        physics = PHYSICS_PROFILES[physics_profile] if physics_profile else dict(
+            timestep=timestep, solver_iterations=solver_iterations, action_repeat=action_repeat,
+            sleeping=False, contact_erp=None)
+        self._physics_profile = physics_profile
+        action_repeat = physics['action_repeat']
+        timestep = physics['timestep']
+        solver_iterations = physics['solver_iterations']
+        self._sleeping = physics['sleeping']
+        self._contact_erp = physics['contact_erp']
+
         self._gui = gui
         self._action_scale = action_scale
         self._action_repeat = action_repeat
@@ -35,11 +68,28 @@ class SawyerBaseEnv(gym.Env, Serializable):
         self._pos_high = pos_high
         self._max_force = max_force
         self._visualize = visualize
+        ## 'substep_ik' : solve ik on every one of the `action_repeat` substeps
+        ## 'action_ik' : solve ik once per action and hold the joint targets,
+        ##     re-solving once halfway through the action if the end effector
+        ##     is still more than `ik_refine_thresh` from the target
+        assert control_mode in ['substep_ik', 'action_ik']
+        self._control_mode = control_mode
+        self._ik_refine_thresh = ik_refine_thresh
+        ## how the gripper finger limits are enforced after each substep
+        ## 'reset' : step_ik, resetting every finger joint on every substep
+        ## 'clamp' : reset only the finger joints that left their range
+        ## 'native' : pybullet joint limit constraints, no per-substep work
+        assert joint_limit_mode in ['reset', 'clamp', 'native']
+        self._joint_limit_mode = joint_limit_mode
         self._id = 'SawyerBaseEnv'
 
         self.theta = bullet.deg_to_quat([180, 0, 0])
 
         self._uid = bullet.connect_headless(self._gui)
+        ## per-phase timers for step and reset, see get_profile
+        self._profiler = Profiler(
+            enabled=profile or profile_trace, trace=profile_trace,
+            step_counter=lambda: bullet.get_step_count(self._uid))
         # self.set_reset_hook()
         self._set_spaces()
 
@@ -84,11 +134,25 @@ class SawyerBaseEnv(gym.Env, Serializable):
         obs_high = np.ones(observation_dim) * obs_bound
         self.observation_space = gym.spaces.Box(-obs_high, obs_high)
 
+    def _setup_physics(self):
+        bullet.setup_headless(
+            self._timestep, solver_iterations=self._solver_iterations,
+            contact_erp=self._contact_erp, physicsClientId=self._uid)
+
+    def _enable_sleeping(self):
+        '''
+            called once the scene is loaded; a no-op unless the physics
+            profile sleeps. The arm is kept awake, since its joints are
+            reset kinematically between tasks.
+        '''
+        if self._sleeping:
+            bullet.enable_sleeping(exclude=[self._sawyer], physicsClientId=self._uid)
+
     def reset(self):
         bullet.reset(physicsClientId=self._uid)
-        bullet.setup_headless(
-            self._timestep, solver_iterations=self._solver_iterations, physicsClientId=self._uid)
+        self._setup_physics()
         self._load_meshes()
+        self._enable_sleeping()
         self._format_state_query()
 
         self._prev_pos = np.array(self._pos_init)
@@ -180,15 +244,62 @@ class SawyerBaseEnv(gym.Env, Serializable):
             self._sawyer, self._end_effector, 'pos', physicsClientId=self._uid)
         return observation, reward, done, {}
 
+    def _get_ik_controller(self):
+        controller = getattr(self, '_ik_controller', None)
+        if controller is None or not controller.is_current(self._sawyer, self._end_effector, self._max_force):
+            controller = bullet.IKController(
+                self._sawyer, self._end_effector, max_force=self._max_force, physicsClientId=self._uid)
+            if self._joint_limit_mode == 'native':
+                controller.set_native_joint_limits()
+            self._ik_controller = controller
+        return controller
+
+    def _step_simulation(self, controller):
+        with self._profiler.phase('simulation'):
+            if self._joint_limit_mode == 'reset':
+                bullet.step_ik(physicsClientId=self._uid)
+            else:
+                bullet.step(physicsClientId=self._uid)
+                if self._joint_limit_mode == 'clamp':
+                    controller.enforce_joint_limits()
+
+    def _position_ik(self, controller, pos, theta, gripper):
+        with self._profiler.phase('ik'):
+            controller.position_ik(
+                pos, theta, gripper, gripper_bounds=self._gripper_bounds, discrete_gripper=False)
+
     def _simulate(self, pos, theta, gripper):
+        controller = self._get_ik_controller()
+        if self._control_mode == 'action_ik':
+            self._position_ik(controller, pos, theta, gripper)
+            for i in range(self._action_repeat):
+                self._step_simulation(controller)
+                if self._ik_refine_thresh is not None and i == self._action_repeat // 2 - 1:
+                    ee_pos = bullet.get_link_state(
+                        self._sawyer, self._end_effector, 'pos', physicsClientId=self._uid)
+                    if np.linalg.norm(ee_pos - pos) > self._ik_refine_thresh:
+                        self._position_ik(controller, pos, theta, gripper)
+            return
+
         for _ in range(self._action_repeat):
-            bullet.sawyer_position_ik(
-                self._sawyer, self._end_effector,
-                pos, theta,
-                gripper, gripper_bounds=self._gripper_bounds,
-                discrete_gripper=False, max_force=self._max_force, physicsClientId=self._uid
-            )
-            bullet.step_ik(physicsClientId=self._uid)
+            self._position_ik(controller, pos, theta, gripper)
+            self._step_simulation(controller)
+
+    def get_profile(self):
+        '''
+            per-phase totals, counts and percentiles (seconds) since the last
+            reset_profile; empty unless the env was made with profile=True
+        '''
+        return self._profiler.get_profile()
+
+    def reset_profile(self):
+        self._profiler.reset()
+
+    def dump_profile_trace(self, path):
+        '''
+            writes a Chrome trace of the profiled phases; needs profile_trace=True
+        '''
+        self._profiler.dump_chrome_trace(path)
 
     def render(self, mode='rgb_array'):
         img, depth, segmentation = bullet.render(
@@ -3,10 +3,12 @@ import numpy as np
 import pybullet as p
 from gym.spaces import Box, Dict
 from collections import OrderedDict
-from roboverse.bullet.control import get_object_position
+from roboverse.bullet.control import get_object_position, settle
 from roboverse.envs.sawyer_base import SawyerBaseEnv
 from roboverse.bullet.misc import load_obj, deg_to_quat, get_bbox	
 from roboverse.utils.misc import quat_to_deg, quat_to_deg_batch, first_nonzero
+from roboverse.utils.observation_layout import drawer_pnp_push_layout as obs_layout
+from roboverse.utils import scene_sampling
 from bullet_objects import loader, metadata
 import os.path as osp
 import importlib.util
@@ -54,6 +56,19 @@ goal_slide_quadrants = [
 ]
 
 
+## columns of compute_all_metrics, in the get_contextual_diagnostics order
+success_metric_keys = ["overall", "top_drawer", "obj_pnp", "obj_pnp_0", "obj_pnp_1", "obj_pnp_2",
+                       "obj_slide", "gripper_position", "gripper_rotation_roll",
+                       "gripper_rotation_pitch", "gripper_rotation_yaw", "gripper_rotation", "gripper"]
+distance_metric_keys = ["top_drawer", "obj_pnp", "obj_pnp_0", "obj_pnp_1", "obj_pnp_2", "obj_slide",
+                        "gripper_position", "gripper_rotation_roll", "gripper_rotation_pitch",
+                        "gripper_rotation_yaw", "gripper_rotation"]
+gripper_deg_keys = ["gripper_rotation_roll", "gripper_rotation_pitch", "gripper_rotation_yaw"]
+metrics_dtype = np.dtype([(k + '_success', int) for k in success_metric_keys]
+                         + [(k + '_distance', float) for k in distance_metric_keys]
+                         + [(k + '_deg', float) for k in gripper_deg_keys])
+
+
 class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
     def __init__(self,
@@ -135,6 +150,11 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         self.fixed_drawer_quadrant = kwargs.pop('fixed_drawer_quadrant', None)
         if self.fixed_drawer_quadrant is not None:
             assert self.fixed_drawer_quadrant == 0 or self.fixed_drawer_quadrant == 1
+        ## (linear m/s, angular rad/s) velocities below which the reset-time
+        ## object landing stops early; None always takes the fixed step counts
+        self.settle_tolerances = kwargs.pop('settle_tolerances', (1e-3, 1e-2))
+        ## load drawer_sawyer_lite, whose links above the wrist do not collide
+        self.lite_collision = kwargs.pop('lite_collision', False)
 
         self.obj_pnp = None
         self.obj_slide = None
@@ -171,9 +191,18 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         self.trajectory_done = False
         self.curr_task = None
 
+        ## overwrite one observation buffer every step; callers must copy observations they keep
+        self.reuse_observation_buffer = kwargs.pop('reuse_observation_buffer', False)
+        self._observation_buffer = obs_layout.empty()
+
         # Rendering
         self.downsample = kwargs.pop('downsample', False)
         self.env_obs_img_dim = kwargs.pop('env_obs_img_dim', self.obs_img_dim)
+        self.supersample = kwargs.pop('supersample', None)
+        if self.supersample:
+            assert not self.downsample
+            self._supersample_buffer = np.empty(
+                (self.obs_img_dim * self.supersample, self.obs_img_dim * self.supersample, 3), dtype=np.uint8)
         self.render_depth = kwargs.pop('render_depth', False)
         self.render_segmentation = kwargs.pop('render_segmentation', False)
 
@@ -282,7 +311,10 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         self._objects = {}
         self._sensors = {}
 
-        self._sawyer = bullet.objects.drawer_sawyer(physicsClientId=self._uid)
+        if self.lite_collision:
+            self._sawyer = bullet.objects.drawer_sawyer_lite(physicsClientId=self._uid)
+        else:
+            self._sawyer = bullet.objects.drawer_sawyer(physicsClientId=self._uid)
         table_pos = np.array([.75, -.2, self.table_z]) + self.configs['table_pos_offset']
         self._table = bullet.objects.table(
             pos=table_pos, rgba=self.configs['table_rgb'], physicsClientId=self._uid)
@@ -305,26 +337,19 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
             quadrant = quadrants[self.top_drawer_quadrant]
             drawer_frame_pos = np.array([quadrant[0], quadrant[1], self.drawer_z]) + self.configs['table_pos_offset']
         else:
-            self.drawer_yaw = self.fixed_drawer_yaw if self.fixed_drawer_yaw else random.uniform(
-                0, 180)
             if self.fixed_drawer_quadrant is not None:
                 quadrant = quadrants[self.fixed_drawer_quadrant]
-                drawer_frame_pos = np.array([quadrant[0], quadrant[1], self.drawer_z]) + self.configs['table_pos_offset']
             else:
-                tries = 0
                 quadrant = quadrants[self.top_drawer_quadrant]
-                while(True):
-                    drawer_frame_pos = np.array([quadrant[0], quadrant[1], self.drawer_z]) + self.configs['table_pos_offset']
-                    drawer_handle_open_goal_pos = drawer_frame_pos + td_open_coeff * \
-                        np.array([np.sin(self.drawer_yaw * np.pi / 180), -
-                                 np.cos(self.drawer_yaw * np.pi / 180), 0])
-                    if gripper_bounding_x[0] <= drawer_handle_open_goal_pos[0] <= gripper_bounding_x[1] \
-                            and gripper_bounding_y[0] <= drawer_handle_open_goal_pos[1] <= gripper_bounding_y[1]:
-                        break
-                    tries += 1
-                    if (tries > 25):
-                        self.drawer_yaw = self.fixed_drawer_yaw if self.fixed_drawer_yaw else random.uniform(
-                            0, 180)
+            drawer_frame_pos = np.array([quadrant[0], quadrant[1], self.drawer_z]) + self.configs['table_pos_offset']
+            if self.fixed_drawer_yaw:
+                self.drawer_yaw = self.fixed_drawer_yaw
+            elif self.fixed_drawer_quadrant is not None:
+                self.drawer_yaw = random.uniform(0, 180)
+            else:
+                ## the open handle must be reachable
+                self.drawer_yaw = scene_sampling.sample_drawer_yaw(
+                    drawer_frame_pos, gripper_bounding_x, gripper_bounding_y, td_open_coeff)
 
         quat = deg_to_quat([0, 0, self.drawer_yaw], physicsClientId=self._uid)
 
@@ -332,12 +357,12 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
             quat=quat, pos=drawer_frame_pos, rgba=[
                 self.configs['object_rgbs']['drawer'][k] for k in ['frame', 'bottom_frame', 'bottom', 'handle']
             ], physicsClientId=self._uid, scale=.11)
+        self._top_drawer_handle = DrawerHandle(self._top_drawer, physicsClientId=self._uid)
         self.top_drawer_handle_can_move = True
 
-        open_drawer(self._top_drawer, 100, physicsClientId=self._uid)
+        set_drawer_open_fraction(self._top_drawer, 1, physicsClientId=self._uid)
 
-        self.init_handle_pos = get_drawer_handle_pos(
-            self._top_drawer, physicsClientId=self._uid)[1]
+        self.init_handle_pos = self._top_drawer_handle.get_handle_pos()[1]
 
         ## Tray above top drawer
         top_drawer_tray_pos = drawer_frame_pos + np.array([0, 0, .059])
@@ -356,12 +381,12 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
         if self.test_env:
             if not self.test_env_command['drawer_open']:
-                close_drawer(self._top_drawer, 200, physicsClientId=self._uid)
+                set_drawer_open_fraction(self._top_drawer, 0, physicsClientId=self._uid)
         else:
             if is_close_drawer:
-                close_drawer(self._top_drawer, 200, physicsClientId=self._uid)
+                set_drawer_open_fraction(self._top_drawer, 0, physicsClientId=self._uid)
 
-        self._load_table_large_objs()
+        self._load_table_large_objs(drawer_frame_pos, is_close_drawer)
         self._load_table_small_objs(is_close_drawer)
 
         self._workspace = bullet.Sensor(self._sawyer,
@@ -402,35 +427,20 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
             self._small_obj = self.spawn_small_object(
                 object_position=random_position, rgba=self.configs['object_rgbs']['small_object'])
         else:
-            objects_within_gripper_range = False
-            tries = 0
-            while(not objects_within_gripper_range):
-                if self._small_obj:
-                    p.removeBody(self._small_obj, physicsClientId=self._uid)
-
-                self.get_obj_pnp_goals()
-                possible_goals = [self.on_top_drawer_goal,
-                                  self.in_drawer_goal, self.out_of_drawer_goal]
-                if is_close_drawer:
-                    possible_goals = [
-                        self.on_top_drawer_goal, self.out_of_drawer_goal]
-                pos = random.choice(possible_goals)
-                self._init_objs_pos.append(pos)
-                self._small_obj = self.spawn_small_object(
-                    object_position=pos + np.array([0, 0, .1]), rgba=self.configs['object_rgbs']['small_object'])
-
-                objects_within_gripper_range = True
-                pos, _ = get_object_position(self._small_obj, physicsClientId=self._uid)
-                if not (gripper_bounding_x[0] - .04 <= pos[0] and pos[0] <= gripper_bounding_x[1] + .04
-                        and gripper_bounding_y[0] - .04 <= pos[1] and pos[1] <= gripper_bounding_y[1] + .04):
-                    objects_within_gripper_range = False
-                    break
-
-                tries += 1
-                if tries > 10:
-                    break
-
-    def _load_table_large_objs(self):
+            ## the goals are placed relative to the drawer, so the object is
+            ## spawned once rather than spawned and checked
+            self.get_obj_pnp_goals()
+            possible_goals = [self.on_top_drawer_goal,
+                              self.in_drawer_goal, self.out_of_drawer_goal]
+            if is_close_drawer:
+                possible_goals = [
+                    self.on_top_drawer_goal, self.out_of_drawer_goal]
+            pos = random.choice(possible_goals)
+            self._init_objs_pos.append(pos)
+            self._small_obj = self.spawn_small_object(
+                object_position=pos + np.array([0, 0, .1]), rgba=self.configs['object_rgbs']['small_object'])
+
+    def _load_table_large_objs(self, drawer_frame_pos, is_close_drawer=False):
         ## Large Object
         if self.test_env:
             self.large_object_quadrant = self.test_env_command['large_object_quadrant']
@@ -439,50 +449,28 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
             self._large_obj = self.spawn_large_object(
                 pos, self.configs['object_rgbs']['large_object'])
         else:
-            large_object_within_gripper_range = False
-            tries = 0
-            while(not large_object_within_gripper_range):
-                if tries > 0:
-                    p.removeBody(self._large_obj, physicsClientId=self._uid)
-                self._large_obj = None
-
-                large_object_quadrant_opts = list(
-                    set([0, 1, 2, 3]) - set([self.top_drawer_quadrant]))
-                if self.handle_more_open_than_closed():
-                    for opt in large_object_quadrant_opts:
-                        # oc = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_drawer_handle_future_pos(td_open_coeff)[:2]) < .1
-                        # cc = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_drawer_handle_future_pos(td_close_coeff)[:2]) < .1
-                        df = np.linalg.norm(np.array(slide_quadrants[opt]) - get_drawer_frame_pos(
-                            self._top_drawer, physicsClientId=self._uid)[:2]) < .15
-                        bf = np.linalg.norm(np.array(slide_quadrants[opt]) - get_drawer_bottom_pos(
-                            self._top_drawer, physicsClientId=self._uid)[:2]) < .168
-                        #so = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_object_pos(self._small_obj)[:2]) < .1
-                        if df or bf:
-                            large_object_quadrant_opts.remove(opt)
-                ## Bug where drawer in first quadrant pointing towards camera collides with large object in in fourth quadrant
-                if self.top_drawer_quadrant == 0 and self.drawer_yaw > 60 and self.drawer_yaw < 90 and 3 in large_object_quadrant_opts:
-                    large_object_quadrant_opts.remove(3)
-                if len(large_object_quadrant_opts) == 0:
-                    large_object_quadrant_opts = list(
-                        set([0, 1, 2, 3]) - set([self.top_drawer_quadrant]))
-                #print("OPTS: ", large_object_quadrant_opts)
-                self.large_object_quadrant = random.choice(
-                    large_object_quadrant_opts)
-
-                quadrant = slide_quadrants[self.large_object_quadrant]
-                pos = np.array([quadrant[0], quadrant[1], self.large_obj_z]) + self.configs['table_pos_offset']
-                self._large_obj = self.spawn_large_object(
-                    pos, self.configs['object_rgbs']['large_object'])
-
-                large_object_within_gripper_range = True
-                if not (gripper_bounding_x[0] - .1 <= pos[0] and pos[0] <= gripper_bounding_x[1] + .1
-                        and gripper_bounding_y[0] - .1 <= pos[1] and pos[1] <= gripper_bounding_y[1] + .1):
-                    objects_within_gripper_range = False
-                    break
-
-                tries += 1
-                if tries > 10:
-                    break
+            all_opts = np.array([opt for opt in range(4) if opt != self.top_drawer_quadrant])
+            large_object_quadrant_opts = all_opts
+            if not is_close_drawer:
+                ## keep clear of the open drawer, placed analytically before spawning
+                _, drawer_bottom_pos, _ = scene_sampling.drawer_positions(
+                    drawer_frame_pos, self.drawer_yaw, td_open_coeff)
+                opts_pos = np.array(slide_quadrants)[all_opts]
+                df = np.linalg.norm(opts_pos - drawer_frame_pos[:2], axis=1) < .15
+                bf = np.linalg.norm(opts_pos - drawer_bottom_pos[:2], axis=1) < .168
+                large_object_quadrant_opts = all_opts[~(df | bf)]
+            ## Bug where drawer in first quadrant pointing towards camera collides with large object in in fourth quadrant
+            if self.top_drawer_quadrant == 0 and 60 < self.drawer_yaw < 90:
+                large_object_quadrant_opts = large_object_quadrant_opts[large_object_quadrant_opts != 3]
+            if len(large_object_quadrant_opts) == 0:
+                large_object_quadrant_opts = all_opts
+            self.large_object_quadrant = int(random.choice(large_object_quadrant_opts))
+
+            ## slide quadrants are within the gripper range, so the object is spawned once
+            quadrant = slide_quadrants[self.large_object_quadrant]
+            pos = np.array([quadrant[0], quadrant[1], self.large_obj_z]) + self.configs['table_pos_offset']
+            self._large_obj = self.spawn_large_object(
+                pos, self.configs['object_rgbs']['large_object'])
 
     def sample_quat(self):
         return deg_to_quat(np.array([random.randint(0, 360), random.randint(0, 360), random.randint(0, 360)]), physicsClientId=self._uid)
@@ -499,12 +487,10 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
         # Allow the objects to land softly in low gravity
         p.setGravity(0, 0, -1, physicsClientId=self._uid)
-        for _ in range(100):
-            bullet.step(physicsClientId=self._uid)
+        settle([obj], 100, *(self.settle_tolerances or (None, None)), physicsClientId=self._uid)
         # After landing, bring to stop
         p.setGravity(0, 0, -10, physicsClientId=self._uid)
-        for _ in range(100):
-            bullet.step(physicsClientId=self._uid)
+        settle([obj], 100, *(self.settle_tolerances or (None, None)), physicsClientId=self._uid)
 
         return obj
 
@@ -647,18 +633,18 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
     def get_success_metric(self, curr_state, goal_state, key=None):
         success = np.zeros((curr_state.shape[0], 1), dtype=int)
         if key == "overall":
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_3 = curr_state[:, 20:23]
-            goal_pos_3 = goal_state[:, 20:23]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_3 = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos_3 = goal_state[:, obs_layout['large_obj_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = np.logical_and.reduce((
                 self.drawer_done(curr_pos, goal_pos),
                 self.obj_pnp_done(curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra),
@@ -666,53 +652,53 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
                 self.obj_pnp_done(curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra),
                 self.obj_slide_done(curr_pos_3, goal_pos_3))).astype(int)
         elif key == 'top_drawer':
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
             success = self.drawer_done(curr_pos, goal_pos).astype(int)
         elif key == 'obj_pnp':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = np.logical_and.reduce((
                 self.obj_pnp_done(curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra),
                 self.obj_pnp_done(curr_pos_1, goal_pos_1, curr_pos_extra, goal_pos_extra),
                 self.obj_pnp_done(curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra))).astype(int)
         elif key == 'obj_pnp_0':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_pnp_1':
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_1, goal_pos_1, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_pnp_2':
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_slide':
-            curr_pos = curr_state[:, 20:23]
-            goal_pos = goal_state[:, 20:23]
+            curr_pos = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos = goal_state[:, obs_layout['large_obj_pos']]
             success = self.obj_slide_done(curr_pos, goal_pos).astype(int)
         else:
-            pos = curr_state[:, 0:3]
-            goal_pos = goal_state[:, 0:3]
+            pos = curr_state[:, obs_layout['hand_pos']]
+            goal_pos = goal_state[:, obs_layout['hand_pos']]
 
-            deg = quat_to_deg_batch(curr_state[:, 3:7])
-            goal_deg = quat_to_deg_batch(goal_state[:, 3:7])
+            deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+            goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
 
             if key == 'gripper_position':
                 success = (np.linalg.norm(pos - goal_pos, axis=1, keepdims=True)
@@ -741,40 +727,40 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
     def get_distance_metric(self, curr_state, goal_state, key=None):
         distance = np.full((curr_state.shape[0], 1), np.inf, dtype=float)
         if key == 'top_drawer':
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
             distance = np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True)
         elif key == 'obj_pnp':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
             distance = np.linalg.norm(curr_pos_0 - goal_pos_0, axis=1, keepdims=True) + \
                        np.linalg.norm(curr_pos_1 - goal_pos_1, axis=1, keepdims=True) + \
                        np.linalg.norm(curr_pos_2 - goal_pos_2, axis=1, keepdims=True)
         elif key == 'obj_pnp_0':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
             distance = np.linalg.norm(curr_pos_0 - goal_pos_0, axis=1, keepdims=True)
         elif key == 'obj_pnp_1':
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
             distance = np.linalg.norm(curr_pos_1 - goal_pos_1, axis=1, keepdims=True)
         elif key == 'obj_pnp_2':
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
             distance = np.linalg.norm(curr_pos_2 - goal_pos_2, axis=1, keepdims=True)
         elif key == 'obj_slide':
-            curr_pos = curr_state[:, 20:23]
-            goal_pos = goal_state[:, 20:23]
+            curr_pos = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos = goal_state[:, obs_layout['large_obj_pos']]
             distance = np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True)
         else:
-            pos = curr_state[:, 0:3]
-            goal_pos = goal_state[:, 0:3]
-            deg = quat_to_deg_batch(curr_state[:, 3:7])
-            goal_deg = quat_to_deg_batch(goal_state[:, 3:7])
+            pos = curr_state[:, obs_layout['hand_pos']]
+            goal_pos = goal_state[:, obs_layout['hand_pos']]
+            deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+            goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
 
             if key == 'gripper_position':
                 distance = np.linalg.norm(pos - goal_pos, axis=1, keepdims=True)
@@ -797,7 +783,7 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
                           np.linalg.norm((360 + deg2 - deg1) % 360, axis=1, keepdims=True))
 
     def get_gripper_deg(self, curr_state):
-        quat = curr_state[:, 3:7]
+        quat = curr_state[:, obs_layout['hand_quat']]
         deg = quat_to_deg_batch(quat)
         # if roll_list is not None:
         #     roll_list.extend(deg[:, 0].tolist())
@@ -808,6 +794,62 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
         return deg
 
+    def compute_all_metrics(self, curr_state, goal_state):
+        '''
+            every get_success_metric and get_distance_metric column in one
+            pass, sharing the euler angles, norms and per-object successes
+            between keys. Returns a structured array of shape (N,) with the
+            fields of metrics_dtype, e.g. metrics['obj_pnp_success'],
+            metrics['gripper_rotation_distance'], metrics['gripper_rotation_yaw_deg']
+        '''
+        metrics = np.empty(curr_state.shape[0], dtype=metrics_dtype)
+        curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+        goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
+
+        top_drawer_distance = np.linalg.norm(
+            curr_state[:, obs_layout['td_handle_pos']] - goal_state[:, obs_layout['td_handle_pos']], axis=1, keepdims=True)
+        obj_pnp_distances, obj_pnp_successes = [], []
+        for i in range(3):
+            curr_pos, goal_pos = curr_state[:, obs_layout[f'obj{i}_pos']], goal_state[:, obs_layout[f'obj{i}_pos']]
+            obj_pnp_distances.append(np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True))
+            obj_pnp_successes.append(self.obj_pnp_done(curr_pos, goal_pos, curr_pos_extra, goal_pos_extra))
+            metrics[f'obj_pnp_{i}_success'] = obj_pnp_successes[i][:, 0]
+            metrics[f'obj_pnp_{i}_distance'] = obj_pnp_distances[i][:, 0]
+        obj_slide_success = self.obj_slide_done(curr_state[:, obs_layout['large_obj_pos']], goal_state[:, obs_layout['large_obj_pos']])
+        top_drawer_success = top_drawer_distance < self.drawer_thresh
+
+        metrics['overall_success'] = np.logical_and.reduce(
+            [top_drawer_success] + obj_pnp_successes + [obj_slide_success])[:, 0]
+        metrics['top_drawer_success'] = top_drawer_success[:, 0]
+        metrics['top_drawer_distance'] = top_drawer_distance[:, 0]
+        metrics['obj_pnp_success'] = np.logical_and.reduce(obj_pnp_successes)[:, 0]
+        metrics['obj_pnp_distance'] = (obj_pnp_distances[0] + obj_pnp_distances[1] + obj_pnp_distances[2])[:, 0]
+        metrics['obj_slide_success'] = obj_slide_success[:, 0]
+        metrics['obj_slide_distance'] = np.linalg.norm(
+            curr_state[:, obs_layout['large_obj_pos']] - goal_state[:, obs_layout['large_obj_pos']], axis=1, keepdims=True)[:, 0]
+
+        gripper_position_distance = np.linalg.norm(
+            curr_state[:, obs_layout['hand_pos']] - goal_state[:, obs_layout['hand_pos']], axis=1, keepdims=True)
+        deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+        goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
+        rotation_distances = [self.norm_deg(deg[:, [i]], goal_deg[:, [i]]) for i in range(3)]
+        gripper_rotation_distance = np.sqrt(
+            rotation_distances[0]**2 + rotation_distances[1]**2 + rotation_distances[2]**2)
+        gripper_position_success = gripper_position_distance < self.gripper_pos_thresh
+        gripper_rotation_success = gripper_rotation_distance < self.gripper_rot_thresh
+
+        metrics['gripper_position_success'] = gripper_position_success[:, 0]
+        metrics['gripper_position_distance'] = gripper_position_distance[:, 0]
+        for i, k in enumerate(gripper_deg_keys):
+            metrics[k + '_success'] = (rotation_distances[i] < self.gripper_rot_thresh)[:, 0]
+            metrics[k + '_distance'] = rotation_distances[i][:, 0]
+            metrics[k + '_deg'] = deg[:, i]
+        metrics['gripper_rotation_success'] = gripper_rotation_success[:, 0]
+        metrics['gripper_rotation_distance'] = gripper_rotation_distance[:, 0]
+        metrics['gripper_success'] = np.logical_and(gripper_position_success, gripper_rotation_success)[:, 0]
+
+        return metrics
+
     def get_contextual_diagnostics(self, paths, contexts):
         # from roboverse.utils.diagnostics import create_stats_ordered_dict
         from multiworld.envs.env_util import create_stats_ordered_dict
@@ -815,29 +857,8 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         state_key = "state_observation"
         goal_key = "state_desired_goal"
 
-        success_keys = ["overall",
-                        "top_drawer",
-                        "obj_pnp",
-                        "obj_pnp_0",
-                        "obj_pnp_1",
-                        "obj_pnp_2",
-                        "obj_slide",
-                        "gripper_position",
-                        "gripper_rotation_roll",
-                        "gripper_rotation_pitch",
-                        "gripper_rotation_yaw",
-                        "gripper_rotation", "gripper"]
-        distance_keys = ["top_drawer",
-                         "obj_pnp",
-                         "obj_pnp_0",
-                         "obj_pnp_1",
-                         "obj_pnp_2",
-                         "obj_slide",
-                         "gripper_position",
-                         "gripper_rotation_roll",
-                         "gripper_rotation_pitch",
-                         "gripper_rotation_yaw",
-                         "gripper_rotation"]
+        success_keys = success_metric_keys
+        distance_keys = distance_metric_keys
 
         dict_of_success_arrays = {}
         # for k in success_keys:
@@ -892,14 +913,11 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         curr_obses, goal_obses = \
             np.array(curr_obses).reshape([-1, curr_obs.shape[0]]), \
             np.array(goal_obses).reshape([-1, goal_obs.shape[0]])
+        metrics = self.compute_all_metrics(curr_obses, goal_obses)
         for k in success_keys:
-            dict_of_success_array_k = self.get_success_metric(
-                curr_obses, goal_obses, key=k)
-            dict_of_success_arrays[k] = dict_of_success_array_k.reshape([num_paths, path_length])
+            dict_of_success_arrays[k] = metrics[k + '_success'].reshape([num_paths, path_length])
         for k in distance_keys:
-            dict_of_distance_array_k = self.get_distance_metric(
-                curr_obses, goal_obses, key=k)
-            dict_of_distance_arrays[k] = dict_of_distance_array_k.reshape([num_paths, path_length])
+            dict_of_distance_arrays[k] = metrics[k + '_distance'].reshape([num_paths, path_length])
         # end_time = time.time()
         # print("Time of batch implementation: {} sec".format(end_time - start_time))
 
@@ -945,11 +963,10 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         #         self.get_gripper_deg(curr_obs, roll_list=gripper_rotation_roll_list,
         #                              pitch_list=gripper_rotation_pitch_list, yaw_list=gripper_rotation_yaw_list)
 
-        degs = self.get_gripper_deg(curr_obses)
         gripper_rotation_roll_array, gripper_rotation_pitch_array, gripper_rotation_yaw_array = \
-            degs[:, 0].reshape([num_paths, path_length]), \
-            degs[:, 1].reshape([num_paths, path_length]), \
-            degs[:, 2].reshape([num_paths, path_length])
+            metrics['gripper_rotation_roll_deg'].reshape([num_paths, path_length]), \
+            metrics['gripper_rotation_pitch_deg'].reshape([num_paths, path_length]), \
+            metrics['gripper_rotation_yaw_deg'].reshape([num_paths, path_length])
 
         diagnostics.update(create_stats_ordered_dict(
             state_key + "/gripper_rotation_roll", gripper_rotation_roll_array))
@@ -999,10 +1016,35 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
         return diagnostics
 
-    def render_obs(self):
-        img, depth, segmentation = bullet.render(
-            self.env_obs_img_dim, self.env_obs_img_dim, self._view_matrix_obs,
-            self._projection_matrix_obs, shadow=0, gaussian_width=0, physicsClientId=self._uid)
+    def render_obs(self, out=None):
+        '''
+            `out` is an optional preallocated uint8 buffer in the observation
+            layout (CHW if transpose_image else HWC) to render into
+        '''
+        if not (self.render_depth or self.render_segmentation):
+            if self.supersample:
+                img = self._render_supersampled()
+                return bullet.box_downsample(
+                    img, self.supersample, out=out, channels_first=self._transpose_image)
+            if not self.downsample:
+                return bullet.render_rgb(
+                    self.env_obs_img_dim, self.env_obs_img_dim, self._view_matrix_obs,
+                    self._projection_matrix_obs, out=out, channels_first=self._transpose_image,
+                    shadow=0, physicsClientId=self._uid)
+
+        if self.supersample:
+            size = self.obs_img_dim * self.supersample
+            img, depth, segmentation = bullet.render(
+                size, size, self._view_matrix_obs,
+                self._projection_matrix_obs, shadow=0, gaussian_width=0, physicsClientId=self._uid)
+            img = bullet.box_downsample(img, self.supersample)
+            depth = bullet.box_downsample(np.reshape(depth, (size, size)), self.supersample)
+            ## segmentation ids can't be averaged, keep one sample per block
+            segmentation = np.reshape(segmentation, (size, size))[::self.supersample, ::self.supersample]
+        else:
+            img, depth, segmentation = bullet.render(
+                self.env_obs_img_dim, self.env_obs_img_dim, self._view_matrix_obs,
+                self._projection_matrix_obs, shadow=0, gaussian_width=0, physicsClientId=self._uid)
 
         if self.downsample:
             img = Image.fromarray(np.uint8(img), 'RGB').resize(
@@ -1033,8 +1075,17 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         if self._transpose_image:
             obs = np.transpose(obs, (2, 0, 1))
 
+        if out is not None:
+            np.copyto(out, obs)
+            return out
         return obs
 
+    def _render_supersampled(self):
+        size = self.obs_img_dim * self.supersample
+        return bullet.render_rgb(
+            size, size, self._view_matrix_obs, self._projection_matrix_obs,
+            out=self._supersample_buffer, shadow=0, physicsClientId=self._uid)
+
     def get_image(self, width, height):
         image = np.float32(self.render_obs())
         return image
@@ -1237,9 +1288,9 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         # Load Environment
         self._load_new_env_config()
         bullet.reset(physicsClientId=self._uid)
-        bullet.setup_headless(
-            self._timestep, solver_iterations=self._solver_iterations, physicsClientId=self._uid)
+        self._setup_physics()
         self._load_table()
+        self._enable_sleeping()
         self._format_state_query()
 
         if self.curr_task == None:
@@ -1269,32 +1320,29 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         hand_theta = bullet.get_link_state(self._sawyer, self._end_effector,
                                            'theta', quat_to_deg=False, physicsClientId=self._uid)
 
-        gripper_tips_distance = [np.linalg.norm(
-            left_tip_pos - right_tip_pos)]
-        end_effector_pos = self.get_end_effector_pos()
-
-        top_drawer_pos = self.get_td_handle_pos()
-
-        obj0_pos = [0, 0, 0]
-        obj1_pos = self.get_object_pos(self._small_obj)
-        obj2_pos = [0, 0, 0]
-
-        large_obj_pos = self.get_object_pos(self._large_obj)
-
-        #(hand_pos, hand_theta, gripper, td_pos, obj0_pos, obj1_pos, obj2_pos, large_obj_pos, on_top_drawer_goal, in_drawer_goal, out_of_drawer_goal)
-        #(3, 4, 1, 3, 3, 3, 3, 3, 3, 3, 3)
-        observation = np.concatenate((
-            end_effector_pos, hand_theta, gripper_tips_distance,
-            top_drawer_pos,
-            obj0_pos, obj1_pos, obj2_pos, large_obj_pos,
-            self.on_top_drawer_goal, self.in_drawer_goal, self.out_of_drawer_goal,
-        ))
-
+        ## written in place; a fresh buffer per call unless reuse_observation_buffer
+        if self.reuse_observation_buffer:
+            observation = self._observation_buffer
+        else:
+            observation = obs_layout.empty()
+        observation[obs_layout['hand_pos']] = self.get_end_effector_pos()
+        observation[obs_layout['hand_quat']] = hand_theta
+        observation[obs_layout['gripper_tips_distance']] = np.linalg.norm(left_tip_pos - right_tip_pos)
+        observation[obs_layout['td_handle_pos']] = self.get_td_handle_pos()
+        observation[obs_layout['obj0_pos']] = 0
+        observation[obs_layout['obj1_pos']] = self.get_object_pos(self._small_obj)
+        observation[obs_layout['obj2_pos']] = 0
+        observation[obs_layout['large_obj_pos']] = self.get_object_pos(self._large_obj)
+        observation[obs_layout['on_top_drawer_goal']] = self.on_top_drawer_goal
+        observation[obs_layout['in_drawer_goal']] = self.in_drawer_goal
+        observation[obs_layout['out_of_drawer_goal']] = self.out_of_drawer_goal
+
+        desired_goal = self.goal_state.copy()
         obs_dict = dict(
             observation=observation,
             state_observation=observation,
-            desired_goal=self.goal_state.copy(),
-            state_desired_goal=self.goal_state.copy(),
+            desired_goal=desired_goal,
+            state_desired_goal=desired_goal,
             achieved_goal=observation,
             state_achieved_goal=observation,
         )
@@ -1302,21 +1350,21 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         return obs_dict
 
     ### Helper Functions
-    def get_drawer_handle_future_pos(self, coeff):
-        drawer_frame_pos = get_drawer_frame_pos(
-            self._top_drawer, physicsClientId=self._uid)
+    def get_drawer_handle_future_pos(self, coeff, drawer_frame_pos=None):
+        if drawer_frame_pos is None:
+            drawer_frame_pos = self._top_drawer_handle.get_frame_pos()
         return drawer_frame_pos + coeff * np.array([np.sin(self.drawer_yaw * np.pi / 180), -np.cos(self.drawer_yaw * np.pi / 180), 0])
 
     def handle_more_open_than_closed(self):
+        drawer_frame_pos, _, drawer_handle_pos = self._top_drawer_handle.get_positions()
         drawer_handle_close_pos = self.get_drawer_handle_future_pos(
-            td_close_coeff)
+            td_close_coeff, drawer_frame_pos)
         drawer_handle_open_pos = self.get_drawer_handle_future_pos(
-            td_open_coeff)
-        drawer_handle_pos = self.get_td_handle_pos()
+            td_open_coeff, drawer_frame_pos)
         return np.linalg.norm(drawer_handle_open_pos - drawer_handle_pos) < np.linalg.norm(drawer_handle_close_pos - drawer_handle_pos)
 
     def get_td_handle_pos(self):
-        return np.array(get_drawer_handle_pos(self._top_drawer, physicsClientId=self._uid))
+        return self._top_drawer_handle.get_handle_pos()
 
     def drawer_done(self, curr_pos, goal_pos):
         # if curr_pos.size == 0 or goal_pos.size == 0:
@@ -1378,16 +1426,17 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         return self.get_quadrant(curr_pos) == self.get_quadrant(goal_pos)
 
     def get_obj_pnp_goals(self, task_info=None):
+        drawer_frame_pos, drawer_bottom_pos, _ = self._top_drawer_handle.get_positions()
+
         ## Top Drawer Goal ##
-        self.on_top_drawer_goal = np.array(
-            list(get_drawer_frame_pos(self._top_drawer, physicsClientId=self._uid)))
+        self.on_top_drawer_goal = drawer_frame_pos
         self.on_top_drawer_goal[2] = self.on_top_drawer_goal_z
         self.on_top_drawer_goal += self.configs['table_pos_offset']
         ## Randomly shift goal a little
         self.on_top_drawer_goal = self.on_top_drawer_goal
 
         ## In Drawer Goal ##
-        self.in_drawer_goal = np.array(list(get_drawer_bottom_pos(self._top_drawer, physicsClientId=self._uid))) \
+        self.in_drawer_goal = drawer_bottom_pos \
             - .025 * np.array([np.sin((self.drawer_yaw+180) * np.pi / 180), -
                               np.cos((self.drawer_yaw+180) * np.pi / 180), 0])
         self.in_drawer_goal[2] = self.in_drawer_goal_z
@@ -1397,29 +1446,13 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
         if task_info is not None and task_info.get('target_position', None) is not None and task_info.get("target_location", None) == 'out':
             self.out_of_drawer_goal = np.array(task_info['target_position'])
         else:
-            self.out_of_drawer_goal = None
-            tries = 0
-            while self.out_of_drawer_goal is None:
-                offset = 0.0
-                out_of_drawer_goal = np.array([random.uniform(gripper_bounding_x[0] + offset, gripper_bounding_x[1] - offset),
-                                              random.uniform(gripper_bounding_y[0] + offset, gripper_bounding_y[1] - offset), self.out_of_drawer_goal_z])
-                out_of_drawer_goal += self.configs['table_pos_offset']
-                drawer_frame_far = np.linalg.norm(
-                    out_of_drawer_goal[:2] - self.on_top_drawer_goal[:2]) > 0.1
-                drawer_base_far = np.linalg.norm(
-                    out_of_drawer_goal[:2] - self.in_drawer_goal[:2]) > 0.2
-                if self._large_obj is not None:
-                    large_obj_far = np.linalg.norm(
-                        out_of_drawer_goal[:2] - self.get_object_pos(self._large_obj)[:2]) > 0.15
-                else:
-                    large_obj_far = True
-                if drawer_frame_far and drawer_base_far and large_obj_far:
-                    self.out_of_drawer_goal = out_of_drawer_goal
-                else:
-                    tries += 1
-                    if tries > 25:
-                        self.out_of_drawer_goal = np.array([random.uniform(gripper_bounding_x[0] + offset, gripper_bounding_x[1] - offset), random.uniform(
-                            gripper_bounding_y[0] + offset, gripper_bounding_y[1] - offset), -0.34])
+            offset = self.configs['table_pos_offset']
+            obstacles = [(self.on_top_drawer_goal, 0.1), (self.in_drawer_goal, 0.2)]
+            if self._large_obj is not None:
+                obstacles.append((self.get_object_pos(self._large_obj), 0.15))
+            self.out_of_drawer_goal = np.append(scene_sampling.sample_clear_position(
+                np.add(gripper_bounding_x, offset[0]), np.add(gripper_bounding_y, offset[1]), obstacles),
+                self.out_of_drawer_goal_z + offset[2])
         self.out_of_drawer_goal[2] = -0.35201056
         #print(self.out_of_drawer_goal)
 
@@ -1705,7 +1738,7 @@ class SawyerDiverseDrawerPnpPush(SawyerBaseEnv):
 
         if print_stages:
             print("drawer_yaw: ", self.drawer_yaw, ", drawer_frame_pos: ",
-                  get_drawer_frame_pos(self._top_drawer, physicsClientId=self._uid))
+                  self._top_drawer_handle.get_frame_pos())
         return action, done
 
     def move_obj_pnp(self, print_stages=False):
@@ -3,15 +3,21 @@ import numpy as np
 import pybullet as p
 from gym.spaces import Box, Dict
 from collections import OrderedDict
-from roboverse.bullet.control import get_object_position
+from roboverse.bullet.control import get_object_position, reset_robot, reset_object, settle
 from roboverse.envs.sawyer_base import SawyerBaseEnv
+from roboverse.policies import DrawerPnpPushExpert
 from roboverse.bullet.misc import load_obj, deg_to_quat, get_bbox
 from roboverse.utils.misc import quat_to_deg, quat_to_deg_batch, first_nonzero
+from roboverse.utils.observation_layout import drawer_pnp_push_layout as obs_layout
+from roboverse.utils import scene_sampling
+from roboverse.utils.serialization import make_dir, hash_config
 from bullet_objects import loader, metadata
+import os
 import os.path as osp
 import importlib.util
 import random
 import pickle
+import copy
 import gym
 from roboverse.bullet.drawer_utils import *
 from roboverse.bullet.button_utils import *
@@ -21,7 +27,6 @@ import pkgutil
 # Constants
 td_close_coeff = 0.15134
 td_open_coeff = 0.2695
-td_offset_coeff = 0.0125
 
 gripper_bounding_x = [.5, .8]
 gripper_bounding_y = [-.17, .17]
@@ -54,6 +59,19 @@ goal_slide_quadrants = [
 ]
 
 
+## columns of compute_all_metrics, in the get_contextual_diagnostics order
+success_metric_keys = ["overall", "top_drawer", "obj_pnp", "obj_pnp_0", "obj_pnp_1", "obj_pnp_2",
+                       "obj_slide", "gripper_position", "gripper_rotation_roll",
+                       "gripper_rotation_pitch", "gripper_rotation_yaw", "gripper_rotation", "gripper"]
+distance_metric_keys = ["top_drawer", "obj_pnp", "obj_pnp_0", "obj_pnp_1", "obj_pnp_2", "obj_slide",
+                        "gripper_position", "gripper_rotation_roll", "gripper_rotation_pitch",
+                        "gripper_rotation_yaw", "gripper_rotation"]
+gripper_deg_keys = ["gripper_rotation_roll", "gripper_rotation_pitch", "gripper_rotation_yaw"]
+metrics_dtype = np.dtype([(k + '_success', int) for k in success_metric_keys]
+                         + [(k + '_distance', float) for k in distance_metric_keys]
+                         + [(k + '_deg', float) for k in gripper_deg_keys])
+
+
 class SawyerRigAffordancesV6(SawyerBaseEnv):
 
     def __init__(self,
@@ -142,6 +160,11 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         self.fixed_drawer_quadrant = kwargs.pop('fixed_drawer_quadrant', None)
         if self.fixed_drawer_quadrant is not None:
             assert self.fixed_drawer_quadrant == 0 or self.fixed_drawer_quadrant == 1
+        ## (linear m/s, angular rad/s) velocities below which the reset-time
+        ## object landing stops early; None always takes the fixed step counts
+        self.settle_tolerances = kwargs.pop('settle_tolerances', (1e-3, 1e-2))
+        ## load drawer_sawyer_lite, whose links above the wrist do not collide
+        self.lite_collision = kwargs.pop('lite_collision', False)
 
         self.obj_pnp = None
         self.obj_slide = None
@@ -171,20 +194,42 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         if self.fixed_task:
             assert self.reset_interval == 1
 
-        self.random_pick_offset = 0
-        self.gripper_in_right_position = False
-        self.gripper_picked_object = False
-        self.gripper_has_been_above = False
-        self.trajectory_done = False
+        self._expert_state = None
+        self._last_observation = None
         self.curr_task = None
 
+        ## skip get_reward / get_info in step (reward 0, empty info) when a collector does not use them
+        self.compute_reward_info = kwargs.pop('compute_reward_info', True)
+        ## get_observation is memoized per (simulation step count, state version)
+        self._observation_cache = None
+        self._state_version = 0
+        ## overwrite one observation buffer every tick; callers must copy observations they keep
+        self.reuse_observation_buffer = kwargs.pop('reuse_observation_buffer', False)
+        self._observation_buffer = obs_layout.empty()
+
         # Rendering
         self.downsample = kwargs.pop('downsample', False)
         self.env_obs_img_dim = kwargs.pop('env_obs_img_dim', self.obs_img_dim)
+        self.supersample = kwargs.pop('supersample', None)
+        if self.supersample:
+            assert not self.downsample
+            self._supersample_buffer = np.empty(
+                (self.obs_img_dim * self.supersample, self.obs_img_dim * self.supersample, 3), dtype=np.uint8)
 
         # Magic Grasp
         self.grasp_constraint = None
 
+        # Snapshot Reset
+        self.snapshot_reset = kwargs.pop('snapshot_reset', False)
+        self.snapshot_library_size = kwargs.pop('snapshot_library_size', 64)
+        self.settled_scene_cache_dir = kwargs.pop('settled_scene_cache_dir', None)
+        if self.settled_scene_cache_dir is not None:
+            assert self.test_env
+            self.snapshot_reset = True
+        self._snapshots = {}
+        self._layout_bodies = []
+        self._static_scene_loaded = False
+
         super().__init__(*args, **kwargs)
 
         # Need to overwrite in some cases, registration isnt working
@@ -215,15 +260,29 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         ])
 
     def _load_table(self):
+        self._load_static_scene()
+        self._load_layout()
+
+    def _load_static_scene(self):
         self._objects = {}
         self._sensors = {}
 
-        self._sawyer = bullet.objects.drawer_sawyer(physicsClientId=self._uid)
+        if self.lite_collision:
+            self._sawyer = bullet.objects.drawer_sawyer_lite(physicsClientId=self._uid)
+        else:
+            self._sawyer = bullet.objects.drawer_sawyer(physicsClientId=self._uid)
         self._table = bullet.objects.table(
             rgba=[.92, .85, .7, 1], physicsClientId=self._uid)
         self._wall = bullet.objects.wall_narrow_r(
             scale=1.0, physicsClientId=self._uid)
 
+        self._workspace = bullet.Sensor(self._sawyer,
+                                        xyz_min=self._pos_low, xyz_max=self._pos_high,
+                                        visualize=False, rgba=[0, 1, 0, .1], physicsClientId=self._uid)
+        self._end_effector = bullet.get_index_by_attribute(
+            self._sawyer, 'link_name', 'gripper_site', physicsClientId=self._uid)
+
+    def _load_layout(self):
         self.top_drawer_quadrant = random.choice([0, 1])
         if self.fixed_task == 'open_drawer':
             is_close_drawer = True
@@ -239,27 +298,19 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
             quadrant = quadrants[self.top_drawer_quadrant]
             drawer_frame_pos = np.array([quadrant[0], quadrant[1], -.34])
         else:
-            self.drawer_yaw = self.fixed_drawer_yaw if self.fixed_drawer_yaw else random.uniform(
-                0, 180)
             if self.fixed_drawer_quadrant is not None:
                 quadrant = quadrants[self.fixed_drawer_quadrant]
-                drawer_frame_pos = [quadrant[0], quadrant[1], -.34]
             else:
-                tries = 0
                 quadrant = quadrants[self.top_drawer_quadrant]
-                while (True):
-                    drawer_frame_pos = np.array(
-                        [quadrant[0], quadrant[1], -.34])
-                    drawer_handle_open_goal_pos = drawer_frame_pos + td_open_coeff * \
-                                                  np.array([np.sin(self.drawer_yaw * np.pi / 180), -
-                                                  np.cos(self.drawer_yaw * np.pi / 180), 0])
-                    if gripper_bounding_x[0] <= drawer_handle_open_goal_pos[0] <= gripper_bounding_x[1] \
-                            and gripper_bounding_y[0] <= drawer_handle_open_goal_pos[1] <= gripper_bounding_y[1]:
-                        break
-                    tries += 1
-                    if (tries > 25):
-                        self.drawer_yaw = self.fixed_drawer_yaw if self.fixed_drawer_yaw else random.uniform(
-                            0, 180)
+            drawer_frame_pos = np.array([quadrant[0], quadrant[1], -.34])
+            if self.fixed_drawer_yaw:
+                self.drawer_yaw = self.fixed_drawer_yaw
+            elif self.fixed_drawer_quadrant is not None:
+                self.drawer_yaw = random.uniform(0, 180)
+            else:
+                ## the open handle must be reachable
+                self.drawer_yaw = scene_sampling.sample_drawer_yaw(
+                    drawer_frame_pos, gripper_bounding_x, gripper_bounding_y, td_open_coeff)
 
         quat = deg_to_quat([0, 0, self.drawer_yaw], physicsClientId=self._uid)
 
@@ -267,12 +318,13 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
             quat=quat, pos=drawer_frame_pos, rgba=[
                 self.configs['object_rgbs']['drawer'][k] for k in ['frame', 'bottom_frame', 'bottom', 'handle']
             ], physicsClientId=self._uid, scale=.11)
+        self._top_drawer_handle = DrawerHandle(self._top_drawer, physicsClientId=self._uid)
         self.top_drawer_handle_can_move = True
 
-        open_drawer(self._top_drawer, 100, physicsClientId=self._uid)
+        with self._profiler.phase('slide_drawer'):
+            set_drawer_open_fraction(self._top_drawer, 1, physicsClientId=self._uid)
 
-        self.init_handle_pos = get_drawer_handle_pos(
-            self._top_drawer, physicsClientId=self._uid)[1]
+        self.init_handle_pos = self._top_drawer_handle.get_handle_pos()[1]
 
         ## Tray above top drawer
         top_drawer_tray_pos = drawer_frame_pos + np.array([0, 0, .059])
@@ -289,42 +341,37 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         self._tray = bullet.objects.tray_heavy(
             quat=quat, pos=tray_pos, scale=0.001, physicsClientId=self._uid)
 
-        if self.test_env:
-            if not self.test_env_command['drawer_open']:
-                close_drawer(self._top_drawer, 200, physicsClientId=self._uid)
-        else:
-            if is_close_drawer:
-                close_drawer(self._top_drawer, 200, physicsClientId=self._uid)
+        with self._profiler.phase('slide_drawer'):
+            if self.test_env:
+                if not self.test_env_command['drawer_open']:
+                    set_drawer_open_fraction(self._top_drawer, 0, physicsClientId=self._uid)
+            else:
+                if is_close_drawer:
+                    set_drawer_open_fraction(self._top_drawer, 0, physicsClientId=self._uid)
 
-        self._load_table_large_objs()
+        self._load_table_large_objs(drawer_frame_pos, is_close_drawer)
         self._load_table_small_objs(is_close_drawer)
 
-        self._workspace = bullet.Sensor(self._sawyer,
-                                        xyz_min=self._pos_low, xyz_max=self._pos_high,
-                                        visualize=False, rgba=[0, 1, 0, .1], physicsClientId=self._uid)
-        self._end_effector = bullet.get_index_by_attribute(
-            self._sawyer, 'link_name', 'gripper_site', physicsClientId=self._uid)
+        self._set_handle_collision_filters(reset=self.snapshot_reset)
 
+    def _set_handle_collision_filters(self, reset=False):
+        '''
+            `reset` also re-enables the pairs the current command keeps,
+            for bodies that outlive a single test env command
+        '''
         # Task 14/38: Remove collision physics between cylinder and drawer handle
-        if self.test_env and self.test_env_command.get("no_collision_handle_and_cylinder", False):
-            for idx in [2, 3, 4]:
-                p.setCollisionFilterPair(
-                    self._top_drawer,
-                    self._large_obj,
-                    idx,
-                    -1,
-                    enableCollision=False,
-                    physicsClientId=self._uid)
-
-        if self.test_env and self.test_env_command.get("no_collision_handle_and_small", False):
-            for idx in [2, 3, 4]:
-                p.setCollisionFilterPair(
-                    self._top_drawer,
-                    self._small_obj,
-                    idx,
-                    -1,
-                    enableCollision=False,
-                    physicsClientId=self._uid)
+        for flag, obj in [("no_collision_handle_and_cylinder", self._large_obj),
+                          ("no_collision_handle_and_small", self._small_obj)]:
+            disable = self.test_env and self.test_env_command.get(flag, False)
+            if disable or reset:
+                for idx in [2, 3, 4]:
+                    p.setCollisionFilterPair(
+                        self._top_drawer,
+                        obj,
+                        idx,
+                        -1,
+                        enableCollision=not disable,
+                        physicsClientId=self._uid)
 
     def _load_table_small_objs(self, is_close_drawer=False):
         ## Small Object(s)
@@ -334,38 +381,24 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                 self.test_env_command['small_object_pos_randomness']['high'])
             random_position = self.test_env_command['small_object_pos'] + np.random.uniform(
                 low=low, high=high)
+            self._small_obj_spawn_pos = random_position
             self._small_obj = self.spawn_small_object(
                 object_position=random_position, rgba=self.configs['object_rgbs']['small_object'])
         else:
-            objects_within_gripper_range = False
-            tries = 0
-            while (not objects_within_gripper_range):
-                if self._small_obj:
-                    p.removeBody(self._small_obj, physicsClientId=self._uid)
-
-                self.get_obj_pnp_goals()
-                possible_goals = [self.on_top_drawer_goal,
-                                  self.in_drawer_goal, self.out_of_drawer_goal]
-                if is_close_drawer:
-                    possible_goals = [
-                        self.on_top_drawer_goal, self.out_of_drawer_goal]
-                pos = random.choice(possible_goals)
-                self._init_objs_pos.append(pos)
-                self._small_obj = self.spawn_small_object(
-                    object_position=pos + np.array([0, 0, .1]), rgba=self.configs['object_rgbs']['small_object'])
-
-                objects_within_gripper_range = True
-                pos, _ = get_object_position(self._small_obj, physicsClientId=self._uid)
-                if not (gripper_bounding_x[0] - .04 <= pos[0] and pos[0] <= gripper_bounding_x[1] + .04
-                        and gripper_bounding_y[0] - .04 <= pos[1] and pos[1] <= gripper_bounding_y[1] + .04):
-                    objects_within_gripper_range = False
-                    break
-
-                tries += 1
-                if tries > 10:
-                    break
-
-    def _load_table_large_objs(self):
+            ## every goal lies within the gripper range by construction, so
+            ## the object is spawned once
+            self.get_obj_pnp_goals()
+            possible_goals = [self.on_top_drawer_goal,
+                              self.in_drawer_goal, self.out_of_drawer_goal]
+            if is_close_drawer:
+                possible_goals = [
+                    self.on_top_drawer_goal, self.out_of_drawer_goal]
+            pos = random.choice(possible_goals)
+            self._init_objs_pos.append(pos)
+            self._small_obj = self.spawn_small_object(
+                object_position=pos + np.array([0, 0, .1]), rgba=self.configs['object_rgbs']['small_object'])
+
+    def _load_table_large_objs(self, drawer_frame_pos, is_close_drawer=False):
         ## Large Object
         if self.test_env:
             self.large_object_quadrant = self.test_env_command['large_object_quadrant']
@@ -374,50 +407,28 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
             self._large_obj = self.spawn_large_object(
                 pos, self.configs['object_rgbs']['large_object'])
         else:
-            large_object_within_gripper_range = False
-            tries = 0
-            while (not large_object_within_gripper_range):
-                if tries > 0:
-                    p.removeBody(self._large_obj, physicsClientId=self._uid)
-                self._large_obj = None
-
-                large_object_quadrant_opts = list(
-                    set([0, 1, 2, 3]) - set([self.top_drawer_quadrant]))
-                if self.handle_more_open_than_closed():
-                    for opt in large_object_quadrant_opts:
-                        # oc = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_drawer_handle_future_pos(td_open_coeff)[:2]) < .1
-                        # cc = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_drawer_handle_future_pos(td_close_coeff)[:2]) < .1
-                        df = np.linalg.norm(np.array(slide_quadrants[opt]) - get_drawer_frame_pos(
-                            self._top_drawer, physicsClientId=self._uid)[:2]) < .15
-                        bf = np.linalg.norm(np.array(slide_quadrants[opt]) - get_drawer_bottom_pos(
-                            self._top_drawer, physicsClientId=self._uid)[:2]) < .168
-                        # so = np.linalg.norm(np.array(slide_quadrants[opt]) - self.get_object_pos(self._small_obj)[:2]) < .1
-                        if df or bf:
-                            large_object_quadrant_opts.remove(opt)
-                ## Bug where drawer in first quadrant pointing towards camera collides with large object in in fourth quadrant
-                if self.top_drawer_quadrant == 0 and self.drawer_yaw > 60 and self.drawer_yaw < 90 and 3 in large_object_quadrant_opts:
-                    large_object_quadrant_opts.remove(3)
-                if len(large_object_quadrant_opts) == 0:
-                    large_object_quadrant_opts = list(
-                        set([0, 1, 2, 3]) - set([self.top_drawer_quadrant]))
-                # print("OPTS: ", large_object_quadrant_opts)
-                self.large_object_quadrant = random.choice(
-                    large_object_quadrant_opts)
-
-                quadrant = slide_quadrants[self.large_object_quadrant]
-                pos = np.array([quadrant[0], quadrant[1], -0.3525])
-                self._large_obj = self.spawn_large_object(
-                    pos, self.configs['object_rgbs']['large_object'])
-
-                large_object_within_gripper_range = True
-                if not (gripper_bounding_x[0] - .1 <= pos[0] and pos[0] <= gripper_bounding_x[1] + .1
-                        and gripper_bounding_y[0] - .1 <= pos[1] and pos[1] <= gripper_bounding_y[1] + .1):
-                    objects_within_gripper_range = False
-                    break
-
-                tries += 1
-                if tries > 10:
-                    break
+            all_opts = np.array([opt for opt in range(4) if opt != self.top_drawer_quadrant])
+            large_object_quadrant_opts = all_opts
+            if not is_close_drawer:
+                ## keep clear of the open drawer, placed analytically before spawning
+                _, drawer_bottom_pos, _ = scene_sampling.drawer_positions(
+                    drawer_frame_pos, self.drawer_yaw, td_open_coeff)
+                opts_pos = np.array(slide_quadrants)[all_opts]
+                df = np.linalg.norm(opts_pos - drawer_frame_pos[:2], axis=1) < .15
+                bf = np.linalg.norm(opts_pos - drawer_bottom_pos[:2], axis=1) < .168
+                large_object_quadrant_opts = all_opts[~(df | bf)]
+            ## Bug where drawer in first quadrant pointing towards camera collides with large object in in fourth quadrant
+            if self.top_drawer_quadrant == 0 and 60 < self.drawer_yaw < 90:
+                large_object_quadrant_opts = large_object_quadrant_opts[large_object_quadrant_opts != 3]
+            if len(large_object_quadrant_opts) == 0:
+                large_object_quadrant_opts = all_opts
+            self.large_object_quadrant = int(random.choice(large_object_quadrant_opts))
+
+            ## slide quadrants are within the gripper range, so the object is spawned once
+            quadrant = slide_quadrants[self.large_object_quadrant]
+            pos = np.array([quadrant[0], quadrant[1], -0.3525])
+            self._large_obj = self.spawn_large_object(
+                pos, self.configs['object_rgbs']['large_object'])
 
     def sample_quat(self):
         return deg_to_quat(np.array([random.randint(0, 360), random.randint(0, 360), random.randint(0, 360)]),
@@ -433,14 +444,13 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         obj = bullet.objects.drawer_lego(
             pos=object_position, quat=q, rgba=rgba, scale=scale, physicsClientId=self._uid)
 
-        # Allow the objects to land softly in low gravity
-        p.setGravity(0, 0, -1, physicsClientId=self._uid)
-        for _ in range(100):
-            bullet.step(physicsClientId=self._uid)
-        # After landing, bring to stop
-        p.setGravity(0, 0, -10, physicsClientId=self._uid)
-        for _ in range(100):
-            bullet.step(physicsClientId=self._uid)
+        with self._profiler.phase('settle_objects'):
+            # Allow the objects to land softly in low gravity
+            p.setGravity(0, 0, -1, physicsClientId=self._uid)
+            settle([obj], 100, *(self.settle_tolerances or (None, None)), physicsClientId=self._uid)
+            # After landing, bring to stop
+            p.setGravity(0, 0, -10, physicsClientId=self._uid)
+            settle([obj], 100, *(self.settle_tolerances or (None, None)), physicsClientId=self._uid)
 
         return obj
 
@@ -488,11 +498,17 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         return np.array(delta_pos), np.array(delta_angle), gripper
 
     def step(self, *action):
+        with self._profiler.phase('step'):
+            result = self._step(*action)
+        self._last_observation = result[0]
+        return result
+
+    def _step(self, *action):
         # Get positional information
-        pos = bullet.get_link_state(
-            self._sawyer, self._end_effector, 'pos', physicsClientId=self._uid)
-        curr_angle = bullet.get_link_state(
-            self._sawyer, self._end_effector, 'theta', physicsClientId=self._uid)
+        ## from the observation of the last tick, which is memoized
+        state = self.get_observation()['state_observation']
+        pos = state[obs_layout['hand_pos']].copy()
+        curr_angle = bullet.quat_to_deg(state[obs_layout['hand_quat']], physicsClientId=self._uid)
 
         default_angle = quat_to_deg(self.default_theta)
 
@@ -505,7 +521,7 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
 
         # Magic Grasp
         if gripper > 0 and self.grasp_constraint is None and np.linalg.norm(
-                self.get_object_pos(self._small_obj)[:2] - self.get_end_effector_pos()[:2]) < 0.04:
+                state[obs_layout['obj1_pos']][:2] - state[obs_layout['hand_pos']][:2]) < 0.04:
             self.grasp_constraint = p.createConstraint(
                 parentBodyUniqueId=self._sawyer,
                 parentLinkIndex=24,
@@ -552,9 +568,14 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         self._simulate(pos, theta, gripper)
 
         # Get tuple information
-        observation = self.get_observation()
-        info = self.get_info()
-        reward = self.get_reward(info)
+        with self._profiler.phase('observation'):
+            observation = self.get_observation()
+        if not self.compute_reward_info:
+            return observation, 0.0, False, {}
+        with self._profiler.phase('info'):
+            info = self.get_info()
+        with self._profiler.phase('reward'):
+            reward = self.get_reward(info)
         done = False
 
         return observation, reward, done, info
@@ -586,18 +607,18 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
     def get_success_metric(self, curr_state, goal_state, key=None):
         success = np.zeros((curr_state.shape[0], 1), dtype=int)
         if key == "overall":
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_3 = curr_state[:, 20:23]
-            goal_pos_3 = goal_state[:, 20:23]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_3 = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos_3 = goal_state[:, obs_layout['large_obj_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = np.logical_and.reduce((
                 self.drawer_done(curr_pos, goal_pos),
                 self.obj_pnp_done(curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra),
@@ -605,53 +626,53 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                 self.obj_pnp_done(curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra),
                 self.obj_slide_done(curr_pos_3, goal_pos_3))).astype(int)
         elif key == 'top_drawer':
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
             success = self.drawer_done(curr_pos, goal_pos).astype(int)
         elif key == 'obj_pnp':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = np.logical_and.reduce((
                 self.obj_pnp_done(curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra),
                 self.obj_pnp_done(curr_pos_1, goal_pos_1, curr_pos_extra, goal_pos_extra),
                 self.obj_pnp_done(curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra))).astype(int)
         elif key == 'obj_pnp_0':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_0, goal_pos_0, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_pnp_1':
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_1, goal_pos_1, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_pnp_2':
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
-            curr_pos_extra = curr_state[:, 23:32]
-            goal_pos_extra = goal_state[:, 23:32]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
+            curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+            goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
             success = self.obj_pnp_done(
                 curr_pos_2, goal_pos_2, curr_pos_extra, goal_pos_extra).astype(int)
         elif key == 'obj_slide':
-            curr_pos = curr_state[:, 20:23]
-            goal_pos = goal_state[:, 20:23]
+            curr_pos = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos = goal_state[:, obs_layout['large_obj_pos']]
             success = self.obj_slide_done(curr_pos, goal_pos).astype(int)
         else:
-            pos = curr_state[:, 0:3]
-            goal_pos = goal_state[:, 0:3]
+            pos = curr_state[:, obs_layout['hand_pos']]
+            goal_pos = goal_state[:, obs_layout['hand_pos']]
 
-            deg = quat_to_deg_batch(curr_state[:, 3:7])
-            goal_deg = quat_to_deg_batch(goal_state[:, 3:7])
+            deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+            goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
 
             if key == 'gripper_position':
                 success = (np.linalg.norm(pos - goal_pos, axis=1, keepdims=True)
@@ -680,40 +701,40 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
     def get_distance_metric(self, curr_state, goal_state, key=None):
         distance = np.full((curr_state.shape[0], 1), np.inf, dtype=float)
         if key == 'top_drawer':
-            curr_pos = curr_state[:, 8:11]
-            goal_pos = goal_state[:, 8:11]
+            curr_pos = curr_state[:, obs_layout['td_handle_pos']]
+            goal_pos = goal_state[:, obs_layout['td_handle_pos']]
             distance = np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True)
         elif key == 'obj_pnp':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
             distance = np.linalg.norm(curr_pos_0 - goal_pos_0, axis=1, keepdims=True) + \
                        np.linalg.norm(curr_pos_1 - goal_pos_1, axis=1, keepdims=True) + \
                        np.linalg.norm(curr_pos_2 - goal_pos_2, axis=1, keepdims=True)
         elif key == 'obj_pnp_0':
-            curr_pos_0 = curr_state[:, 11:14]
-            goal_pos_0 = goal_state[:, 11:14]
+            curr_pos_0 = curr_state[:, obs_layout['obj0_pos']]
+            goal_pos_0 = goal_state[:, obs_layout['obj0_pos']]
             distance = np.linalg.norm(curr_pos_0 - goal_pos_0, axis=1, keepdims=True)
         elif key == 'obj_pnp_1':
-            curr_pos_1 = curr_state[:, 14:17]
-            goal_pos_1 = goal_state[:, 14:17]
+            curr_pos_1 = curr_state[:, obs_layout['obj1_pos']]
+            goal_pos_1 = goal_state[:, obs_layout['obj1_pos']]
             distance = np.linalg.norm(curr_pos_1 - goal_pos_1, axis=1, keepdims=True)
         elif key == 'obj_pnp_2':
-            curr_pos_2 = curr_state[:, 17:20]
-            goal_pos_2 = goal_state[:, 17:20]
+            curr_pos_2 = curr_state[:, obs_layout['obj2_pos']]
+            goal_pos_2 = goal_state[:, obs_layout['obj2_pos']]
             distance = np.linalg.norm(curr_pos_2 - goal_pos_2, axis=1, keepdims=True)
         elif key == 'obj_slide':
-            curr_pos = curr_state[:, 20:23]
-            goal_pos = goal_state[:, 20:23]
+            curr_pos = curr_state[:, obs_layout['large_obj_pos']]
+            goal_pos = goal_state[:, obs_layout['large_obj_pos']]
             distance = np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True)
         else:
-            pos = curr_state[:, 0:3]
-            goal_pos = goal_state[:, 0:3]
-            deg = quat_to_deg_batch(curr_state[:, 3:7])
-            goal_deg = quat_to_deg_batch(goal_state[:, 3:7])
+            pos = curr_state[:, obs_layout['hand_pos']]
+            goal_pos = goal_state[:, obs_layout['hand_pos']]
+            deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+            goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
 
             if key == 'gripper_position':
                 distance = np.linalg.norm(pos - goal_pos, axis=1, keepdims=True)
@@ -736,7 +757,7 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                           np.linalg.norm((360 + deg2 - deg1) % 360, axis=1, keepdims=True))
 
     def get_gripper_deg(self, curr_state):
-        quat = curr_state[:, 3:7]
+        quat = curr_state[:, obs_layout['hand_quat']]
         deg = quat_to_deg_batch(quat)
         # if roll_list is not None:
         #     roll_list.extend(deg[:, 0].tolist())
@@ -747,6 +768,62 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
 
         return deg
 
+    def compute_all_metrics(self, curr_state, goal_state):
+        '''
+            every get_success_metric and get_distance_metric column in one
+            pass, sharing the euler angles, norms and per-object successes
+            between keys. Returns a structured array of shape (N,) with the
+            fields of metrics_dtype, e.g. metrics['obj_pnp_success'],
+            metrics['gripper_rotation_distance'], metrics['gripper_rotation_yaw_deg']
+        '''
+        metrics = np.empty(curr_state.shape[0], dtype=metrics_dtype)
+        curr_pos_extra = curr_state[:, obs_layout['drawer_goals']]
+        goal_pos_extra = goal_state[:, obs_layout['drawer_goals']]
+
+        top_drawer_distance = np.linalg.norm(
+            curr_state[:, obs_layout['td_handle_pos']] - goal_state[:, obs_layout['td_handle_pos']], axis=1, keepdims=True)
+        obj_pnp_distances, obj_pnp_successes = [], []
+        for i in range(3):
+            curr_pos, goal_pos = curr_state[:, obs_layout[f'obj{i}_pos']], goal_state[:, obs_layout[f'obj{i}_pos']]
+            obj_pnp_distances.append(np.linalg.norm(curr_pos - goal_pos, axis=1, keepdims=True))
+            obj_pnp_successes.append(self.obj_pnp_done(curr_pos, goal_pos, curr_pos_extra, goal_pos_extra))
+            metrics[f'obj_pnp_{i}_success'] = obj_pnp_successes[i][:, 0]
+            metrics[f'obj_pnp_{i}_distance'] = obj_pnp_distances[i][:, 0]
+        obj_slide_success = self.obj_slide_done(curr_state[:, obs_layout['large_obj_pos']], goal_state[:, obs_layout['large_obj_pos']])
+        top_drawer_success = top_drawer_distance < self.drawer_thresh
+
+        metrics['overall_success'] = np.logical_and.reduce(
+            [top_drawer_success] + obj_pnp_successes + [obj_slide_success])[:, 0]
+        metrics['top_drawer_success'] = top_drawer_success[:, 0]
+        metrics['top_drawer_distance'] = top_drawer_distance[:, 0]
+        metrics['obj_pnp_success'] = np.logical_and.reduce(obj_pnp_successes)[:, 0]
+        metrics['obj_pnp_distance'] = (obj_pnp_distances[0] + obj_pnp_distances[1] + obj_pnp_distances[2])[:, 0]
+        metrics['obj_slide_success'] = obj_slide_success[:, 0]
+        metrics['obj_slide_distance'] = np.linalg.norm(
+            curr_state[:, obs_layout['large_obj_pos']] - goal_state[:, obs_layout['large_obj_pos']], axis=1, keepdims=True)[:, 0]
+
+        gripper_position_distance = np.linalg.norm(
+            curr_state[:, obs_layout['hand_pos']] - goal_state[:, obs_layout['hand_pos']], axis=1, keepdims=True)
+        deg = quat_to_deg_batch(curr_state[:, obs_layout['hand_quat']])
+        goal_deg = quat_to_deg_batch(goal_state[:, obs_layout['hand_quat']])
+        rotation_distances = [self.norm_deg(deg[:, [i]], goal_deg[:, [i]]) for i in range(3)]
+        gripper_rotation_distance = np.sqrt(
+            rotation_distances[0]**2 + rotation_distances[1]**2 + rotation_distances[2]**2)
+        gripper_position_success = gripper_position_distance < self.gripper_pos_thresh
+        gripper_rotation_success = gripper_rotation_distance < self.gripper_rot_thresh
+
+        metrics['gripper_position_success'] = gripper_position_success[:, 0]
+        metrics['gripper_position_distance'] = gripper_position_distance[:, 0]
+        for i, k in enumerate(gripper_deg_keys):
+            metrics[k + '_success'] = (rotation_distances[i] < self.gripper_rot_thresh)[:, 0]
+            metrics[k + '_distance'] = rotation_distances[i][:, 0]
+            metrics[k + '_deg'] = deg[:, i]
+        metrics['gripper_rotation_success'] = gripper_rotation_success[:, 0]
+        metrics['gripper_rotation_distance'] = gripper_rotation_distance[:, 0]
+        metrics['gripper_success'] = np.logical_and(gripper_position_success, gripper_rotation_success)[:, 0]
+
+        return metrics
+
     def get_contextual_diagnostics(self, paths, contexts):
         # from roboverse.utils.diagnostics import create_stats_ordered_dict
         from multiworld.envs.env_util import create_stats_ordered_dict
@@ -754,29 +831,8 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         state_key = "state_observation"
         goal_key = "state_desired_goal"
 
-        success_keys = ["overall",
-                        "top_drawer",
-                        "obj_pnp",
-                        "obj_pnp_0",
-                        "obj_pnp_1",
-                        "obj_pnp_2",
-                        "obj_slide",
-                        "gripper_position",
-                        "gripper_rotation_roll",
-                        "gripper_rotation_pitch",
-                        "gripper_rotation_yaw",
-                        "gripper_rotation", "gripper"]
-        distance_keys = ["top_drawer",
-                         "obj_pnp",
-                         "obj_pnp_0",
-                         "obj_pnp_1",
-                         "obj_pnp_2",
-                         "obj_slide",
-                         "gripper_position",
-                         "gripper_rotation_roll",
-                         "gripper_rotation_pitch",
-                         "gripper_rotation_yaw",
-                         "gripper_rotation"]
+        success_keys = success_metric_keys
+        distance_keys = distance_metric_keys
 
         dict_of_success_arrays = {}
         # for k in success_keys:
@@ -831,14 +887,11 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         curr_obses, goal_obses = \
             np.array(curr_obses).reshape([-1, curr_obs.shape[0]]), \
             np.array(goal_obses).reshape([-1, goal_obs.shape[0]])
+        metrics = self.compute_all_metrics(curr_obses, goal_obses)
         for k in success_keys:
-            dict_of_success_array_k = self.get_success_metric(
-                curr_obses, goal_obses, key=k)
-            dict_of_success_arrays[k] = dict_of_success_array_k.reshape([num_paths, path_length])
+            dict_of_success_arrays[k] = metrics[k + '_success'].reshape([num_paths, path_length])
         for k in distance_keys:
-            dict_of_distance_array_k = self.get_distance_metric(
-                curr_obses, goal_obses, key=k)
-            dict_of_distance_arrays[k] = dict_of_distance_array_k.reshape([num_paths, path_length])
+            dict_of_distance_arrays[k] = metrics[k + '_distance'].reshape([num_paths, path_length])
         # end_time = time.time()
         # print("Time of batch implementation: {} sec".format(end_time - start_time))
 
@@ -884,11 +937,10 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         #         self.get_gripper_deg(curr_obs, roll_list=gripper_rotation_roll_list,
         #                              pitch_list=gripper_rotation_pitch_list, yaw_list=gripper_rotation_yaw_list)
 
-        degs = self.get_gripper_deg(curr_obses)
         gripper_rotation_roll_array, gripper_rotation_pitch_array, gripper_rotation_yaw_array = \
-            degs[:, 0].reshape([num_paths, path_length]), \
-            degs[:, 1].reshape([num_paths, path_length]), \
-            degs[:, 2].reshape([num_paths, path_length])
+            metrics['gripper_rotation_roll_deg'].reshape([num_paths, path_length]), \
+            metrics['gripper_rotation_pitch_deg'].reshape([num_paths, path_length]), \
+            metrics['gripper_rotation_yaw_deg'].reshape([num_paths, path_length])
 
         diagnostics.update(create_stats_ordered_dict(
             state_key + "/gripper_rotation_roll", gripper_rotation_roll_array))
@@ -938,19 +990,45 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
 
         return diagnostics
 
-    def render_obs(self):
-        img, depth, segmentation = bullet.render(
+    def render_obs(self, out=None):
+        '''
+            `out` is an optional preallocated uint8 buffer in the observation
+            layout (CHW if transpose_image else HWC) to render into
+        '''
+        with self._profiler.phase('render_obs'):
+            return self._render_obs(out)
+
+    def _render_obs(self, out=None):
+        if self.supersample:
+            img = self._render_supersampled()
+            return bullet.box_downsample(
+                img, self.supersample, out=out, channels_first=self._transpose_image)
+
+        if not self.downsample:
+            return bullet.render_rgb(
+                self.env_obs_img_dim, self.env_obs_img_dim, self._view_matrix_obs,
+                self._projection_matrix_obs, out=out, channels_first=self._transpose_image,
+                shadow=0, physicsClientId=self._uid)
+
+        img = bullet.render_rgb(
             self.env_obs_img_dim, self.env_obs_img_dim, self._view_matrix_obs,
-            self._projection_matrix_obs, shadow=0, gaussian_width=0, physicsClientId=self._uid)
-
-        if self.downsample:
-            im = Image.fromarray(np.uint8(img), 'RGB').resize(
-                self.image_shape, resample=Image.ANTIALIAS)
-            img = np.array(im)
+            self._projection_matrix_obs, shadow=0, physicsClientId=self._uid)
+        im = Image.fromarray(img, 'RGB').resize(
+            self.image_shape, resample=Image.ANTIALIAS)
+        img = np.array(im)
         if self._transpose_image:
             img = np.transpose(img, (2, 0, 1))
+        if out is not None:
+            np.copyto(out, img)
+            return out
         return img
 
+    def _render_supersampled(self):
+        size = self.obs_img_dim * self.supersample
+        return bullet.render_rgb(
+            size, size, self._view_matrix_obs, self._projection_matrix_obs,
+            out=self._supersample_buffer, shadow=0, physicsClientId=self._uid)
+
     def get_image(self, width, height):
         image = np.float32(self.render_obs())
         return image
@@ -1117,8 +1195,15 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                                 init_pos,
                                 init_theta,
                                 physicsClientId=self._uid)
+        self.invalidate_observation()
 
     def reset(self):
+        with self._profiler.phase('reset'):
+            self._last_observation = self._reset()
+        return self._last_observation
+
+    def _reset(self):
+        self.invalidate_observation()
         if self.use_multiple_goals:
             self.test_env_seed = np.random.choice(
                 list(self.test_env_commands.keys()))
@@ -1140,41 +1225,223 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                 self.curr_task = self.sample_goals()
                 if self.reset_gripper_interval == self.reset_gripper_counter:
                     self.reset_gripper_counter = 0
-                    self.reset_gripper()
+                    with self._profiler.phase('reset_gripper'):
+                        self.reset_gripper()
                 return self.get_observation()
 
-        else:
-            self.trajectory_done = False
-
-        ## Null objects
-        self._small_obj = None
-        self._large_obj = None
+        with self._profiler.phase('load_scene'):
+            if self.snapshot_reset:
+                self._reset_scene_from_snapshot()
+            else:
+                ## Null objects
+                self._small_obj = None
+                self._large_obj = None
 
-        # Load Environment
-        bullet.reset(physicsClientId=self._uid)
-        bullet.setup_headless(
-            self._timestep, solver_iterations=self._solver_iterations, physicsClientId=self._uid)
-        self._load_table()
+                # Load Environment
+                bullet.reset(physicsClientId=self._uid)
+                self._setup_physics()
+                self._load_table()
+        self._enable_sleeping()
         self._format_state_query()
 
         if self.curr_task == None:
             self.curr_task = self.sample_goals()
 
-        self.reset_gripper()
+        with self._profiler.phase('reset_gripper'):
+            self.reset_gripper()
 
         # Move to starting positions
-        action = np.array([0 for i in range(self.DoF)] + [-1])
-        for _ in range(3):
-            self.step(action)
+        with self._profiler.phase('move_to_start'):
+            action = np.array([0 for i in range(self.DoF)] + [-1])
+            for _ in range(3):
+                self.step(action)
 
         return self.get_observation()
 
+    ### Snapshot Reset
+    _snapshot_attrs = ['drawer_yaw', 'top_drawer_quadrant', 'large_object_quadrant', 'init_handle_pos',
+                       '_init_objs_pos', '_small_obj_spawn_pos', 'obj_yaw',
+                       'on_top_drawer_goal', 'in_drawer_goal', 'out_of_drawer_goal']
+
+    def _reset_scene_from_snapshot(self):
+        '''
+            The static scene (sawyer, table, wall) is built once and every
+            layout put on top of it is saved with p.saveState, keyed by
+            (drawer_yaw, quadrant, drawer_open, object placement). Layouts in the
+            library are restored instead of being rebuilt; once
+            `snapshot_library_size` random layouts are saved, resets sample
+            from the library.
+        '''
+        if not self._static_scene_loaded:
+            bullet.reset(physicsClientId=self._uid)
+            self._setup_physics()
+            self._load_static_scene()
+            self._sawyer_init_joints = bullet.get_joint_positions(
+                self._sawyer, physicsClientId=self._uid)
+            self._snapshots = {}
+            self._layout_bodies = []
+            self._static_scene_loaded = True
+
+        if self.test_env:
+            key = self._get_snapshot_key()
+        elif len(self._snapshots) >= self.snapshot_library_size:
+            key = random.choice(list(self._snapshots))
+        else:
+            key = None
+
+        if key not in self._snapshots and self.settled_scene_cache_dir is not None:
+            cache_path = self._get_settled_scene_path()
+            if osp.exists(cache_path + '.bullet') and osp.exists(cache_path + '.pkl'):
+                self._load_settled_scene(cache_path)
+            else:
+                self._save_snapshot()
+                self._save_settled_scene(cache_path)
+                return
+
+        if key in self._snapshots:
+            with self._profiler.phase('restore_snapshot'):
+                self._restore_snapshot(key)
+        else:
+            self._save_snapshot()
+
+    def _get_snapshot_key(self):
+        if self.test_env:
+            return (self.test_env_command['drawer_yaw'], self.test_env_command['drawer_quadrant'],
+                    self.test_env_command['drawer_open'], tuple(self.test_env_command['small_object_pos']),
+                    self.test_env_command['large_object_quadrant'])
+        return (round(self.drawer_yaw, 4), self.top_drawer_quadrant, bool(self.handle_more_open_than_closed()),
+                tuple(np.round(self.get_object_pos(self._small_obj), 3)), self.large_object_quadrant)
+
+    def _clear_layout(self):
+        # Saved states are restored by body order, so the layout bodies are
+        # always reloaded in the same order on top of the static scene
+        for body in self._layout_bodies:
+            bullet.remove_body(body, physicsClientId=self._uid)
+        self._small_obj = None
+        self._large_obj = None
+        self._small_obj_spawn_pos = None
+        reset_robot(self._sawyer, *self._sawyer_init_joints, physicsClientId=self._uid)
+
+    def _get_snapshot_attrs(self):
+        return {attr: copy.deepcopy(getattr(self, attr, None)) for attr in self._snapshot_attrs}
+
+    def _add_snapshot(self):
+        self._layout_bodies = [self._top_drawer, self._top_drawer_tray,
+                               self._tray, self._large_obj, self._small_obj]
+        state_id = p.saveState(physicsClientId=self._uid)
+        self._snapshots[self._get_snapshot_key()] = (state_id, self._get_snapshot_attrs())
+
+    def _save_snapshot(self):
+        self._clear_layout()
+        self._load_layout()
+        self._add_snapshot()
+
+    def _get_settled_scene_path(self):
+        scene_hash = hash_config(self.test_env_command, self.configs,
+                                 self._timestep, self._solver_iterations, self.settle_tolerances,
+                                 self.lite_collision, self._sleeping, self._contact_erp)
+        return osp.join(self.settled_scene_cache_dir, 'v6_scene_{}'.format(scene_hash))
+
+    def _save_settled_scene(self, cache_path):
+        '''
+            writes through temporary files so that processes sharing the
+            cache never read a partial scene
+        '''
+        make_dir(self.settled_scene_cache_dir)
+        tmp_suffix = '.{}.tmp'.format(os.getpid())
+        with open(cache_path + '.pkl' + tmp_suffix, 'wb') as f:
+            pickle.dump(self._get_snapshot_attrs(), f)
+        bullet.save_state(cache_path + '.bullet' + tmp_suffix, physicsClientId=self._uid)
+        os.replace(cache_path + '.pkl' + tmp_suffix, cache_path + '.pkl')
+        os.replace(cache_path + '.bullet' + tmp_suffix, cache_path + '.bullet')
+
+    def _load_settled_scene(self, cache_path):
+        self._clear_layout()
+        self._load_layout_bodies()
+        bullet.load_state(cache_path + '.bullet', physicsClientId=self._uid)
+        with open(cache_path + '.pkl', 'rb') as f:
+            attrs = pickle.load(f)
+        for attr, value in attrs.items():
+            setattr(self, attr, value)
+        self._add_snapshot()
+
+    def _load_layout_bodies(self):
+        '''
+            loads the layout bodies in the same order as _load_layout but
+            without settling them, for their state to be restored afterwards
+        '''
+        self._top_drawer = bullet.objects.drawer_lightblue_base_longhandle_rgba(
+            rgba=[
+                self.configs['object_rgbs']['drawer'][k] for k in ['frame', 'bottom_frame', 'bottom', 'handle']
+            ], physicsClientId=self._uid, scale=.11)
+        self._top_drawer_handle = DrawerHandle(self._top_drawer, physicsClientId=self._uid)
+        self.top_drawer_handle_can_move = True
+        self._top_drawer_tray = bullet.objects.tray_teal_rgba(
+            rgba=self.configs['object_rgbs']['tray'], scale=0.165, physicsClientId=self._uid)
+        self._tray = bullet.objects.tray_heavy(scale=0.001, physicsClientId=self._uid)
+        self._large_obj = self.spawn_large_object(
+            np.zeros(3), self.configs['object_rgbs']['large_object'])
+        self._small_obj = bullet.objects.drawer_lego(
+            rgba=self.configs['object_rgbs']['small_object'], scale=2, physicsClientId=self._uid)
+
+    def _restore_snapshot(self, key):
+        state_id, attrs = self._snapshots[key]
+        p.restoreState(stateId=state_id, physicsClientId=self._uid)
+        self.invalidate_observation()
+        for attr, value in attrs.items():
+            setattr(self, attr, copy.deepcopy(value))
+
+        if not self.top_drawer_handle_can_move:
+            self.top_drawer_handle_can_move = True
+            p.changeDynamics(
+                bodyUniqueId=self._top_drawer,
+                linkIndex=2,
+                mass=.1,
+                physicsClientId=self._uid,
+            )
+        self._set_handle_collision_filters(reset=True)
+
+        ## Cheap pose edits: small object offset and yaw
+        pos, quat = get_object_position(self._small_obj, physicsClientId=self._uid)
+        if self.test_env:
+            low, high = np.array(self.test_env_command['small_object_pos_randomness']['low']), np.array(
+                self.test_env_command['small_object_pos_randomness']['high'])
+            spawn_pos = self.test_env_command['small_object_pos'] + np.random.uniform(
+                low=low, high=high)
+            pos[:2] += (spawn_pos - self._small_obj_spawn_pos)[:2]
+            self._small_obj_spawn_pos = spawn_pos
+        obj_yaw = random.uniform(0, 360)
+        _, quat = p.multiplyTransforms(
+            [0, 0, 0], deg_to_quat([0, 0, obj_yaw - self.obj_yaw], physicsClientId=self._uid),
+            [0, 0, 0], quat, physicsClientId=self._uid)
+        self.obj_yaw = obj_yaw
+        reset_object(self._small_obj, pos, quat, physicsClientId=self._uid)
+
     def format_obs(self, obs):
         if len(obs.shape) == 1:
             return obs.reshape(1, -1)
         return obs
 
+    def invalidate_observation(self):
+        '''
+            call after changing the scene or goals without stepping the
+            simulation (teleports, restoreState, new goals), so the next
+            get_observation queries the simulator again
+        '''
+        self._state_version += 1
+
     def get_observation(self):
+        '''
+            memoized until the next stepSimulation or invalidate_observation,
+            so reward, info and the next step reuse the step observation.
+            The returned dict is shared between callers of the same tick.
+        '''
+        key = (bullet.get_step_count(self._uid), self._state_version)
+        if self._observation_cache is None or self._observation_cache[0] != key:
+            self._observation_cache = (key, self._get_observation())
+        return self._observation_cache[1]
+
+    def _get_observation(self):
         left_tip_pos = bullet.get_link_state(
             self._sawyer, 'right_gripper_l_finger_joint', keys='pos', physicsClientId=self._uid)
         right_tip_pos = bullet.get_link_state(
@@ -1184,32 +1451,29 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         hand_theta = bullet.get_link_state(self._sawyer, self._end_effector,
                                            'theta', quat_to_deg=False, physicsClientId=self._uid)
 
-        gripper_tips_distance = [np.linalg.norm(
-            left_tip_pos - right_tip_pos)]
-        end_effector_pos = self.get_end_effector_pos()
-
-        top_drawer_pos = self.get_td_handle_pos()
-
-        obj0_pos = [0, 0, 0]
-        obj1_pos = self.get_object_pos(self._small_obj)
-        obj2_pos = [0, 0, 0]
-
-        large_obj_pos = self.get_object_pos(self._large_obj)
-
-        # (hand_pos, hand_theta, gripper, td_pos, obj0_pos, obj1_pos, obj2_pos, large_obj_pos, on_top_drawer_goal, in_drawer_goal, out_of_drawer_goal)
-        # (3, 4, 1, 3, 3, 3, 3, 3, 3, 3, 3)
-        observation = np.concatenate((
-            end_effector_pos, hand_theta, gripper_tips_distance,
-            top_drawer_pos,
-            obj0_pos, obj1_pos, obj2_pos, large_obj_pos,
-            self.on_top_drawer_goal, self.in_drawer_goal, self.out_of_drawer_goal,
-        ))
-
+        ## written in place; a fresh buffer per call unless reuse_observation_buffer
+        if self.reuse_observation_buffer:
+            observation = self._observation_buffer
+        else:
+            observation = obs_layout.empty()
+        observation[obs_layout['hand_pos']] = self.get_end_effector_pos()
+        observation[obs_layout['hand_quat']] = hand_theta
+        observation[obs_layout['gripper_tips_distance']] = np.linalg.norm(left_tip_pos - right_tip_pos)
+        observation[obs_layout['td_handle_pos']] = self.get_td_handle_pos()
+        observation[obs_layout['obj0_pos']] = 0
+        observation[obs_layout['obj1_pos']] = self.get_object_pos(self._small_obj)
+        observation[obs_layout['obj2_pos']] = 0
+        observation[obs_layout['large_obj_pos']] = self.get_object_pos(self._large_obj)
+        observation[obs_layout['on_top_drawer_goal']] = self.on_top_drawer_goal
+        observation[obs_layout['in_drawer_goal']] = self.in_drawer_goal
+        observation[obs_layout['out_of_drawer_goal']] = self.out_of_drawer_goal
+
+        desired_goal = self.goal_state.copy()
         obs_dict = dict(
             observation=observation,
             state_observation=observation,
-            desired_goal=self.goal_state.copy(),
-            state_desired_goal=self.goal_state.copy(),
+            desired_goal=desired_goal,
+            state_desired_goal=desired_goal,
             achieved_goal=observation,
             state_achieved_goal=observation,
         )
@@ -1217,23 +1481,23 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         return obs_dict
 
     ### Helper Functions
-    def get_drawer_handle_future_pos(self, coeff):
-        drawer_frame_pos = get_drawer_frame_pos(
-            self._top_drawer, physicsClientId=self._uid)
+    def get_drawer_handle_future_pos(self, coeff, drawer_frame_pos=None):
+        if drawer_frame_pos is None:
+            drawer_frame_pos = self._top_drawer_handle.get_frame_pos()
         return drawer_frame_pos + coeff * np.array(
             [np.sin(self.drawer_yaw * np.pi / 180), -np.cos(self.drawer_yaw * np.pi / 180), 0])
 
     def handle_more_open_than_closed(self):
+        drawer_frame_pos, _, drawer_handle_pos = self._top_drawer_handle.get_positions()
         drawer_handle_close_pos = self.get_drawer_handle_future_pos(
-            td_close_coeff)
+            td_close_coeff, drawer_frame_pos)
         drawer_handle_open_pos = self.get_drawer_handle_future_pos(
-            td_open_coeff)
-        drawer_handle_pos = self.get_td_handle_pos()
+            td_open_coeff, drawer_frame_pos)
         return np.linalg.norm(drawer_handle_open_pos - drawer_handle_pos) < np.linalg.norm(
             drawer_handle_close_pos - drawer_handle_pos)
 
     def get_td_handle_pos(self):
-        return np.array(get_drawer_handle_pos(self._top_drawer, physicsClientId=self._uid))
+        return self._top_drawer_handle.get_handle_pos()
 
     def drawer_done(self, curr_pos, goal_pos):
         # if curr_pos.size == 0 or goal_pos.size == 0:
@@ -1323,15 +1587,16 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
         return self.get_quadrant(curr_pos) == self.get_quadrant(goal_pos)
 
     def get_obj_pnp_goals(self, task_info=None):
+        drawer_frame_pos, drawer_bottom_pos, _ = self._top_drawer_handle.get_positions()
+
         ## Top Drawer Goal ##
-        self.on_top_drawer_goal = np.array(
-            list(get_drawer_frame_pos(self._top_drawer, physicsClientId=self._uid)))
+        self.on_top_drawer_goal = drawer_frame_pos
         self.on_top_drawer_goal[2] = -0.26951111
         ## Randomly shift goal a little
         self.on_top_drawer_goal = self.on_top_drawer_goal
 
         ## In Drawer Goal ##
-        self.in_drawer_goal = np.array(list(get_drawer_bottom_pos(self._top_drawer, physicsClientId=self._uid))) \
+        self.in_drawer_goal = drawer_bottom_pos \
                               - .025 * np.array([np.sin((self.drawer_yaw + 180) * np.pi / 180), -
         np.cos((self.drawer_yaw + 180) * np.pi / 180), 0])
         self.in_drawer_goal[2] = -0.3290406
@@ -1341,31 +1606,11 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                 "target_location", None) == 'out':
             self.out_of_drawer_goal = np.array(task_info['target_position'])
         else:
-            self.out_of_drawer_goal = None
-            tries = 0
-            while self.out_of_drawer_goal is None:
-                offset = 0.0
-                out_of_drawer_goal = np.array(
-                    [random.uniform(gripper_bounding_x[0] + offset, gripper_bounding_x[1] - offset),
-                     random.uniform(gripper_bounding_y[0] + offset, gripper_bounding_y[1] - offset), -0.34])
-                drawer_frame_far = np.linalg.norm(
-                    out_of_drawer_goal[:2] - self.on_top_drawer_goal[:2]) > 0.1
-                drawer_base_far = np.linalg.norm(
-                    out_of_drawer_goal[:2] - self.in_drawer_goal[:2]) > 0.2
-                if self._large_obj is not None:
-                    large_obj_far = np.linalg.norm(
-                        out_of_drawer_goal[:2] - self.get_object_pos(self._large_obj)[:2]) > 0.15
-                else:
-                    large_obj_far = True
-                if drawer_frame_far and drawer_base_far and large_obj_far:
-                    self.out_of_drawer_goal = out_of_drawer_goal
-                else:
-                    tries += 1
-                    if tries > 25:
-                        self.out_of_drawer_goal = np.array(
-                            [random.uniform(gripper_bounding_x[0] + offset, gripper_bounding_x[1] - offset),
-                             random.uniform(
-                                 gripper_bounding_y[0] + offset, gripper_bounding_y[1] - offset), -0.34])
+            obstacles = [(self.on_top_drawer_goal, 0.1), (self.in_drawer_goal, 0.2)]
+            if self._large_obj is not None:
+                obstacles.append((self.get_object_pos(self._large_obj), 0.15))
+            self.out_of_drawer_goal = np.append(scene_sampling.sample_clear_position(
+                gripper_bounding_x, gripper_bounding_y, obstacles), -0.34)
         self.out_of_drawer_goal[2] = -0.35201056
         # print(self.out_of_drawer_goal)
 
@@ -1523,6 +1768,7 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
                 self.on_top_drawer_goal, self.in_drawer_goal, self.out_of_drawer_goal,
             ]
         )
+        self.invalidate_observation()
 
     def get_object_pos(self, obj):
         return np.array(bullet.get_body_info(obj, quat_to_deg=False, physicsClientId=self._uid)['pos'])
@@ -1534,331 +1780,35 @@ class SawyerRigAffordancesV6(SawyerBaseEnv):
 
     ### DEMO COLLECTING FUNCTIONS BEYOND THIS POINT ###
     def demo_reset(self):
-        self.timestep = 0
-        self.gripper_action = np.array(
-            [random.uniform(-1, 1), random.uniform(-1, 1), 0, 0, -1])
-        self.gripper_action_num_ts = np.random.randint(0, 16)
-        self.grip = -1.
+        self._expert = DrawerPnpPushExpert(self.expert_policy_std, self.demo_num_ts)
+        self._expert_state = self._expert.initial_state(state=self._expert_state)
         reset_obs = self.reset()
 
         # print('----Initial----')
-        # self.get_reward(print_stats=True)
+        # self.get_reward(print_stages=True)
         return reset_obs
 
-    def get_demo_action(self, first_timestep=False, return_done=False):
-        if self.demo_num_ts:
-            offset = self.demo_num_ts - self.timestep
-        else:
-            offset = 999
-        task_dict = {
-            'move_drawer': lambda: self.move_drawer(),
-            'move_obj_pnp': lambda: self.move_obj_pnp(),
-            'move_obj_slide': lambda: self.move_obj_slide(),
+    def get_expert_task(self):
+        '''
+            the task parameters DrawerPnpPushExpert needs on top of the state
+            observation; the goals of tasks not sampled yet are zeros
+        '''
+        return {
+            'task': self.curr_task,
+            'drawer_yaw': self.drawer_yaw,
+            'td_goal': getattr(self, 'td_goal', np.zeros(3)),
+            'obj_pnp_goal': getattr(self, 'obj_pnp_goal', np.zeros(3)),
+            'obj_slide_goal': getattr(self, 'obj_slide_goal', np.zeros(3)),
         }
-        action, done = task_dict[self.curr_task]()
-
-        if first_timestep:
-            self.trajectory_done = False
-            self.gripper_has_been_above = False
-            self.gripper_in_right_position = False
-            self.gripper_picked_object = False
-            self.random_pick_offset = random.uniform(-.04, .04)
-            action = np.array([0, 0, 1, 0])
-        if done:
-            if self.trajectory_done == False:
-                self.trajectory_done = True
-
-        if offset < self.gripper_action_num_ts:
-            action = self.gripper_action
-        elif offset >= self.gripper_action_num_ts and offset < self.gripper_action_num_ts + 10:
-            action = np.array([0, 0, 1, 0, -1])
-            if self.trajectory_done == False:
-                self.trajectory_done = True
-        elif self.trajectory_done:
-            action = np.array([0, 0, 1, 0, -1])
-        else:
-            action = np.append(action, [self.grip])
-            action = np.random.normal(action, self.expert_policy_std)
 
-        action = np.clip(action, a_min=-1, a_max=1)
-        self.timestep += 1
+    def get_demo_action(self, first_timestep=False, return_done=False):
+        ## the observation of the last step or reset is the current state
+        if self._last_observation is None:
+            self._last_observation = self.get_observation()
+        action, done, self._expert_state = self._expert.get_action(
+            self._last_observation['state_observation'], self.get_expert_task(),
+            self._expert_state, first_timestep=first_timestep)
 
         if return_done:
             return action, done
         return action
-
-    def move_drawer(self, print_stages=False):
-        self.grip = -1
-        ee_pos = self.get_end_effector_pos()
-        ee_yaw = self.get_end_effector_theta()[2]
-
-        drawer_handle_pos = self.get_td_handle_pos()
-        # drawer_frame_pos = get_drawer_frame_pos(self._top_drawer, physicsClientId=self._uid)
-        # print((drawer_handle_pos - drawer_frame_pos)/np.array([np.sin((self.drawer_yaw+180) * np.pi / 180) , -np.cos((self.drawer_yaw+180) * np.pi / 180), 0]))
-        ee_early_stage_goal_pos = drawer_handle_pos - td_offset_coeff * \
-                                  np.array([np.sin((self.drawer_yaw + 180) * np.pi / 180), -
-                                  np.cos((self.drawer_yaw + 180) * np.pi / 180), 0])
-
-        if 0 <= self.drawer_yaw < 90:
-            goal_ee_yaw = self.drawer_yaw
-        elif 90 <= self.drawer_yaw < 270:
-            goal_ee_yaw = self.drawer_yaw - 180
-        else:
-            goal_ee_yaw = self.drawer_yaw - 360
-
-        gripper_yaw_aligned = np.linalg.norm(goal_ee_yaw - ee_yaw) > 5
-        gripper_pos_xy_aligned = np.linalg.norm(
-            ee_early_stage_goal_pos[:2] - ee_pos[:2]) < .01
-        gripper_pos_z_aligned = np.linalg.norm(
-            ee_early_stage_goal_pos[2] - ee_pos[2]) < .0175
-        gripper_above = ee_pos[2] >= -0.105
-        if not self.gripper_has_been_above and gripper_above:
-            self.gripper_has_been_above = True
-        done = np.linalg.norm(self.td_goal - drawer_handle_pos) < 0.01
-
-        # Stage 1: if gripper is too low, raise it
-        if not self.gripper_in_right_position and not self.gripper_has_been_above:
-            if print_stages:
-                print('Stage 1')
-            action = np.array([0, 0, 1, 0])
-        # Do stage 2 and 3 at the same time
-        elif not self.gripper_in_right_position and (gripper_yaw_aligned or not gripper_pos_xy_aligned):
-            # Stage 2: align gripper yaw
-            action = np.zeros((4,))
-            if gripper_yaw_aligned:
-                if print_stages:
-                    print('Stage 2')
-                if goal_ee_yaw > ee_yaw:
-                    action[3] = 1
-                else:
-                    action[3] = -1
-            # Stage 3: align gripper position with handle position
-            if not gripper_pos_xy_aligned:
-                if print_stages:
-                    print('Stage 3')
-                xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
-                action[0] = xy_action[0]
-                action[1] = xy_action[1]
-        # Stage 4: lower gripper around handle
-        elif not self.gripper_in_right_position and (gripper_pos_xy_aligned and not gripper_pos_z_aligned):
-            if print_stages:
-                print('Stage 4')
-            xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
-            action = np.array([xy_action[0], xy_action[1], xy_action[2] * 3, 0])
-        # Stage 5: open/close drawer
-        else:
-            if print_stages:
-                print('Stage 5')
-            if not self.gripper_in_right_position:
-                self.gripper_in_right_position = True
-            xy_action = self.td_goal - drawer_handle_pos
-            s = 12  # 12 if self.drawer_skill == 'open' else 12
-            action = s * np.array([xy_action[0], xy_action[1], 0, 0])
-            # if self.drawer_skill == 'open':
-            #     action *= 1.0
-
-        if done:
-            action = np.array([0, 0, 1, 0])
-
-        if print_stages:
-            print("drawer_yaw: ", self.drawer_yaw, ", drawer_frame_pos: ",
-                  get_drawer_frame_pos(self._top_drawer, physicsClientId=self._uid))
-        return action, done
-
-    def move_obj_pnp(self, print_stages=False):
-        self.goal_ee_yaw = 0
-        align_cutoff = .035 if np.linalg.norm(self.get_object_pos(
-            self._small_obj)[:2] - self.in_drawer_goal[:2]) < .02 else .05
-        enclose_cutoff = .05
-        cutoff = .025
-
-        ee_pos = self.get_end_effector_pos()
-        target_pos = self.get_object_pos(self.obj_pnp)
-        aligned = np.linalg.norm(target_pos[:2] - ee_pos[:2]) < align_cutoff
-        enclosed = np.linalg.norm(target_pos[2] - ee_pos[2]) < enclose_cutoff
-        done_xy = np.linalg.norm(
-            target_pos[:2] - self.obj_pnp_goal[:2]) < cutoff
-        done = done_xy
-        above = ee_pos[2] >= -0.125
-
-        target_pos += np.array([self.random_pick_offset, 0, 0])
-
-        ee_yaw = self.get_end_effector_theta()[2]
-        self.goal_ee_yaw = self.goal_ee_yaw % 360
-        if 0 <= self.goal_ee_yaw < 90:
-            goal_ee_yaw = self.goal_ee_yaw
-        elif 90 <= self.goal_ee_yaw < 270:
-            goal_ee_yaw = self.goal_ee_yaw - 180
-        else:
-            goal_ee_yaw = self.goal_ee_yaw - 360
-        # goal_ee_yaw_opts = [self.goal_ee_yaw, self.goal_ee_yaw - 180, self.goal_ee_yaw + 180]
-        # goal_ee_yaw = min(goal_ee_yaw_opts, key=lambda x : np.linalg.norm(x - ee_yaw))
-        # if np.linalg.norm(self.goal_ee_yaw - ee_yaw) < np.linalg.norm(self.goal_ee_yaw - 180 + ee_yaw):
-        #     goal_ee_yaw = self.goal_ee_yaw
-        # else:
-        #     goal_ee_yaw = self.goal_ee_yaw - 180
-        # if 0 <= self.goal_ee_yaw < 90:
-        #     goal_ee_yaw = self.goal_ee_yaw - 90
-        # elif 90 <= self.goal_ee_yaw < 270:
-        #     goal_ee_yaw = self.goal_ee_yaw - 90
-        # else:
-        #     goal_ee_yaw = self.goal_ee_yaw - 360 + 90
-        gripper_yaw_aligned = np.linalg.norm(goal_ee_yaw - ee_yaw) > 10
-
-        if not aligned and not above:
-            if print_stages:
-                print('Stage 1')
-            action = np.array([0., 0., 1., 0.])
-            self.grip = -1.
-
-            if goal_ee_yaw > ee_yaw:
-                action[3] = 1
-            else:
-                action[3] = -1
-        elif (not self.gripper_picked_object and gripper_yaw_aligned) or not aligned:
-            action = np.zeros((4,))
-            if not self.gripper_picked_object and gripper_yaw_aligned:
-                if print_stages:
-                    print('Stage 2')
-                if goal_ee_yaw > ee_yaw:
-                    action[3] = 1
-                else:
-                    action[3] = -1
-            if not aligned:
-                if print_stages:
-                    print('Stage 3')
-                diff = (target_pos - ee_pos) * 3.0 * 2.0
-                action[0] = diff[0]
-                action[1] = diff[1]
-                self.grip = -1.
-        elif aligned and not enclosed and self.grip < 1:
-            if print_stages:
-                print('Stage 4')
-            diff = target_pos - ee_pos
-            action = np.array([diff[0], diff[1], diff[2], 0.])
-            action[2] -= 0.03
-            action *= 3.0
-            action[2] *= 1.5
-            self.grip = -1.
-        elif enclosed and self.grip < 1:
-            if print_stages:
-                print('Stage 5')
-            if not self.gripper_picked_object:
-                self.gripper_picked_object = True
-            diff = target_pos - ee_pos
-            action = np.array([diff[0], diff[1], diff[2], 0.])
-            action[2] -= 0.03
-            action *= 3.0
-            action[2] *= 2.0
-            self.grip += 0.5
-        elif not self.gripper_in_right_position and not above:
-            if print_stages:
-                print('Stage 6')
-            action = np.array([0., 0., 1., 0.])
-            self.grip = 1.
-        elif not done_xy:
-            if not self.gripper_in_right_position:
-                self.gripper_in_right_position = True
-            if print_stages:
-                print('Stage 7')
-            diff = self.obj_pnp_goal - ee_pos
-            action = np.array([diff[0], diff[1], diff[2], 0.])
-            action[2] = 0
-            action *= 3.0
-            self.grip = 1.
-        else:
-            if print_stages:
-                print('Stage 9')
-            action = np.array([0., 0., 0., 0.])
-            self.grip = -1
-
-        # print(aligned, above, done, enclosed, self.grip)
-        # print(target_pos, ee_pos, goal)
-
-        return action, done
-
-    def move_obj_slide(self, print_stages=False):
-        ee_pos = self.get_end_effector_pos()
-        ee_yaw = self.get_end_effector_theta()[2]
-        obj_pos = self.get_object_pos(self.obj_slide)
-        goal_pos = self.obj_slide_goal
-
-        vec = goal_pos[:2] - obj_pos[:2]
-        direction = (np.arctan2(vec[1], vec[0]) * 180 / np.pi + 360 + 90) % 360
-        goal_ee_yaw_opts = [direction, direction - 180,
-                            direction + 180, direction - 360, direction + 360]
-        goal_ee_yaw_opts = [o + 90 for o in goal_ee_yaw_opts]
-        goal_ee_yaw = min(goal_ee_yaw_opts,
-                          key=lambda x: np.linalg.norm(x - ee_yaw))
-
-        # if 0 <= direction < 90:
-        #     goal_ee_yaw = direction
-        # elif 90 <= direction < 270:
-        #     goal_ee_yaw = direction - 180
-        # else:
-        #     goal_ee_yaw = direction - 360
-        ee_early_stage_goal_pos = obj_pos - 0.11 * \
-                                  np.array([np.sin(direction * np.pi / 180), -
-                                  np.cos(direction * np.pi / 180), 0])
-
-        gripper_yaw_aligned = np.linalg.norm(goal_ee_yaw - ee_yaw) > 5
-        gripper_pos_xy_aligned = np.linalg.norm(
-            ee_early_stage_goal_pos[:2] - ee_pos[:2]) < .005
-        gripper_pos_z_aligned = np.linalg.norm(
-            ee_early_stage_goal_pos[2] - ee_pos[2]) < .0375
-        gripper_above = ee_pos[2] >= -0.105
-        if not self.gripper_has_been_above and gripper_above:
-            self.gripper_has_been_above = True
-
-        done_xy = np.linalg.norm(obj_pos[:2] - goal_pos[:2]) < 0.05
-        done = done_xy and np.linalg.norm(obj_pos[2] - goal_pos[2]) < 0.03
-
-        # Stage 1: if gripper is too low, raise it
-        if not self.gripper_has_been_above:
-            if print_stages:
-                print('Stage 1')
-            action = np.array([0, 0, 1, 0])
-
-            if goal_ee_yaw > ee_yaw:
-                action[3] = 1
-            else:
-                action[3] = -1
-        elif (not self.gripper_in_right_position and gripper_yaw_aligned) or (
-                not self.gripper_in_right_position and not gripper_pos_xy_aligned):
-            # Stage 2: align gripper yaw
-            action = np.zeros((4,))
-            if gripper_yaw_aligned:  # not self.gripper_in_right_position and gripper_yaw_aligned:
-                if print_stages:
-                    print('Stage 2')
-                if goal_ee_yaw > ee_yaw:
-                    action[3] = 1
-                else:
-                    action[3] = -1
-            # Stage 3: align gripper position with handle position
-            if not self.gripper_in_right_position and not gripper_pos_xy_aligned:  # not self.gripper_in_right_position and
-                if print_stages:
-                    print('Stage 3')
-                xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
-                action[0] = xy_action[0]
-                action[1] = xy_action[1]
-                # print(action, np.linalg.norm(ee_early_stage_goal_pos[:2] - ee_pos[:2]))
-        # Stage 4: lower gripper around handle
-        elif gripper_pos_xy_aligned and not gripper_pos_z_aligned:  # not self.gripper_in_right_position and
-            if print_stages:
-                print('Stage 4')
-            xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
-            action = np.array([xy_action[0], xy_action[1], xy_action[2] * 3, 0])
-        # Stage 5: open/close drawer
-        else:
-            if not self.gripper_in_right_position:
-                self.gripper_in_right_position = True
-            if print_stages:
-                print('Stage 5')
-            xy_action = goal_pos - obj_pos
-            xy_action *= 6
-            action = np.array([xy_action[0], xy_action[1], 0, 0])
-
-        if done:
-            action = np.array([0, 0, 1, 0])
-
-        return action, done
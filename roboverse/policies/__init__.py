@@ -0,0 +1 @@
+from .drawer_pnp_push import DrawerPnpPushExpert
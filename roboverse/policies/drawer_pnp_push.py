@@ -0,0 +1,354 @@
+import random
+
+import numpy as np
+import pybullet as p
+
+from roboverse.utils.observation_layout import drawer_pnp_push_layout as obs_layout
+
+## slices of the 32-dim state observation of SawyerRigAffordancesV6
+EE_POS = obs_layout['hand_pos']
+EE_QUAT = obs_layout['hand_quat']
+TD_HANDLE_POS = obs_layout['td_handle_pos']
+SMALL_OBJ_POS = obs_layout['obj1_pos']
+LARGE_OBJ_POS = obs_layout['large_obj_pos']
+IN_DRAWER_GOAL = obs_layout['in_drawer_goal']
+
+## td_offset_coeff of sawyer_rig_affordances_v6
+TD_OFFSET_COEFF = 0.0125
+LIFT_ACTION = np.array([0, 0, 1, 0, -1])
+
+
+def norm(x):
+    '''
+        row-wise l2 norm with the same reduction as np.linalg.norm on a
+        single vector, so batched and per-env experts agree exactly
+    '''
+    return np.sqrt((x[:, None, :] @ x[:, :, None])[:, 0, 0])
+
+
+def get_ee_yaw(quats):
+    '''
+        end effector yaw in degrees, as returned by get_end_effector_theta
+    '''
+    return np.array([p.getEulerFromQuaternion(quat)[2] * 180. / np.pi for quat in quats])
+
+
+def yaw_sign(goal_yaw, yaw):
+    return np.where(goal_yaw > yaw, 1., -1.)
+
+
+def move_drawer(obs, ee_pos, ee_yaw, task, state):
+    drawer_yaw = task['drawer_yaw']
+    drawer_handle_pos = obs[:, TD_HANDLE_POS]
+    drawer_yaw_rad = (drawer_yaw + 180) * np.pi / 180
+    ee_early_stage_goal_pos = drawer_handle_pos - TD_OFFSET_COEFF * np.stack(
+        [np.sin(drawer_yaw_rad), -np.cos(drawer_yaw_rad), np.zeros(len(obs))], axis=1)
+
+    goal_ee_yaw = np.where((0 <= drawer_yaw) & (drawer_yaw < 90), drawer_yaw,
+                           np.where((90 <= drawer_yaw) & (drawer_yaw < 270), drawer_yaw - 180, drawer_yaw - 360))
+
+    ## True while the yaw is NOT aligned (name kept from the env's expert)
+    gripper_yaw_aligned = np.abs(goal_ee_yaw - ee_yaw) > 5
+    gripper_pos_xy_aligned = norm(ee_early_stage_goal_pos[:, :2] - ee_pos[:, :2]) < .01
+    gripper_pos_z_aligned = np.abs(ee_early_stage_goal_pos[:, 2] - ee_pos[:, 2]) < .0175
+    gripper_above = ee_pos[:, 2] >= -0.105
+    has_been_above = state['gripper_has_been_above'] | gripper_above
+    in_right_position = state['gripper_in_right_position']
+    done = norm(task['td_goal'] - drawer_handle_pos) < 0.01
+
+    action = np.zeros((len(obs), 4))
+    # Stage 1: if gripper is too low, raise it
+    stage_1 = ~in_right_position & ~has_been_above
+    # Do stage 2 and 3 at the same time
+    stage_23 = ~stage_1 & ~in_right_position & (gripper_yaw_aligned | ~gripper_pos_xy_aligned)
+    # Stage 4: lower gripper around handle
+    stage_4 = ~stage_1 & ~stage_23 & ~in_right_position & gripper_pos_xy_aligned & ~gripper_pos_z_aligned
+    # Stage 5: open/close drawer
+    stage_5 = ~stage_1 & ~stage_23 & ~stage_4
+
+    action[stage_1, 2] = 1
+    # Stage 2: align gripper yaw
+    stage_2 = stage_23 & gripper_yaw_aligned
+    action[stage_2, 3] = yaw_sign(goal_ee_yaw, ee_yaw)[stage_2]
+    # Stage 3: align gripper position with handle position
+    stage_3 = stage_23 & ~gripper_pos_xy_aligned
+    xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
+    action[stage_3, :2] = xy_action[stage_3, :2]
+    action[stage_4, :2] = xy_action[stage_4, :2]
+    action[stage_4, 2] = xy_action[stage_4, 2] * 3
+    action[stage_5, :2] = 12 * (task['td_goal'] - drawer_handle_pos)[stage_5, :2]
+
+    action[done] = [0, 0, 1, 0]
+    updates = {
+        'grip': np.full(len(obs), -1.),
+        'gripper_has_been_above': has_been_above,
+        'gripper_in_right_position': in_right_position | stage_5,
+    }
+    return action, done, updates
+
+
+def move_obj_pnp(obs, ee_pos, ee_yaw, task, state):
+    obj_pos = obs[:, SMALL_OBJ_POS]
+    in_drawer_goal = obs[:, IN_DRAWER_GOAL]
+    obj_pnp_goal = task['obj_pnp_goal']
+    align_cutoff = np.where(norm(obj_pos[:, :2] - in_drawer_goal[:, :2]) < .02, .035, .05)
+    enclose_cutoff = .05
+    cutoff = .025
+
+    target_pos = obj_pos.copy()
+    aligned = norm(target_pos[:, :2] - ee_pos[:, :2]) < align_cutoff
+    enclosed = np.abs(target_pos[:, 2] - ee_pos[:, 2]) < enclose_cutoff
+    done_xy = norm(target_pos[:, :2] - obj_pnp_goal[:, :2]) < cutoff
+    done = done_xy
+    above = ee_pos[:, 2] >= -0.125
+
+    target_pos[:, 0] += state['random_pick_offset']
+
+    goal_ee_yaw = 0
+    ## True while the yaw is NOT aligned (name kept from the env's expert)
+    gripper_yaw_aligned = np.abs(goal_ee_yaw - ee_yaw) > 10
+
+    grip = state['grip'].copy()
+    picked_object = state['gripper_picked_object']
+    in_right_position = state['gripper_in_right_position']
+
+    stage_1 = ~aligned & ~above
+    stage_23 = ~stage_1 & ((~picked_object & gripper_yaw_aligned) | ~aligned)
+    rest = ~stage_1 & ~stage_23
+    stage_4 = rest & aligned & ~enclosed & (grip < 1)
+    stage_5 = rest & ~stage_4 & enclosed & (grip < 1)
+    rest = rest & ~stage_4 & ~stage_5
+    stage_6 = rest & ~in_right_position & ~above
+    stage_7 = rest & ~stage_6 & ~done_xy
+    stage_9 = rest & ~stage_6 & ~stage_7
+
+    action = np.zeros((len(obs), 4))
+    sign = yaw_sign(goal_ee_yaw, ee_yaw)
+    action[stage_1, 2] = 1.
+    action[stage_1, 3] = sign[stage_1]
+    grip[stage_1] = -1.
+
+    # Stage 2
+    stage_2 = stage_23 & ~picked_object & gripper_yaw_aligned
+    action[stage_2, 3] = sign[stage_2]
+    # Stage 3
+    stage_3 = stage_23 & ~aligned
+    diff = (target_pos - ee_pos) * 3.0 * 2.0
+    action[stage_3, :2] = diff[stage_3, :2]
+    grip[stage_3] = -1.
+
+    # Stage 4 and 5
+    diff = target_pos - ee_pos
+    descend = np.concatenate([diff[:, :2], diff[:, 2:] - 0.03, np.zeros((len(obs), 1))], axis=1) * 3.0
+    action[stage_4] = descend[stage_4]
+    action[stage_4, 2] *= 1.5
+    grip[stage_4] = -1.
+    action[stage_5] = descend[stage_5]
+    action[stage_5, 2] *= 2.0
+    grip[stage_5] += 0.5
+
+    # Stage 6
+    action[stage_6, 2] = 1.
+    grip[stage_6] = 1.
+
+    # Stage 7
+    diff = obj_pnp_goal - ee_pos
+    action[stage_7, :2] = diff[stage_7, :2] * 3.0
+    grip[stage_7] = 1.
+
+    # Stage 9
+    grip[stage_9] = -1
+
+    updates = {
+        'grip': grip,
+        'gripper_picked_object': picked_object | stage_5,
+        'gripper_in_right_position': in_right_position | stage_7,
+    }
+    return action, done, updates
+
+
+def move_obj_slide(obs, ee_pos, ee_yaw, task, state):
+    obj_pos = obs[:, LARGE_OBJ_POS]
+    goal_pos = task['obj_slide_goal']
+
+    vec = goal_pos[:, :2] - obj_pos[:, :2]
+    direction = (np.arctan2(vec[:, 1], vec[:, 0]) * 180 / np.pi + 360 + 90) % 360
+    goal_ee_yaw_opts = np.stack([direction, direction - 180, direction + 180,
+                                 direction - 360, direction + 360], axis=1) + 90
+    goal_ee_yaw = goal_ee_yaw_opts[
+        np.arange(len(obs)), np.argmin(np.abs(goal_ee_yaw_opts - ee_yaw[:, None]), axis=1)]
+
+    direction_rad = direction * np.pi / 180
+    ee_early_stage_goal_pos = obj_pos - 0.11 * np.stack(
+        [np.sin(direction_rad), -np.cos(direction_rad), np.zeros(len(obs))], axis=1)
+
+    ## True while the yaw is NOT aligned (name kept from the env's expert)
+    gripper_yaw_aligned = np.abs(goal_ee_yaw - ee_yaw) > 5
+    gripper_pos_xy_aligned = norm(ee_early_stage_goal_pos[:, :2] - ee_pos[:, :2]) < .005
+    gripper_pos_z_aligned = np.abs(ee_early_stage_goal_pos[:, 2] - ee_pos[:, 2]) < .0375
+    gripper_above = ee_pos[:, 2] >= -0.105
+    has_been_above = state['gripper_has_been_above'] | gripper_above
+    in_right_position = state['gripper_in_right_position']
+
+    done_xy = norm(obj_pos[:, :2] - goal_pos[:, :2]) < 0.05
+    done = done_xy & (np.abs(obj_pos[:, 2] - goal_pos[:, 2]) < 0.03)
+
+    # Stage 1: if gripper is too low, raise it
+    stage_1 = ~has_been_above
+    stage_23 = ~stage_1 & ((~in_right_position & gripper_yaw_aligned) |
+                           (~in_right_position & ~gripper_pos_xy_aligned))
+    # Stage 4: lower gripper around handle
+    stage_4 = ~stage_1 & ~stage_23 & gripper_pos_xy_aligned & ~gripper_pos_z_aligned
+    # Stage 5: push the object
+    stage_5 = ~stage_1 & ~stage_23 & ~stage_4
+
+    action = np.zeros((len(obs), 4))
+    sign = yaw_sign(goal_ee_yaw, ee_yaw)
+    action[stage_1, 2] = 1
+    action[stage_1, 3] = sign[stage_1]
+    # Stage 2: align gripper yaw
+    stage_2 = stage_23 & gripper_yaw_aligned
+    action[stage_2, 3] = sign[stage_2]
+    # Stage 3: align gripper position with object position
+    stage_3 = stage_23 & ~in_right_position & ~gripper_pos_xy_aligned
+    xy_action = (ee_early_stage_goal_pos - ee_pos) * 6 * 2
+    action[stage_3, :2] = xy_action[stage_3, :2]
+    action[stage_4, :2] = xy_action[stage_4, :2]
+    action[stage_4, 2] = xy_action[stage_4, 2] * 3
+    action[stage_5, :2] = ((goal_pos - obj_pos) * 6)[stage_5, :2]
+
+    action[done] = [0, 0, 1, 0]
+    updates = {
+        'gripper_has_been_above': has_been_above,
+        'gripper_in_right_position': in_right_position | stage_5,
+    }
+    return action, done, updates
+
+
+TASK_FNS = {
+    'move_drawer': move_drawer,
+    'move_obj_pnp': move_obj_pnp,
+    'move_obj_slide': move_obj_slide,
+}
+
+
+class DrawerPnpPushExpert:
+    '''
+        The scripted expert of SawyerRigAffordancesV6 as a policy of the
+        32-dim state observation and the task parameters of each env
+        (see SawyerRigAffordancesV6.get_expert_task), so it makes no
+        simulator queries and can drive a batch of envs at once:
+
+            state = expert.initial_state(num_envs)
+            task = expert.stack_tasks([env.get_expert_task() for env in envs])
+            actions, dones, state = expert.get_actions(obs, task, state, first_timestep)
+
+        The policy holds no per-episode data; its stage flags, gripper
+        command and random perturbations live in `state`, a dict of arrays
+        with one row per env.
+    '''
+
+    def __init__(self, expert_policy_std=0.1, demo_num_ts=None):
+        self.expert_policy_std = expert_policy_std
+        self.demo_num_ts = demo_num_ts
+
+    def initial_state(self, num_envs=1, state=None):
+        '''
+            samples the random gripper action played at the end of each
+            episode, as SawyerRigAffordancesV6.demo_reset did. The stage
+            flags and pick offset of the previous episode's `state` are
+            kept: the first get_actions call still computes its (discarded)
+            action with them before first_timestep clears them.
+        '''
+        gripper_action = np.zeros((num_envs, 5))
+        gripper_action_num_ts = np.zeros(num_envs, dtype=int)
+        for i in range(num_envs):
+            gripper_action[i] = [random.uniform(-1, 1), random.uniform(-1, 1), 0, 0, -1]
+            gripper_action_num_ts[i] = np.random.randint(0, 16)
+        initial_state = {
+            'timestep': np.zeros(num_envs, dtype=int),
+            'grip': np.full(num_envs, -1.),
+            'gripper_has_been_above': np.zeros(num_envs, dtype=bool),
+            'gripper_in_right_position': np.zeros(num_envs, dtype=bool),
+            'gripper_picked_object': np.zeros(num_envs, dtype=bool),
+            'trajectory_done': np.zeros(num_envs, dtype=bool),
+            'random_pick_offset': np.zeros(num_envs),
+            'gripper_action': gripper_action,
+            'gripper_action_num_ts': gripper_action_num_ts,
+        }
+        if state is not None:
+            for key in ['gripper_has_been_above', 'gripper_in_right_position',
+                        'gripper_picked_object', 'trajectory_done', 'random_pick_offset']:
+                initial_state[key] = state[key].copy()
+        return initial_state
+
+    @staticmethod
+    def stack_tasks(tasks):
+        return {key: np.array([task[key] for task in tasks]) for key in tasks[0]}
+
+    def get_action(self, obs, task, state, first_timestep=False):
+        '''
+            single env version of get_actions : obs is (32,), task comes from
+            get_expert_task and state from initial_state(1)
+        '''
+        actions, dones, state = self.get_actions(
+            np.asarray(obs)[None], self.stack_tasks([task]), state, first_timestep)
+        return actions[0], dones[0], state
+
+    def get_actions(self, obs, task, state, first_timestep=False):
+        '''
+            obs : (N, 32) state observations
+            returns (actions (N, 5), dones (N,), next state), where dones are
+                the task success flags seen by the expert
+        '''
+        obs = np.asarray(obs)
+        num_envs = len(obs)
+        state = {key: value.copy() for key, value in state.items()}
+        ee_pos = obs[:, EE_POS]
+        ee_yaw = get_ee_yaw(obs[:, EE_QUAT])
+
+        actions = np.zeros((num_envs, 4))
+        dones = np.zeros(num_envs, dtype=bool)
+        for name, task_fn in TASK_FNS.items():
+            mask = task['task'] == name
+            if not mask.any():
+                continue
+            action, done, updates = task_fn(
+                obs[mask], ee_pos[mask], ee_yaw[mask],
+                {key: value[mask] for key, value in task.items()},
+                {key: value[mask] for key, value in state.items()})
+            actions[mask], dones[mask] = action, done
+            for key, value in updates.items():
+                state[key][mask] = value
+
+        if first_timestep:
+            for key in ['trajectory_done', 'gripper_has_been_above',
+                        'gripper_in_right_position', 'gripper_picked_object']:
+                state[key][:] = False
+            state['random_pick_offset'] = np.array([random.uniform(-.04, .04) for _ in range(num_envs)])
+            actions[:] = [0, 0, 1, 0]
+        state['trajectory_done'] |= dones
+
+        ## random gripper motion for the last `gripper_action_num_ts` steps,
+        ## lifting for the 10 steps before that and once the task is done
+        if self.demo_num_ts:
+            offset = self.demo_num_ts - state['timestep']
+        else:
+            offset = np.full(num_envs, 999)
+        num_ts = state['gripper_action_num_ts']
+        random_gripper = offset < num_ts
+        lift = ~random_gripper & (offset < num_ts + 10)
+        state['trajectory_done'] |= lift
+        lift |= ~random_gripper & state['trajectory_done']
+        noisy = ~random_gripper & ~lift
+
+        full_actions = np.zeros((num_envs, 5))
+        full_actions[random_gripper] = state['gripper_action'][random_gripper]
+        full_actions[lift] = LIFT_ACTION
+        if noisy.any():
+            noisy_actions = np.concatenate([actions, state['grip'][:, None]], axis=1)[noisy]
+            full_actions[noisy] = np.random.normal(noisy_actions, self.expert_policy_std)
+
+        full_actions = np.clip(full_actions, a_min=-1, a_max=1)
+        state['timestep'] += 1
+        return full_actions, dones, state
@@ -1,2 +1,5 @@
 from .serialization import *
-from .misc import *
\ No newline at end of file
+from .misc import *
+from .dataset import TrajectoryWriter, TrajectoryReader, save_goal_set, load_goal_set
+from .profiling import Profiler, format_profile
+from .observation_layout import ObservationLayout, drawer_pnp_push_layout
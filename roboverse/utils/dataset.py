@@ -0,0 +1,249 @@
+import json
+import os
+
+import numpy as np
+
+INDEX_FILENAME = 'index.json'
+
+
+def _flatten_trajectory(trajectory, prefix=''):
+    '''
+        yields (name, array) for every column of a trajectory; nested dicts
+        and lists of per-step dicts become 'observations/state_observation'
+    '''
+    for key, value in trajectory.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            yield from _flatten_trajectory(value, name + '/')
+        elif isinstance(value, (list, tuple)) and len(value) > 0 and isinstance(value[0], dict):
+            stacked = {k: np.stack([step[k] for step in value]) for k in value[0]}
+            yield from _flatten_trajectory(stacked, name + '/')
+        else:
+            yield name, np.asarray(value)
+
+
+def _chunk_filename(name, chunk, compressed):
+    extension = 'npz' if compressed else 'npy'
+    return '{}.{:05d}.{}'.format(name.replace('/', '__'), chunk, extension)
+
+
+class TrajectoryWriter:
+    '''
+        Streams trajectories into a directory of chunks holding `chunk_size`
+        trajectories each, so collectors only keep one chunk in memory:
+
+            <path>/index.json
+            <path>/<column>.<chunk>.npy   uncompressed, memory-mappable
+            <path>/<column>.<chunk>.npz   compressed (uint8 image columns)
+
+        Every column must have the same shape in every trajectory. The index
+        is rewritten after each chunk, so partial datasets stay readable.
+    '''
+
+    def __init__(self, path, chunk_size=50, compress_images=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress_images = compress_images
+        self._columns = None
+        self._buffer = {}
+        self._chunks = []
+        os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return sum(self._chunks) + len(next(iter(self._buffer.values()), []))
+
+    def _is_image(self, array):
+        ## large uint8 columns: flat or (H, W, C) images, per step or not
+        return array.dtype == np.uint8 and array.size >= 1024
+
+    def append(self, trajectory):
+        columns = dict(_flatten_trajectory(trajectory))
+        if self._columns is None:
+            self._columns = {
+                name: {
+                    'shape': list(array.shape),
+                    'dtype': array.dtype.str,
+                    'compressed': bool(self.compress_images and self._is_image(array)),
+                } for name, array in columns.items()
+            }
+            self._buffer = {name: [] for name in self._columns}
+        if set(columns) != set(self._columns):
+            raise RuntimeError('Trajectory columns {} do not match {}'.format(
+                sorted(columns), sorted(self._columns)))
+        for name, array in columns.items():
+            if list(array.shape) != self._columns[name]['shape']:
+                raise RuntimeError('Column {} has shape {}, expected {}'.format(
+                    name, array.shape, self._columns[name]['shape']))
+            self._buffer[name].append(array.astype(self._columns[name]['dtype'], copy=False))
+        if len(self._buffer[name]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._columns is None or len(next(iter(self._buffer.values()))) == 0:
+            return
+        chunk = len(self._chunks)
+        num_trajectories = 0
+        for name, arrays in self._buffer.items():
+            data = np.stack(arrays)
+            num_trajectories = len(data)
+            compressed = self._columns[name]['compressed']
+            filename = os.path.join(self.path, _chunk_filename(name, chunk, compressed))
+            if compressed:
+                np.savez_compressed(filename, data=data)
+            else:
+                np.save(filename, data)
+            arrays.clear()
+        self._chunks.append(num_trajectories)
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            'chunk_size': self.chunk_size,
+            'num_trajectories': sum(self._chunks),
+            'chunks': self._chunks,
+            'columns': self._columns,
+        }
+        tmp_filename = os.path.join(self.path, INDEX_FILENAME + '.tmp')
+        with open(tmp_filename, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_filename, os.path.join(self.path, INDEX_FILENAME))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ChunkedColumn:
+    '''
+        Lazy (num_trajectories, *shape) view of one column. Uncompressed
+        chunks are memory-mapped; compressed chunks are decompressed on
+        access, keeping the last one in memory.
+    '''
+
+    def __init__(self, path, name, info, chunks, mmap_mode='r'):
+        self.path = path
+        self.name = name
+        self.shape = (sum(chunks),) + tuple(info['shape'])
+        self.dtype = np.dtype(info['dtype'])
+        self.compressed = info['compressed']
+        self._mmap_mode = mmap_mode
+        self._offsets = np.cumsum([0] + list(chunks))
+        self._cached = (None, None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def get_chunk(self, chunk):
+        if self._cached[0] == chunk:
+            return self._cached[1]
+        filename = os.path.join(self.path, _chunk_filename(self.name, chunk, self.compressed))
+        if self.compressed:
+            with np.load(filename) as f:
+                data = f['data']
+        else:
+            data = np.load(filename, mmap_mode=self._mmap_mode)
+        self._cached = (chunk, data)
+        return data
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError('Index {} out of range for {} trajectories'.format(index, len(self)))
+            chunk = np.searchsorted(self._offsets, index, side='right') - 1
+            return self.get_chunk(chunk)[index - self._offsets[chunk]]
+        indices = np.arange(len(self))[index]
+        if len(indices) == 0:
+            return np.empty((0,) + self.shape[1:], dtype=self.dtype)
+        return np.stack([self[int(i)] for i in indices])
+
+
+class TrajectoryReader:
+    '''
+        Reads a dataset written by TrajectoryWriter without unpickling:
+
+            reader = TrajectoryReader(path)
+            actions = reader['actions'][:100]     # lazy column
+            trajectory = reader.get_trajectory(3)  # dict of arrays
+    '''
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILENAME)) as f:
+            self.index = json.load(f)
+        self.columns = {
+            name: ChunkedColumn(path, name, info, self.index['chunks'], mmap_mode=mmap_mode)
+            for name, info in self.index['columns'].items()
+        }
+
+    def __len__(self):
+        return self.index['num_trajectories']
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def get_trajectory(self, index):
+        return {name: column[index] for name, column in self.columns.items()}
+
+
+GOAL_SET_META_FILENAME = 'meta.json'
+
+
+def _quantize_images(array):
+    '''
+        returns (uint8 array, scale) if `array` holds 8-bit images stored as
+        floats in [0, 255] or [0, 1] (scale 1 or 255), else (None, None)
+    '''
+    for scale in (1., 255.):
+        scaled = np.rint(array * scale)
+        if scaled.min() >= 0 and scaled.max() <= 255 and np.array_equal(scaled / scale, array):
+            return scaled.astype(np.uint8), scale
+    return None, None
+
+
+def save_goal_set(path, goals, scales=None):
+    '''
+        Saves a dict of presampled goal arrays as a directory of .npy files
+        that load_goal_set memory-maps. Float image columns are stored as
+        uint8 along with the scale that restores them exactly. `scales`
+        marks uint8 columns that are already quantized, with the scale that
+        restores their float64 values.
+    '''
+    scales = scales or {}
+    os.makedirs(path, exist_ok=True)
+    meta = {}
+    for key, value in goals.items():
+        value = np.asarray(value)
+        if key in scales:
+            assert value.dtype == np.uint8, key
+            np.save(os.path.join(path, key + '.npy'), value)
+            meta[key] = {'dtype': np.dtype(np.float64).str, 'scale': scales[key]}
+            continue
+        quantized, scale = None, None
+        if 'image' in key and np.issubdtype(value.dtype, np.floating) and value.size > 0:
+            quantized, scale = _quantize_images(value)
+        np.save(os.path.join(path, key + '.npy'), value if quantized is None else quantized)
+        meta[key] = {'dtype': value.dtype.str, 'scale': scale}
+    with open(os.path.join(path, GOAL_SET_META_FILENAME), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_goal_set(path, mmap_mode='r'):
+    '''
+        returns (goals, scales): memory-mapped arrays and, for uint8 image
+        columns, the scale to divide sampled rows by
+    '''
+    with open(os.path.join(path, GOAL_SET_META_FILENAME)) as f:
+        meta = json.load(f)
+    goals = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode=mmap_mode) for key in meta}
+    scales = {key: info['scale'] for key, info in meta.items() if info['scale'] is not None}
+    return goals, scales
@@ -37,8 +37,8 @@ def true_angle_diff(theta):
 
 
 def copysign(a, b):
-    a = np.array(a).repeat(b.shape[0])
-    return np.abs(a) * np.sign(b)
+    ## broadcasts against b, so (N, 1) sines give (N, 1) and not (N, N)
+    return np.abs(np.asarray(a)) * np.sign(b)
 
 
 def quat_to_deg(q):
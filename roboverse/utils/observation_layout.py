@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ObservationLayout:
+    '''
+        Names the slices of a flat state observation:
+
+            layout = ObservationLayout([('hand_pos', 3), ('hand_quat', 4)])
+            obs = layout.empty()
+            obs[layout['hand_pos']] = pos
+            layout.decode(states)['hand_pos']  # (N, 3) view of (N, 7) states
+
+        `aliases` name contiguous runs of fields, e.g. ('goals', 'goal_a',
+        'goal_b'). Slicing never copies, so stored (N, size) state arrays can
+        be decoded in place.
+    '''
+
+    def __init__(self, fields, aliases=(), dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.slices = OrderedDict()
+        start = 0
+        for name, size in fields:
+            self.slices[name] = slice(start, start + size)
+            start += size
+        self.size = start
+        self.fields = list(self.slices)
+        for name, first, last in aliases:
+            self.slices[name] = slice(self.slices[first].start, self.slices[last].stop)
+
+    def __getitem__(self, name):
+        return self.slices[name]
+
+    def __len__(self):
+        return self.size
+
+    def empty(self, batch_shape=()):
+        return np.empty(tuple(batch_shape) + (self.size,), dtype=self.dtype)
+
+    def get(self, states, name):
+        return states[..., self.slices[name]]
+
+    def decode(self, states, names=None):
+        '''
+            name -> view of `states` (..., size); fields only, unless `names`
+            asks for aliases too
+        '''
+        return {name: states[..., self.slices[name]] for name in (names or self.fields)}
+
+
+## 32-dim state observation (and goal) of SawyerRigAffordancesV6 and SawyerDiverseDrawerPnpPush
+drawer_pnp_push_layout = ObservationLayout(
+    [
+        ('hand_pos', 3),
+        ('hand_quat', 4),
+        ('gripper_tips_distance', 1),
+        ('td_handle_pos', 3),
+        ('obj0_pos', 3),
+        ('obj1_pos', 3),
+        ('obj2_pos', 3),
+        ('large_obj_pos', 3),
+        ('on_top_drawer_goal', 3),
+        ('in_drawer_goal', 3),
+        ('out_of_drawer_goal', 3),
+    ],
+    aliases=[
+        ('drawer_goals', 'on_top_drawer_goal', 'out_of_drawer_goal'),
+    ],
+)
@@ -0,0 +1,275 @@
+import json
+import multiprocessing as mp
+import os
+import pickle
+import random
+import shutil
+
+import numpy as np
+
+from roboverse.utils.dataset import save_goal_set
+
+STATS_SUFFIX = '.stats.json'
+UNITS_SUFFIX = '.units'
+
+## the env of the last seed each worker sampled, reused across its units
+_worker_env = {}
+
+
+def unit_seed(seed, index, attempt=0):
+    '''
+        random / np.random seed of one attempt at trajectory `index` of
+        `seed`, independent of which worker runs it and in which order
+    '''
+    return int(np.random.SeedSequence([seed, index, attempt]).generate_state(1)[0])
+
+
+def _get_env(make_env, seed):
+    if _worker_env.get('seed') != seed:
+        if 'env' in _worker_env:
+            _worker_env['env'].close()
+        _worker_env.clear()
+        _worker_env.update(seed=seed, env=make_env(seed))
+    return _worker_env['env']
+
+
+def _run_unit(args):
+    '''
+        retries sample_fn until it returns a valid sample, then checkpoints
+        it; returns (seed, index, attempts)
+    '''
+    make_env, sample_fn, seed, index, unit_path, max_attempts = args
+    env = _get_env(make_env, seed)
+    for attempt in range(max_attempts):
+        random.seed(unit_seed(seed, index, attempt))
+        np.random.seed(unit_seed(seed, index, attempt))
+        sample, valid = sample_fn(env, seed, index)
+        if valid:
+            break
+    else:
+        raise RuntimeError('Trajectory {} of seed {} failed {} attempts'.format(index, seed, max_attempts))
+    tmp_path = '{}.{}.tmp'.format(unit_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(sample, f)
+    os.replace(tmp_path, unit_path)
+    return seed, index, attempt + 1
+
+
+def write_goal_set(path, samples, scales=None):
+    '''
+        stacks the per-trajectory sample dicts into a goal set
+    '''
+    goals = {key: np.stack([sample[key] for sample in samples]) for key in samples[0]}
+    save_goal_set(path, goals, scales)
+
+
+def _render_flat(env):
+    return np.uint8(env.render_obs()).transpose().flatten()
+
+
+def _show_image(env, image):
+    from matplotlib import pyplot as plt
+    print('pos: ', env.get_end_effector_pos(), 'theta: ', env.get_end_effector_theta())
+    plt.figure()
+    plt.imshow(np.reshape(image, [-1, env.obs_img_dim, env.obs_img_dim])[:3].transpose(2, 1, 0))
+    plt.show()
+
+
+def sample_scripted_plan(env, seed, index, max_steps_per_stage, num_subgoals, subgoal_interval,
+                         timeout_k_steps_after_done, mix_timeout_k=False, num_stages=None,
+                         require_valid=True, debug=False):
+    '''
+        rolls the scripted expert through the `num_stages` stages (the
+        test env command sequence by default) of a demo_reset env, keeping
+        a uint8 image every `subgoal_interval` steps as the plan. A stage
+        is valid if its task is done when it times out,
+        `timeout_k_steps_after_done` steps after first being done (cycling
+        through 0..k over trajectories if `mix_timeout_k`).
+    '''
+    if num_stages is None:
+        num_stages = len(env.test_env_command['command_sequence'])
+    if mix_timeout_k:
+        timeout_k = index % (timeout_k_steps_after_done + 1)
+    else:
+        timeout_k = timeout_k_steps_after_done
+
+    valid = True
+    plan_images = []
+    t = 0
+    for stage_i in range(num_stages):
+        env.demo_reset()
+        has_done = False
+        if stage_i == 0:
+            init_image = _render_flat(env)
+            if debug:
+                _show_image(env, init_image)
+
+        timeout = max_steps_per_stage - 1
+        for t_i in range(max_steps_per_stage):
+            action, done = env.get_demo_action(first_timestep=(t_i == 0), return_done=True)
+            obs, reward, _, info = env.step(action)
+            t += 1
+
+            if t % subgoal_interval == 0 and len(plan_images) < num_subgoals - 1:
+                plan_images.append(_render_flat(env))
+                if debug:
+                    _show_image(env, plan_images[-1])
+
+            if done and not has_done:
+                timeout = t_i + timeout_k  # Lift up the gripper.
+                has_done = True
+            if t_i >= timeout:
+                break
+
+        if not has_done or not done:
+            valid = False
+        if not done and has_done:
+            print('Warning: The success condition turned failed after task is done.')
+
+    goal_image = _render_flat(env)
+    if debug:
+        _show_image(env, goal_image)
+    plan_images += [goal_image] * (num_subgoals - len(plan_images))
+
+    sample = {
+        'state_desired_goal': obs['state_achieved_goal'],
+        'image_desired_goal': goal_image,
+        'initial_image_observation': init_image,
+        'image_plan': np.stack(plan_images, 0),
+    }
+    return sample, valid or not require_valid
+
+
+def write_plan_goals(path, samples, latent_dim=720, output_format='npy'):
+    '''
+        writes scripted plans as a goal set of uint8 images (scale 255), or
+        as the float pickle <path>.pkl older consumers load
+    '''
+    num_trajectories = len(samples)
+    goals = {
+        'initial_latent_state': np.zeros((num_trajectories, latent_dim)),
+        'latent_desired_goal': np.zeros((num_trajectories, latent_dim)),
+    }
+    for key in samples[0]:
+        goals[key] = np.stack([sample[key] for sample in samples])
+    scales = {key: 255. for key, value in goals.items() if value.dtype == np.uint8}
+    if output_format == 'npy':
+        save_goal_set(path, goals, scales)
+    else:
+        for key, scale in scales.items():
+            goals[key] = goals[key] / scale
+        with open(path + '.pkl', 'wb') as f:
+            pickle.dump(goals, f)
+
+
+class Presampler:
+    '''
+        Presamples `num_trajectories` per test env seed over a process pool:
+
+            presampler = Presampler(make_env, sample_fn, output_dir, 'goals_seed{}')
+            stats = presampler.run([0, 1, 2], num_trajectories=32, num_workers=8)
+
+        `make_env(seed)` builds the env of a seed, and
+        `sample_fn(env, seed, index)` returns (sample, valid) for trajectory
+        `index`. Invalid samples are retried with a new seed. Both must be
+        picklable (module-level functions or partials of them). A worker
+        keeps the env of its last seed, so sample_fn must leave the env
+        ready for the next trajectory.
+
+        Every finished trajectory is checkpointed under
+        <output_dir>/<name>.units/, so a rerun after a crash only samples
+        the missing ones. Once a seed is complete,
+        `write_fn(path, samples)` writes <output_dir>/<name> (a goal set by
+        default), the attempt counts go to <name>.stats.json and the
+        checkpoints are removed.
+    '''
+
+    def __init__(self, make_env, sample_fn, output_dir, name_format, write_fn=write_goal_set,
+                 max_attempts=100):
+        self.make_env = make_env
+        self.sample_fn = sample_fn
+        self.output_dir = output_dir
+        self.name_format = name_format
+        self.write_fn = write_fn
+        self.max_attempts = max_attempts
+
+    def get_path(self, seed):
+        return os.path.join(self.output_dir, self.name_format.format(seed))
+
+    def _get_unit_path(self, seed, index):
+        return os.path.join(self.get_path(seed) + UNITS_SUFFIX, '{:05d}.pkl'.format(index))
+
+    def is_done(self, seed):
+        return os.path.exists(self.get_path(seed) + STATS_SUFFIX)
+
+    def run(self, seeds, num_trajectories, num_workers=1, start_method=None):
+        '''
+            returns {seed: stats} for every seed, including seeds finished
+            by an earlier run
+        '''
+        units = []
+        for seed in seeds:
+            if self.is_done(seed):
+                continue
+            os.makedirs(self.get_path(seed) + UNITS_SUFFIX, exist_ok=True)
+            units += [(self.make_env, self.sample_fn, seed, index, self._get_unit_path(seed, index),
+                       self.max_attempts)
+                      for index in range(num_trajectories)
+                      if not os.path.exists(self._get_unit_path(seed, index))]
+
+        attempts = {seed: self._load_attempts(seed) for seed in seeds if not self.is_done(seed)}
+        if num_workers == 1:
+            results = map(_run_unit, units)
+        else:
+            pool = mp.get_context(start_method).Pool(num_workers)
+            ## units of a seed are contiguous, so workers rarely rebuild envs
+            results = pool.imap_unordered(_run_unit, units, chunksize=max(1, len(units) // (4 * num_workers)))
+        try:
+            for seed, index, num_attempts in results:
+                attempts[seed][index] = num_attempts
+                self._save_attempts(seed, attempts[seed])
+                if len(attempts[seed]) == num_trajectories:
+                    self._finish(seed, num_trajectories, attempts[seed])
+        finally:
+            if num_workers != 1:
+                pool.close()
+                pool.join()
+
+        for seed in seeds:
+            if not self.is_done(seed):
+                self._finish(seed, num_trajectories, attempts[seed])
+        return {seed: self.load_stats(seed) for seed in seeds}
+
+    def _load_attempts(self, seed):
+        path = os.path.join(self.get_path(seed) + UNITS_SUFFIX, 'attempts.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return {int(index): count for index, count in json.load(f).items()}
+
+    def _save_attempts(self, seed, attempts):
+        path = os.path.join(self.get_path(seed) + UNITS_SUFFIX, 'attempts.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(attempts, f)
+        os.replace(path + '.tmp', path)
+
+    def _finish(self, seed, num_trajectories, attempts):
+        samples = []
+        for index in range(num_trajectories):
+            with open(self._get_unit_path(seed, index), 'rb') as f:
+                samples.append(pickle.load(f))
+        path = self.get_path(seed)
+        self.write_fn(path, samples)
+        counts = [attempts.get(index, 1) for index in range(num_trajectories)]
+        stats = {
+            'num_trajectories': num_trajectories,
+            'attempts': counts,
+            'retry_rate': float(1 - num_trajectories / sum(counts)),
+        }
+        with open(path + STATS_SUFFIX, 'w') as f:
+            json.dump(stats, f, indent=2)
+        shutil.rmtree(path + UNITS_SUFFIX)
+
+    def load_stats(self, seed):
+        with open(self.get_path(seed) + STATS_SUFFIX) as f:
+            return json.load(f)
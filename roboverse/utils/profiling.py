@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _NullPhase:
+    '''
+        shared no-op context manager handed out by a disabled Profiler
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        counter = self.profiler.step_counter
+        self._steps = counter() if counter is not None else 0
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        counter = self.profiler.step_counter
+        steps = counter() - self._steps if counter is not None else 0
+        self.profiler.record(self.name, self._start, end, steps)
+        return False
+
+
+class Profiler:
+    '''
+        Opt-in per-phase timer for env steps and resets:
+
+            with profiler.phase('observation'):
+                ...
+
+        A disabled profiler hands out a shared no-op context manager, so
+        instrumented code costs one method call per phase. `step_counter`
+        is an optional callable returning the number of stepSimulation calls
+        so far; each phase then also reports the simulation steps it took.
+        Phases nest (e.g. 'step' contains 'ik' and 'simulation') and every
+        level is recorded under its own name. With `trace`, the last
+        `max_samples` phases are also kept as Chrome trace events.
+    '''
+
+    def __init__(self, enabled=False, trace=False, step_counter=None, max_samples=100000):
+        self.enabled = enabled
+        self.trace = trace
+        self.step_counter = step_counter
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        self._totals = {}
+        self._counts = {}
+        self._sim_steps = {}
+        self._samples = {}
+        self._events = deque(maxlen=self.max_samples)
+        self._origin = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, start, end, sim_steps=0):
+        duration = end - start
+        if name not in self._totals:
+            self._totals[name] = 0.
+            self._counts[name] = 0
+            self._sim_steps[name] = 0
+            self._samples[name] = deque(maxlen=self.max_samples)
+        self._totals[name] += duration
+        self._counts[name] += 1
+        self._sim_steps[name] += sim_steps
+        self._samples[name].append(duration)
+        if self.trace:
+            self._events.append((name, start, duration, sim_steps))
+
+    def get_profile(self):
+        '''
+            returns {phase: stats} with times in seconds; percentiles are
+            over the last `max_samples` calls of each phase
+        '''
+        profile = {}
+        for name, total in self._totals.items():
+            samples = np.array(self._samples[name])
+            count = self._counts[name]
+            profile[name] = {
+                'total': total,
+                'count': count,
+                'mean': total / count,
+                'p50': float(np.percentile(samples, 50)),
+                'p90': float(np.percentile(samples, 90)),
+                'p99': float(np.percentile(samples, 99)),
+                'max': float(samples.max()),
+            }
+            if self.step_counter is not None:
+                profile[name]['sim_steps'] = self._sim_steps[name]
+                profile[name]['sim_steps_per_call'] = self._sim_steps[name] / count
+        return profile
+
+    def dump_chrome_trace(self, path):
+        '''
+            writes the recorded phases as a Chrome trace (chrome://tracing,
+            Perfetto); requires trace=True
+        '''
+        assert self.trace, 'Profiler was created without trace=True'
+        pid = os.getpid()
+        events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': 0,
+            'args': {'sim_steps': sim_steps},
+        } for name, start, duration, sim_steps in self._events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def format_profile(profile):
+    '''
+        formats the output of Profiler.get_profile as a table sorted by
+        total time
+    '''
+    lines = ['{:<24} {:>8} {:>10} {:>9} {:>9} {:>9} {:>10}'.format(
+        'phase', 'count', 'total s', 'mean ms', 'p50 ms', 'p99 ms', 'sim steps')]
+    for name, stats in sorted(profile.items(), key=lambda item: -item[1]['total']):
+        lines.append('{:<24} {:>8} {:>10.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10}'.format(
+            name, stats['count'], stats['total'], stats['mean'] * 1e3, stats['p50'] * 1e3,
+            stats['p99'] * 1e3, stats.get('sim_steps', '-')))
+    return '\n'.join(lines)
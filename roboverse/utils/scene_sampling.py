@@ -0,0 +1,79 @@
+import numpy as np
+
+## drawer_lightblue_base_longhandle at scale .11: the bottom (base_frame_joint)
+## trails the handle by this much along the pull direction, and sits lower
+drawer_bottom_offset = -.132
+drawer_bottom_z_offset = -.011
+
+
+def yaw_to_direction(yaws):
+    '''
+        (..., 3) unit vectors a drawer with yaws (...,) in degrees slides
+        open along
+    '''
+    yaws = np.asarray(yaws, dtype=float)
+    return np.stack([np.sin(yaws * np.pi / 180), -np.cos(yaws * np.pi / 180), np.zeros_like(yaws)], axis=-1)
+
+
+def drawer_positions(frame_pos, yaws, handle_coeff):
+    '''
+        (frame_pos, bottom_pos, handle_pos) as DrawerHandle.get_positions
+        reads them once the drawer has slid to `handle_coeff`
+        (td_open_coeff / td_close_coeff), without spawning it
+    '''
+    direction = yaw_to_direction(yaws)
+    frame_pos = np.broadcast_to(np.asarray(frame_pos, dtype=float), direction.shape)
+    handle_pos = frame_pos + handle_coeff * direction
+    bottom_pos = frame_pos + (handle_coeff + drawer_bottom_offset) * direction
+    bottom_pos[..., 2] += drawer_bottom_z_offset
+    return frame_pos, bottom_pos, handle_pos
+
+
+def within_bounds(points, bounding_x, bounding_y, margin=0.):
+    '''
+        (...,) mask of the (..., >=2) points inside the xy bounds grown by
+        `margin`
+    '''
+    points = np.asarray(points)
+    return ((bounding_x[0] - margin <= points[..., 0]) & (points[..., 0] <= bounding_x[1] + margin)
+            & (bounding_y[0] - margin <= points[..., 1]) & (points[..., 1] <= bounding_y[1] + margin))
+
+
+def first_valid(candidates, valid):
+    '''
+        the first candidate where the mask `valid` holds, or None
+    '''
+    indices = np.flatnonzero(valid)
+    return candidates[indices[0]] if len(indices) else None
+
+
+def sample_drawer_yaw(frame_pos, bounding_x, bounding_y, handle_coeff, low=0, high=180,
+                      num_candidates=64, max_batches=16):
+    '''
+        a yaw uniform in [low, high) among those that put the handle of the
+        drawer at `frame_pos`, slid to `handle_coeff`, inside the bounds.
+        Candidates are checked `num_candidates` at a time; if no batch has
+        one, the yaw is returned unchecked.
+    '''
+    for _ in range(max_batches):
+        yaws = np.random.uniform(low, high, num_candidates)
+        _, _, handle_pos = drawer_positions(frame_pos, yaws, handle_coeff)
+        yaw = first_valid(yaws, within_bounds(handle_pos, bounding_x, bounding_y))
+        if yaw is not None:
+            return float(yaw)
+    return float(np.random.uniform(low, high))
+
+
+def sample_clear_position(bounding_x, bounding_y, obstacles=(), num_candidates=26):
+    '''
+        (2,) xy uniform in the bounds, at least `distance` from every
+        (xy, distance) in `obstacles`. Draws `num_candidates` at once and
+        falls back to an unchecked position if none is clear.
+    '''
+    low, high = [bounding_x[0], bounding_y[0]], [bounding_x[1], bounding_y[1]]
+    candidates = np.random.uniform(low, high, (num_candidates, 2))
+    clear = np.ones(num_candidates, dtype=bool)
+    for xy, distance in obstacles:
+        clear &= np.linalg.norm(candidates - np.asarray(xy)[:2], axis=1) > distance
+    position = first_valid(candidates, clear)
+    return position if position is not None else np.random.uniform(low, high)
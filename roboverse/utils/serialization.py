@@ -1,5 +1,7 @@
 import os
 import glob
+import json
+import hashlib
 import random
 import numpy as np
 import cv2
@@ -50,3 +52,10 @@ def init_from_demos(demo_path):
         env.load_state(bullet_path)
 
     return init_fn
+
+def hash_config(*configs):
+    '''
+        stable digest of json-like configs, e.g. for naming cached states
+    '''
+    config_str = json.dumps(configs, sort_keys=True, default=str)
+    return hashlib.md5(config_str.encode('utf-8')).hexdigest()
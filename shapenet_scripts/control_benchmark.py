@@ -0,0 +1,61 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import roboverse
+
+
+def benchmark(name, env_kwargs, args):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    env = roboverse.make(args.env, expl=True, reset_interval=1, **env_kwargs).unwrapped
+
+    errors, step_time, successes = [], 0, 0
+    for _ in range(args.num_trajectories):
+        env.demo_reset()
+        done = False
+        for t in range(args.num_timesteps):
+            action, done = env.get_demo_action(first_timestep=(t == 0), return_done=True)
+
+            ## same end-effector target as SawyerRigAffordancesV6.step
+            delta_pos, _, _ = env._format_action(action)
+            target = env.get_end_effector_pos() + delta_pos * env._action_scale
+            target = np.clip(target, env._pos_low, env._pos_high)
+
+            start = time.time()
+            env.step(action)
+            step_time += time.time() - start
+            errors.append(np.linalg.norm(env.get_end_effector_pos() - target))
+        successes += done
+    env.close()
+
+    num_steps = args.num_trajectories * args.num_timesteps
+    print('{:<24} {:7.1f} steps/s | ee error mean {:.4f} p95 {:.4f} | success {}/{}'.format(
+        name, num_steps / step_time, np.mean(errors), np.percentile(errors, 95),
+        successes, args.num_trajectories))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default='SawyerRigAffordances-v6')
+    parser.add_argument("--num_trajectories", type=int, default=10)
+    parser.add_argument("--num_timesteps", type=int, default=75)
+    parser.add_argument("--ik_refine_thresh", type=float, nargs='+', default=[0.01])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    modes = [
+        ('substep_ik', dict(control_mode='substep_ik')),
+        ('action_ik', dict(control_mode='action_ik')),
+    ]
+    for thresh in args.ik_refine_thresh:
+        modes.append(('action_ik_refine_{}'.format(thresh),
+                      dict(control_mode='action_ik', ik_refine_thresh=thresh)))
+
+    for mode in ['clamp', 'native']:
+        modes.append(('substep_ik_{}_limits'.format(mode), dict(joint_limit_mode=mode)))
+
+    for name, env_kwargs in modes:
+        benchmark(name, env_kwargs, args)
@@ -0,0 +1,39 @@
+import os
+import argparse
+import pickle as pkl
+
+import numpy as np
+
+from roboverse.utils import save_goal_set, load_goal_set
+
+
+def nbytes(goals):
+    return sum(np.asarray(v).nbytes for v in goals.values())
+
+
+def convert(input_path, output_dir=None):
+    with open(input_path, 'rb') as f:
+        goals = pkl.load(f)
+
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    output_path = os.path.join(output_dir or os.path.dirname(input_path), name)
+    save_goal_set(output_path, goals)
+
+    ## check that the conversion is lossless
+    converted, scales = load_goal_set(output_path)
+    for key, value in goals.items():
+        restored = converted[key] / scales[key] if key in scales else converted[key]
+        assert np.array_equal(restored, value), key
+
+    print('{} -> {} ({:.1f} MB -> {:.1f} MB)'.format(
+        input_path, output_path, nbytes(goals) / 1e6, nbytes(converted) / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_paths', nargs='+', type=str)
+    parser.add_argument('--output_dir', type=str, default=None)
+    args = parser.parse_args()
+
+    for input_path in args.input_paths:
+        convert(input_path, args.output_dir)
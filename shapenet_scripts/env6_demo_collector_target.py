@@ -11,6 +11,7 @@ import argparse
 from multiprocess import Pool
 import gc
 from roboverse.envs.configs.drawer_pnp_push_env_configs import drawer_pnp_push_env_configs
+from roboverse.utils import TrajectoryWriter, format_profile
 
 
 def collect(id):
@@ -46,6 +47,16 @@ def collect(id):
     num_datasets = 0
     demo_dataset = []
 
+    object_rgbs_id, camera_angle_id = config['object_rgbs']['id'], config['camera_angle']['id']
+    # task_name = task.replace("_", "-")
+    setting_name = f'scene{object_rgbs_id}_view{camera_angle_id}_{task}'  # {task_name}_0'
+
+    if args.output_format == 'chunked':
+        collect_chunked(env, os.path.join(prefix, setting_name), act_dim, imlength)
+        save_profile(env, setting_name)
+        env.close()
+        return
+
     recon_dataset = {
         'observations': np.zeros((args.num_trajectories_per_task_per_setting, args.num_timesteps, imlength),
                                  dtype=np.uint8),
@@ -85,10 +96,6 @@ def collect(id):
         demo_dataset.append(trajectory)
 
     ## Save contents
-    object_rgbs_id, camera_angle_id = config['object_rgbs']['id'], config['camera_angle']['id']
-    # task_name = task.replace("_", "-")
-    setting_name = f'scene{object_rgbs_id}_view{camera_angle_id}_{task}'  # {task_name}_0'
-
     file = open(os.path.join(prefix, f'{setting_name}_demos.pkl'), 'wb')
     pkl.dump(demo_dataset, file)
     file.close()
@@ -101,9 +108,55 @@ def collect(id):
     gc.collect()
     recon_dataset = []
 
+    save_profile(env, setting_name)
     env.close()
 
 
+def save_profile(env, setting_name):
+    if not args.profile:
+        return
+    profile = format_profile(env.get_profile())
+    with open(os.path.join(prefix, f'{setting_name}_profile.txt'), 'w') as f:
+        f.write(profile + '\n')
+    print(setting_name)
+    print(profile)
+
+
+def collect_chunked(env, path, act_dim, imlength):
+    '''
+        streams each trajectory to a chunked store instead of keeping the
+        whole setting in memory; read back with roboverse.utils.TrajectoryReader
+    '''
+    with TrajectoryWriter(path, chunk_size=args.chunk_size) as writer:
+        for j in tqdm(range(args.num_trajectories_per_task_per_setting)):
+            env.demo_reset()
+            trajectory = {
+                'env': np.uint8(env.render_obs().transpose()).flatten(),
+                'images': np.zeros((args.num_timesteps, imlength), dtype=np.uint8),
+                'observations': [],
+                'next_observations': [],
+                'actions': np.zeros((args.num_timesteps, act_dim), dtype=np.float64),
+                'rewards': np.zeros((args.num_timesteps), dtype=np.float64),
+                'terminals': np.zeros((args.num_timesteps), dtype=np.uint8),
+                'skill_id': 0,
+            }
+            for i in range(args.num_timesteps):
+                trajectory['images'][i, :] = np.uint8(env.render_obs()).transpose().flatten()
+
+                observation = env.get_observation()
+
+                action = env.get_demo_action(first_timestep=(i == 0))
+                next_observation, reward, done, info = env.step(action)
+
+                trajectory['observations'].append(observation)
+                trajectory['actions'][i, :] = action
+                trajectory['next_observations'].append(next_observation)
+                trajectory['rewards'][i] = reward
+                trajectory['skill_id'] = info['skill_id']
+
+            writer.append(trajectory)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--save_path", type=str,
@@ -113,6 +166,9 @@ if __name__ == '__main__':
     parser.add_argument("--num_timesteps", type=int, default=75)
     parser.add_argument("--reset_interval", type=int, default=4)
     parser.add_argument("--num_tasks", type=int, default=20)
+    parser.add_argument("--output_format", type=str, default='pkl', choices=['pkl', 'chunked'])
+    parser.add_argument("--chunk_size", type=int, default=50)
+    parser.add_argument("--profile", action='store_true')
 
     args = parser.parse_args()
     prefix = args.save_path
@@ -128,6 +184,7 @@ if __name__ == '__main__':
         'env_obs_img_dim': 196,
         'random_init_gripper_pos': True,
         'random_init_gripper_yaw': False,
+        'profile': args.profile,
     }
 
     # TASKS = ['open_drawer', 'close_drawer', 'move_obj_slide', 'move_obj_pnp']
@@ -3,17 +3,30 @@ import numpy as np
 import pickle as pkl
 from tqdm import tqdm
 from roboverse.utils.renderer import EnvRenderer, InsertImageEnv
-from roboverse.bullet.misc import quat_to_deg
+from roboverse.utils.presampling import Presampler
 import os
-from PIL import Image
-import math
 import argparse
-from multiprocess import Pool
-import gc
+from functools import partial
 
 from rlkit.experimental.kuanfang.envs.drawer_pnp_push_commands import drawer_pnp_push_commands  # NOQA
 
-def collect(id):
+
+def make_env(test_env_seed, num_timesteps, reset_interval):
+    kwargs = {
+        'demo_num_ts': num_timesteps,
+        'reset_interval': reset_interval,
+        'expert_policy_std': .05,
+        'downsample': True,
+        'env_obs_img_dim': 196,
+        'random_init_gripper_pos': True,
+        'random_init_gripper_yaw': False,
+    }
+    if test_env_seed != -1:
+        kwargs.update({
+            'test_env_command': drawer_pnp_push_commands[test_env_seed],
+            'use_test_env_command_sequence': False,
+            'test_env': True,
+        })
     state_env = roboverse.make('SawyerRigAffordances-v6', expl=True, **kwargs)
 
     # FOR TESTING, TURN COLORS OFF
@@ -27,35 +40,38 @@ def collect(id):
             flatten_image=True,)
 
     renderer = EnvRenderer(init_camera=None, **renderer_kwargs)
-    env = InsertImageEnv(state_env, renderer=renderer)
-    imlength = env.obs_img_dim * env.obs_img_dim * 3
+    return InsertImageEnv(state_env, renderer=renderer)
+
 
-    success = 0
-    returns = 0
+def collect(env, test_env_seed, id, num_trajectories_per_demo, num_timesteps):
+    '''
+        one demos_{id}.pkl / images_{id}.npy chunk; the env is reset-free
+        across its trajectories, so a chunk is sampled as one unit
+    '''
+    imlength = env.obs_img_dim * env.obs_img_dim * 3
     act_dim = env.action_space.shape[0]
-    num_datasets = 0
     demo_dataset = []
 
     recon_dataset = {
-        'observations': np.zeros((args.num_trajectories_per_demo, args.num_timesteps, imlength), dtype=np.uint8),
-        'env': np.zeros((args.num_trajectories_per_demo, imlength), dtype=np.uint8),
-        'skill_id': np.zeros((args.num_trajectories_per_demo, ), dtype=np.uint8)
+        'observations': np.zeros((num_trajectories_per_demo, num_timesteps, imlength), dtype=np.uint8),
+        'env': np.zeros((num_trajectories_per_demo, imlength), dtype=np.uint8),
+        'skill_id': np.zeros((num_trajectories_per_demo, ), dtype=np.uint8)
     }
 
-    for j in tqdm(range(args.num_trajectories_per_demo)):
+    for j in tqdm(range(num_trajectories_per_demo)):
         env.demo_reset()
         recon_dataset['env'][j, :] = np.uint8(env.render_obs().transpose()).flatten()
         trajectory = {
             'observations': [],
             'next_observations': [],
-            'actions': np.zeros((args.num_timesteps, act_dim), dtype=np.float),
-            'rewards': np.zeros((args.num_timesteps), dtype=np.float),
-            'terminals': np.zeros((args.num_timesteps), dtype=np.uint8),
-            'agent_infos': np.zeros((args.num_timesteps), dtype=np.uint8),
-            'env_infos': np.zeros((args.num_timesteps), dtype=np.uint8),
+            'actions': np.zeros((num_timesteps, act_dim), dtype=np.float64),
+            'rewards': np.zeros((num_timesteps), dtype=np.float64),
+            'terminals': np.zeros((num_timesteps), dtype=np.uint8),
+            'agent_infos': np.zeros((num_timesteps), dtype=np.uint8),
+            'env_infos': np.zeros((num_timesteps), dtype=np.uint8),
             'skill_id': 0,
         }
-        for i in range(args.num_timesteps):
+        for i in range(num_timesteps):
             img = np.uint8(env.render_obs())
             recon_dataset['observations'][j, i, :] = img.transpose().flatten()
 
@@ -73,21 +89,16 @@ def collect(id):
 
         demo_dataset.append(trajectory)
 
-        if ((j + 1) % args.num_trajectories_per_demo) == 0:
-            file = open(os.path.join(prefix, f'demos_{id}.pkl'), 'wb')
-            pkl.dump(demo_dataset, file)
-            file.close()
+    return (demo_dataset, recon_dataset), True
 
-            del demo_dataset
-            gc.collect()
-            demo_dataset = []
 
-            np.save(os.path.join(prefix, f'images_{id}.npy'), recon_dataset)
-            del recon_dataset
-            gc.collect()
-            recon_dataset = []
+def write_chunks(prefix, chunks):
+    os.makedirs(prefix, exist_ok=True)
+    for id, (demo_dataset, recon_dataset) in enumerate(chunks):
+        with open(os.path.join(prefix, f'demos_{id}.pkl'), 'wb') as file:
+            pkl.dump(demo_dataset, file)
+        np.save(os.path.join(prefix, f'images_{id}.npy'), recon_dataset)
 
-    env.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -100,31 +111,16 @@ if __name__ == '__main__':
     parser.add_argument("--reset_interval", type=int, default=20)
 
     args = parser.parse_args()
-    prefix = os.path.join(args.data_path, f'keyframes_trajectories/evalseed{args.test_env_seed}')
-
-    if not os.path.exists(prefix):
-        os.makedirs(prefix)
-
-    kwargs = {
-        'demo_num_ts': args.num_timesteps,
-        'reset_interval': args.reset_interval,
-        'expert_policy_std': .05,
-        'downsample': True,
-        'env_obs_img_dim': 196,
-        'random_init_gripper_pos': True,
-        'random_init_gripper_yaw': False,
-    }
-    if args.test_env_seed != -1:
-        kwargs.update({
-            'test_env_command': drawer_pnp_push_commands[args.test_env_seed],
-            'use_test_env_command_sequence': False,
-            'test_env': True,
-        })
 
     assert args.num_trajectories % args.num_trajectories_per_demo == 0
 
-    pool = Pool(args.num_threads)
-    ids = [id for id in range(args.num_trajectories // args.num_trajectories_per_demo)]
-    results = pool.map(collect, ids)
-    pool.close()
-    pool.join()
\ No newline at end of file
+    presampler = Presampler(partial(make_env, num_timesteps=args.num_timesteps, reset_interval=args.reset_interval),
+                            partial(collect,
+                                    num_trajectories_per_demo=args.num_trajectories_per_demo,
+                                    num_timesteps=args.num_timesteps),
+                            os.path.join(args.data_path, 'keyframes_trajectories'),
+                            'evalseed{}',
+                            write_fn=write_chunks)
+    presampler.run([args.test_env_seed],
+                   args.num_trajectories // args.num_trajectories_per_demo,
+                   num_workers=args.num_threads)
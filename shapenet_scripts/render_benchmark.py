@@ -0,0 +1,66 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import roboverse
+import roboverse.bullet as bullet
+
+
+def psnr(img, ref):
+    mse = np.mean((img.astype(np.float64) - ref.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255. ** 2 / mse)
+
+
+def render_reference(env, factor):
+    ## high-resolution box-filtered render used as ground truth for all modes
+    size = env.obs_img_dim * factor
+    img = bullet.render_rgb(size, size, env._view_matrix_obs, env._projection_matrix_obs,
+                            shadow=0, physicsClientId=env._uid)
+    return bullet.box_downsample(img, factor)
+
+
+def benchmark(name, env_kwargs, args):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    env = roboverse.make(args.env, obs_img_dim=args.obs_img_dim, **env_kwargs).unwrapped
+
+    psnrs, fps = [], []
+    for _ in range(args.num_scenes):
+        env.reset()
+        img = env.render_obs()
+        psnrs.append(psnr(img, render_reference(env, args.reference_factor)))
+
+        start = time.time()
+        for _ in range(args.num_frames):
+            env.render_obs()
+        fps.append(args.num_frames / (time.time() - start))
+    env.close()
+
+    print('{:<20} render {:>4}px | psnr {:6.2f} dB | {:7.1f} fps'.format(
+        name, env_kwargs.get('env_obs_img_dim', args.obs_img_dim * env_kwargs.get('supersample', 1)),
+        np.mean(psnrs), np.mean(fps)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default='SawyerRigAffordances-v6')
+    parser.add_argument("--obs_img_dim", type=int, default=48)
+    parser.add_argument("--env_obs_img_dim", type=int, default=196)
+    parser.add_argument("--supersample", type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument("--reference_factor", type=int, default=8)
+    parser.add_argument("--num_scenes", type=int, default=3)
+    parser.add_argument("--num_frames", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    modes = [('native', dict())]
+    modes.append(('pil_downsample', dict(downsample=True, env_obs_img_dim=args.env_obs_img_dim)))
+    for factor in args.supersample:
+        modes.append(('supersample_{}x'.format(factor), dict(supersample=factor)))
+
+    for name, env_kwargs in modes:
+        benchmark(name, env_kwargs, args)